@@ -1,36 +1,70 @@
+import threading
+import uuid
 import streamlit as st
+from typing import Any, Dict, Iterator
+from langgraph_flow import graph_nodes, tracing
 from langgraph_flow.graph_pipeline import assemble_graph
-from langgraph.checkpoint.memory import MemorySaver
+from langgraph_flow.session_store import SessionCheckpointer
+from langgraph_flow.state_schema import turn_state
 from langchain_core.messages.ai import AIMessage
 from langchain_core.messages.human import HumanMessage
 
 
+def stream_tokens(
+    graph, state: Dict[str, Any], config: Dict[str, Any], final_state: Dict[str, Any]
+) -> Iterator[str]:
+    stream_config = {
+        **config,
+        "configurable": {**config["configurable"], "stream_tokens": True},
+    }
+    with tracing.turn(config["configurable"]["thread_id"]):
+        for mode, chunk in graph.stream(
+            state, stream_config, stream_mode=["custom", "values"]
+        ):
+            if mode == "custom":
+                yield chunk["token"]
+            else:
+                final_state.clear()
+                final_state.update(chunk)
+
+
+@st.cache_resource
+def get_graph():
+    # compiled once per process instead of on every rerun; one checkpointer
+    # holds every browser session, each under its own thread id, and keeps
+    # only the recent conversation of each
+    return assemble_graph(memory=SessionCheckpointer())
+
+
+@st.cache_resource
+def start_warm_up() -> threading.Thread:
+    # the model and clients load behind the first page render, so neither the
+    # page nor (usually) the first question waits for them
+    thread = threading.Thread(target=graph_nodes.warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
 def run_app():
 
     st.set_page_config(page_title="clinRAG", page_icon="🧪", layout="wide")
+    start_warm_up()
 
-    memory: MemorySaver = MemorySaver()
-
-    if "graph_state" not in st.session_state:
-        st.session_state.graph_state = {
-            "question": None,
-            "memory": [],
-            "metadata": {},
-            "filter": {},
-            "context": [],
-            "response": "",
-            "error": "",
-            "recent_context": "",
-        }
+    # the page keeps its own transcript: the checkpointer only stores the
+    # recent turns the graph needs, and everything else a turn produces
+    if "transcript" not in st.session_state:
+        st.session_state.transcript = []
 
     if "graph_config" not in st.session_state:
-        st.session_state.graph_config = {"configurable": {"thread_id": "demo"}}
+        st.session_state.graph_config = {
+            "configurable": {"thread_id": f"session-{uuid.uuid4().hex}"}
+        }
 
-    graph = assemble_graph(memory=memory)
+    graph = get_graph()
 
     st.title("clinRAG")
 
-    for message in st.session_state.graph_state["memory"]:
+    for message in st.session_state.transcript:
         if isinstance(message, HumanMessage):
             role = "🌻"
             content = message.content
@@ -47,16 +81,35 @@ def run_app():
         with st.chat_message("🌻"):
             st.markdown(prompt)
 
-        st.session_state.graph_state["question"] = prompt
+        with st.chat_message("assistant", avatar="🤖"):
+            final_state = {}
+            streamed = st.write_stream(
+                # history comes from the checkpointer, so only the new
+                # question goes in
+                stream_tokens(
+                    graph,
+                    turn_state(prompt),
+                    st.session_state.graph_config,
+                    final_state,
+                )
+            )
 
-        new_state = graph.invoke(
-            st.session_state.graph_state, st.session_state.graph_config
-        )
-        st.session_state.graph_state = new_state
+            # error replies come from the error node, which streams nothing; a
+            # stream that fails partway ends there too, after some tokens
+            if final_state.get("error"):
+                reply = final_state.get("response") or final_state["error"]
+                st.markdown(reply)
+            elif streamed:
+                reply = final_state.get("response") or streamed
+            else:
+                reply = final_state.get("response", "[ERROR] Could not get response.")
+                st.markdown(reply)
 
-        with st.chat_message("assistant", avatar="🤖"):
-            reply = new_state.get("response", "[ERROR] Could not get response.")
-            st.markdown(reply)
+        # the transcript is what the user saw, error replies included
+        st.session_state.transcript += [
+            HumanMessage(content=prompt),
+            AIMessage(content=reply),
+        ]
 
 
 if __name__ == "__main__":
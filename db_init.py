@@ -1,12 +1,24 @@
 import os
 import json
+import time
+import argparse
+import multiprocessing
 from dotenv import load_dotenv
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from pymongo import ReplaceOne
 from pymongo.database import Database
 from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from preprocessing.chunk_store import (
+    new_run_id,
+    open_embeddings,
+    parse_chunk_line,
+    to_bson_vector,
+)
 
 load_dotenv()
 
@@ -19,24 +31,24 @@ if not os.getenv("COLLECTION_NAME"):
 
 URI: Optional[str] = os.getenv("MONGODB_URI")
 DATA_PATH: str = os.path.join("preprocessing", "trial_data", "trials.jsonl")
+BATCH_SIZE: int = 1000
+VECTOR_FORMAT: str = os.getenv("VECTOR_FORMAT", "float32")
 
 client: MongoClient = MongoClient(URI, server_api=ServerApi("1"))
 db: Database = client[os.getenv("DATABASE_NAME")]
 collec: Collection = db[os.getenv("COLLECTION_NAME")]
 
 
-def load_document(document: Dict[str, Any]) -> None:
-    print("\n== DOCUMENT ==")
-    print("-------------------------------------------------------\n")
-    print(
-        f"[INFO] Inserting document with NCTID {document['source_id']}, Section {document['section']}"
-    )
-
+def prepare_document(
+    document: Dict[str, Any],
+    embeddings: Sequence[float],
+    vector_format: str = VECTOR_FORMAT,
+) -> Optional[Dict[str, Any]]:
     if not isinstance(document.get("metadata"), dict):
         print(
             f"[WARN] Skipping document {document.get('source_id')} due to malformed metadata"
         )
-        return
+        return None
 
     document["metadata"]["startDate"] = parse_date(
         document["metadata"].get("startDate")
@@ -44,9 +56,29 @@ def load_document(document: Dict[str, Any]) -> None:
     document["metadata"]["completionDate"] = parse_date(
         document["metadata"].get("completionDate")
     )
+    document["embeddings"] = to_bson_vector(embeddings, vector_format)
+    return document
 
-    result = collec.insert_one(document)
-    print(f"[INFO] Inserted with _id: {result.inserted_id}")
+
+def load_batch(documents: List[Dict[str, Any]]) -> int:
+    if not documents:
+        return 0
+
+    operations = [
+        ReplaceOne(
+            {"source_id": doc["source_id"], "section": doc["section"]},
+            doc,
+            upsert=True,
+        )
+        for doc in documents
+    ]
+    try:
+        collec.bulk_write(operations, ordered=False)
+        return len(documents)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        print(f"[WARN] {len(errors)} of {len(documents)} writes failed in batch")
+        return len(documents) - len(errors)
 
 
 def parse_date(date_str: Optional[str]) -> Optional[datetime]:
@@ -62,7 +94,127 @@ def parse_date(date_str: Optional[str]) -> Optional[datetime]:
         return None
 
 
+CHUNK_KEY_INDEX = "source_id_1_section_1"
+
+
+def dedupe_chunks() -> int:
+    # collections loaded before upserts were keyed hold one copy of a chunk per
+    # run; keep one of each so the unique index can be built
+    groups = collec.aggregate(
+        [
+            {
+                "$group": {
+                    "_id": {"source_id": "$source_id", "section": "$section"},
+                    "ids": {"$push": "$_id"},
+                    "count": {"$sum": 1},
+                }
+            },
+            {"$match": {"count": {"$gt": 1}}},
+        ],
+        allowDiskUse=True,
+    )
+    removed = 0
+    for group in groups:
+        removed += collec.delete_many({"_id": {"$in": group["ids"][1:]}}).deleted_count
+    return removed
+
+
+def ensure_indexes() -> None:
+    if CHUNK_KEY_INDEX not in collec.index_information():
+        removed = dedupe_chunks()
+        if removed:
+            print(f"[INFO] Removed {removed} duplicate chunks before indexing")
+    collec.create_index(
+        [("source_id", 1), ("section", 1)], unique=True, name=CHUNK_KEY_INDEX
+    )
+
+
+def record_ingest_run(run_id: str, loaded: int) -> None:
+    # the query side compares this against what its answer cache was built on
+    db[f"{collec.name}_meta"].replace_one(
+        {"_id": "ingest"},
+        {"_id": "ingest", "run_id": run_id, "loaded": loaded, "at": datetime.now()},
+        upsert=True,
+    )
+
+
+def shard_ranges(path: str, num_shards: int) -> List[Tuple[int, int]]:
+    size = os.path.getsize(path)
+    step = max(1, -(-size // num_shards))
+    return [(start, min(start + step, size)) for start in range(0, size, step)]
+
+
+def load_shard(
+    path: str, start: int, end: int, batch_size: int, vector_format: str
+) -> Tuple[int, int]:
+    # a line belongs to the shard its first byte falls in
+    loaded, skipped = 0, 0
+    batch: List[Dict[str, Any]] = []
+    embeddings = open_embeddings(path)
+
+    with open(path, "rb") as trial_data:
+        if start > 0:
+            trial_data.seek(start - 1)
+            trial_data.readline()
+
+        while trial_data.tell() < end:
+            line = trial_data.readline()
+            if not line:
+                break
+            try:
+                doc = prepare_document(
+                    *parse_chunk_line(line, embeddings), vector_format
+                )
+            except json.JSONDecodeError as e:
+                print(f"[WARN] Skipping malformed JSON line: {e}")
+                doc = None
+
+            if doc is None:
+                skipped += 1
+                continue
+
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                loaded += load_batch(batch)
+                batch = []
+
+    loaded += load_batch(batch)
+    return loaded, skipped
+
+
+def load_file(
+    path: str, workers: int, batch_size: int, vector_format: str = VECTOR_FORMAT
+) -> Tuple[int, int]:
+    shards = shard_ranges(path, workers)
+    if workers <= 1:
+        results = [
+            load_shard(path, start, end, batch_size, vector_format)
+            for start, end in shards
+        ]
+    else:
+        # spawn so each worker builds its own MongoClient instead of inheriting a forked one
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            futures = [
+                executor.submit(load_shard, path, start, end, batch_size, vector_format)
+                for start, end in shards
+            ]
+            results = [future.result() for future in futures]
+
+    return sum(r[0] for r in results), sum(r[1] for r in results)
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-path", default=DATA_PATH)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument(
+        "--vector-format", choices=["float32", "int8", "array"], default=VECTOR_FORMAT
+    )
+    args = parser.parse_args()
+
     try:
         client.admin.command("ping")
         print("[INFO] Successfully connected to MongoDB")
@@ -71,16 +223,21 @@ if __name__ == "__main__":
         print("[FATAL] Something went wrong during ping:", e)
 
     try:
-        with open(DATA_PATH, "r") as trial_data:
-            for line in trial_data:
-                try:
-                    doc: Dict[str, Any] = json.loads(line)
-                    load_document(doc)
-                except json.JSONDecodeError as e:
-                    print(f"[WARN] Skipping malformed JSON line: {e}")
-
-            print("[INFO] ALL RECORDS INSERTED.")
+        ensure_indexes()
+        start_time = time.perf_counter()
+        loaded, skipped = load_file(
+            args.data_path, args.workers, args.batch_size, args.vector_format
+        )
+        elapsed = time.perf_counter() - start_time
+        run_id = new_run_id()
+        record_ingest_run(run_id, loaded)
+
+        print(f"[INFO] ALL RECORDS UPSERTED. {loaded} loaded, {skipped} skipped.")
+        print(f"[INFO] Ingest run {run_id}")
+        print(
+            f"[INFO] {elapsed:.2f}s with {args.workers} workers ({loaded / max(elapsed, 1e-9):.0f} rows/sec)"
+        )
     except FileNotFoundError:
         print("[ERROR] Output file path not found.")
     except Exception as e:
-        print(f"[FATAL] Unexpected error during data fetch: {e}")
+        print(f"[FATAL] Unexpected error during data load: {e}")
@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.97"))
+ANSWER_CACHE_ITEMS = int(os.getenv("ANSWER_CACHE_ITEMS", "1024"))
+ANSWER_CACHE_RUN_CHECK = float(os.getenv("ANSWER_CACHE_RUN_CHECK", "60"))
+
+
+def filter_key(filter: Dict[str, Any]) -> str:
+    # dates in the filter are datetimes, so fall back to their string form
+    return json.dumps(filter, sort_keys=True, default=str)
+
+
+class AnswerCache:
+    # first-turn answers keyed on (filter, question embedding). A lookup only
+    # compares against questions that assembled exactly the same filter, and
+    # the whole cache is dropped when the ingest run behind the store changes
+    def __init__(
+        self,
+        run_id_fn: Callable[[], Optional[str]],
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        max_items: int = ANSWER_CACHE_ITEMS,
+        run_check_seconds: float = ANSWER_CACHE_RUN_CHECK,
+    ):
+        self.run_id_fn = run_id_fn
+        self.threshold = threshold
+        self.max_items = max_items
+        self.run_check_seconds = run_check_seconds
+        self.entries: OrderedDict[Tuple[str, str], Dict[str, Any]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+        self.run_id: Optional[str] = None
+        self.run_checked = float("-inf")
+
+    def check_run(self) -> None:
+        # the run id lives next to the data, so it is only re-read periodically
+        now = time.monotonic()
+        if now - self.run_checked < self.run_check_seconds:
+            return
+        self.run_checked = now
+
+        run_id = self.run_id_fn()
+        if run_id != self.run_id:
+            if self.entries:
+                self.counters["invalidations"] += 1
+            self.entries.clear()
+            self.run_id = run_id
+
+    def get(
+        self, embedding: Sequence[float], filter: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        key = filter_key(filter)
+
+        with self.lock:
+            self.check_run()
+            candidates = [
+                (entry_key, entry)
+                for entry_key, entry in self.entries.items()
+                if entry_key[0] == key
+            ]
+            if candidates:
+                similarities = np.stack([e["vector"] for _, e in candidates]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    entry_key, entry = candidates[best]
+                    self.entries.move_to_end(entry_key)
+                    self.counters["hits"] += 1
+                    return {**entry, "similarity": float(similarities[best])}
+
+            self.counters["misses"] += 1
+            return None
+
+    def put(
+        self,
+        question: str,
+        embedding: Sequence[float],
+        filter: Dict[str, Any],
+        response: str,
+        context: List[str],
+    ) -> None:
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        entry_key = (filter_key(filter), question.strip().lower())
+
+        # no run check here: a put always follows the get that missed, which
+        # has just checked, and the answer is already waiting on it
+        with self.lock:
+            self.entries[entry_key] = {
+                "vector": vector,
+                "question": question,
+                "response": response,
+                "context": context,
+            }
+            self.entries.move_to_end(entry_key)
+            while len(self.entries) > self.max_items:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+                "items": len(self.entries),
+                "run_id": self.run_id,
+            }
@@ -0,0 +1,155 @@
+import asyncio
+import contextvars
+import os
+import time
+import openai
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+from langchain_core.runnables import RunnableConfig
+from langgraph.config import get_stream_writer
+from langgraph_flow import graph_nodes, retrieval, tracing
+from langgraph_flow.graph_nodes import (
+    logger,
+    local_metadata,
+    metadata_request,
+    llm_metadata,
+    db_filter_assembly,
+    query_embedding,
+    answer_lookup,
+    identifier_lookup,
+    lexical_results,
+    search_limit,
+    fuse_results,
+    search_state_change,
+    trial_request,
+    trial_state_change,
+    chat_request,
+    chat_state_change,
+    error_response,
+)
+from langgraph_flow.state_schema import State
+
+# the same graph as graph_nodes, but nodes await the network instead of blocking
+# a thread on it, so one event loop can carry many conversations at once.
+# Prompts, caches and state updates are shared with the sync nodes
+
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))
+
+# built on first use alongside the sync resources, and only once this module
+# is imported, i.e. when an async graph is assembled. Encoding is CPU bound
+# and already uses every core through torch, so extra embed workers would
+# only contend; questions from concurrent sessions queue there
+graph_nodes.LOADERS.update(
+    {
+        "async_openai_client": openai.AsyncOpenAI,
+        "embedding_executor": lambda: ThreadPoolExecutor(
+            max_workers=EMBED_WORKERS, thread_name_prefix="embed"
+        ),
+    }
+)
+
+
+async def aquery_metadata_extraction(state: State) -> Dict[str, Any]:
+    client: openai.AsyncOpenAI = graph_nodes.shared("async_openai_client")
+    start = time.perf_counter()
+
+    # the rules and the SQLite metadata cache run off the loop; to_thread
+    # carries the node's trace context with it
+    state_change = await asyncio.to_thread(local_metadata, state, start)
+    if state_change is not None:
+        return state_change
+
+    try:
+        response = await client.responses.parse(**metadata_request(state))
+        tracing.record_usage(response)
+        return llm_metadata(state, response.output_parsed, start)
+
+    except Exception as e:
+        state_change = {"metadata": {}, "error": "[ERROR] Metadata extraction failed."}
+        logger.debug(f"[METADATA NODE][ERROR] {e}")
+        return state_change
+
+
+async def adb_filter_assembly(state: State) -> Dict[str, Any]:
+    return db_filter_assembly(state)
+
+
+async def aquery_embedding(state: State) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    # run_in_executor doesn't carry context over the way to_thread does, and
+    # the node's trace span lives in it
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        graph_nodes.shared("embedding_executor"), context.run, query_embedding, state
+    )
+
+
+async def aanswer_lookup(state: State) -> Dict[str, Any]:
+    # the periodic ingest run id check is a blocking round trip
+    return await asyncio.to_thread(answer_lookup, state)
+
+
+async def avector_search(state: State) -> Dict[str, Any]:
+    backend: retrieval.RetrievalBackend = graph_nodes.shared("retrieval_backend")
+
+    try:
+        if not state.get("query_embedding") and identifier_lookup(state):
+            return search_state_change(lexical_results(state))
+        if not state.get("query_embedding"):
+            raise ValueError("Question embedding is missing")
+
+        with tracing.timer("db_s"):
+            results = await backend.asearch(
+                state["query_embedding"], state["filter"], search_limit()
+            )
+        # BM25 scoring over the postings is CPU bound
+        results = await asyncio.to_thread(fuse_results, state, results)
+        if graph_nodes.RETRIEVAL_MODE != "trials":
+            return search_state_change(results)
+
+        bundles, keys = trial_request(results)
+        with tracing.timer("db_s"):
+            fetched = await backend.afetch_sections(keys) if keys else []
+        return trial_state_change(bundles, fetched)
+
+    except Exception as e:
+        state_change = {"context": [], "error": "[ERROR] Vector search failed."}
+        logger.debug(f"[VECTOR SEARCH NODE][ERROR] {e}")
+        return state_change
+
+
+async def achat_response(state: State, config: RunnableConfig) -> Dict[str, Any]:
+    client: openai.AsyncOpenAI = graph_nodes.shared("async_openai_client")
+    # packing tokenizes the whole history and context
+    request = await asyncio.to_thread(chat_request, state)
+
+    try:
+        if config.get("configurable", {}).get("stream_tokens"):
+            writer = get_stream_writer()
+            start, first_token = time.perf_counter(), None
+            async with client.responses.stream(**request) as stream:
+                async for event in stream:
+                    if event.type == "response.output_text.delta":
+                        if first_token is None:
+                            first_token = time.perf_counter() - start
+                            logger.info(f"[CHAT RESPONSE NODE] TTFT {first_token:.3f}s")
+                        writer({"token": event.delta})
+                response = await stream.get_final_response()
+        else:
+            response = await client.responses.parse(**request)
+        tracing.record_usage(response)
+        output_text = response.output_text
+
+        return chat_state_change(state, output_text)
+
+    except Exception as e:
+        state_change = {
+            "response": None,
+            "error": "[ERROR] Failed to get chat response.",
+        }
+        logger.debug(f"[CHAT RESPONSE NODE][ERROR] {e}")
+        return state_change
+
+
+async def aerror_response(state: State) -> Dict[str, Any]:
+    return error_response(state)
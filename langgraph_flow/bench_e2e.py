@@ -0,0 +1,320 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import subprocess
+import tempfile
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+from sentence_transformers import SentenceTransformer
+from langgraph_flow import tracing
+from langgraph_flow.lexical_index import write_lexical_index
+from langgraph_flow.metadata_rules import extract_metadata
+from langgraph_flow.retrieval import append_record, write_local_index
+from preprocessing.chunk_store import embedding_text
+from preprocessing.embedding_cache import EmbeddingCache
+
+# the whole graph with nothing live: OpenAI is a deterministic stub with a
+# fixed latency and retrieval is a local index built from a fixture corpus, so
+# runs on different days (and machines) measure the pipeline, not the network
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "bench_data", "trials.jsonl")
+QUESTIONS = [
+    "What trials are recruiting for breast cancer?",
+    "Are there interventional asthma studies for children?",
+    "Show me completed diabetes trials that started after 2018",
+    "Which trials test immunotherapy in older adults with melanoma?",
+    "Find randomized double-blind trials on migraine prevention",
+    "Tell me about NCT04000005",
+    "Any observational studies on long covid?",
+    "Which studies accept healthy volunteers?",
+    "What exercise or behavioral interventions are being tested?",
+    "List terminated trials and why they stopped",
+]
+FOLLOW_UPS = [
+    "Which of those are randomized?",
+    "What are the eligibility criteria for the first one?",
+]
+METADATA_QUESTION = re.compile(r"User question: (.*)\nReturn only valid JSON\.")
+CONTEXT_IDS = re.compile(r"## Trial (NCT\d{8})")
+
+
+class StubResponses:
+    def __init__(self, metadata_latency: float, chat_latency: float):
+        self.metadata_latency = metadata_latency
+        self.chat_latency = chat_latency
+
+    def respond(self, input: List[Dict[str, str]], text_format=None, **kwargs):
+        # metadata comes from the rule extractor and answers just cite the
+        # packed trials, so every run sees the same outputs
+        prompt = input[-1]["content"]
+        if text_format is not None:
+            question = METADATA_QUESTION.search(prompt).group(1)
+            parsed, _ = extract_metadata(question)
+            output_text = parsed.model_dump_json()
+        else:
+            parsed = None
+            trials = CONTEXT_IDS.findall(prompt)[:3]
+            output_text = (
+                "Relevant trials: "
+                + ", ".join(
+                    f"[{t}](https://clinicaltrials.gov/study/{t})" for t in trials
+                )
+                if trials
+                else "I'm sorry, I don't have enough information to answer that."
+            )
+
+        usage = SimpleNamespace(
+            input_tokens=sum(len(m["content"]) for m in input) // 4,
+            output_tokens=len(output_text) // 4,
+        )
+        return SimpleNamespace(
+            output_parsed=parsed, output_text=output_text, usage=usage
+        )
+
+    def latency(self, text_format) -> float:
+        return self.metadata_latency if text_format is not None else self.chat_latency
+
+    def parse(self, **request):
+        time.sleep(self.latency(request.get("text_format")))
+        return self.respond(**request)
+
+
+class AsyncStubResponses(StubResponses):
+    async def parse(self, **request):
+        await asyncio.sleep(self.latency(request.get("text_format")))
+        return self.respond(**request)
+
+
+def build_fixture_indexes(fixture_path: str, model_name: str, out_path: str) -> int:
+    with open(fixture_path, "r") as infile:
+        chunks = [json.loads(line) for line in infile if line.strip()]
+
+    records: List[Dict[str, str]] = []
+    metadata: Dict[str, List[Any]] = {}
+    for chunk in chunks:
+        append_record(records, metadata, chunk)
+
+    # vectors go through the on-disk embedding cache, so the model is only
+    # loaded here the first time a given model sees the fixture; the fixture
+    # holds stored chunks, so each is embedded the way ingest embedded it
+    def encode(texts: List[str]) -> np.ndarray:
+        return SentenceTransformer(model_name).encode(texts)
+
+    matrix = EmbeddingCache(model_name).encode(
+        [embedding_text(c["text"]) for c in chunks], encode
+    )
+    write_local_index(os.path.join(out_path, "local"), matrix, records, metadata)
+    write_lexical_index(os.path.join(out_path, "lexical"), records, metadata)
+    return len(records)
+
+
+def session_turns(session: int, turns: int) -> List[str]:
+    return [QUESTIONS[session % len(QUESTIONS)]] + FOLLOW_UPS[: turns - 1]
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    values = np.array(values)
+    return {
+        f"p{p}_s": float(np.percentile(values, p)) if len(values) else 0.0
+        for p in (50, 95, 99)
+    }
+
+
+def summarize(
+    label: str, concurrency: int, elapsed: float, traces: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    nodes: Dict[str, List[float]] = {}
+    for trace in traces:
+        for span in trace["nodes"]:
+            nodes.setdefault(span["node"], []).append(span["wall_s"])
+
+    result = {
+        "path": label,
+        "concurrency": concurrency,
+        "turns": len(traces),
+        "turns_per_s": len(traces) / elapsed,
+        "end_to_end": percentiles([trace["wall_s"] for trace in traces]),
+        "nodes": {node: percentiles(walls) for node, walls in sorted(nodes.items())},
+    }
+    e2e = result["end_to_end"]
+    print(
+        f"[INFO] {label} x{concurrency}: {result['turns_per_s']:.2f} turns/s"
+        f" p50 {e2e['p50_s']:.3f}s p95 {e2e['p95_s']:.3f}s p99 {e2e['p99_s']:.3f}s"
+    )
+    for node, stats in result["nodes"].items():
+        print(
+            f"[INFO]   {node:<20} p50 {stats['p50_s']:.4f}s"
+            f" p95 {stats['p95_s']:.4f}s p99 {stats['p99_s']:.4f}s"
+        )
+    return result
+
+
+def run_sync(sessions: int, turns: int, workers: int) -> Dict[str, Any]:
+    from langgraph.checkpoint.memory import MemorySaver
+    from langgraph_flow.graph_pipeline import assemble_graph
+    from langgraph_flow.session_server import turn_state
+
+    graph = assemble_graph(memory=MemorySaver())
+    traces: List[Dict[str, Any]] = []
+
+    def run_session(session: int) -> None:
+        config = {"configurable": {"thread_id": f"sync-{session}"}}
+        for question in session_turns(session, turns):
+            with tracing.turn(config["configurable"]["thread_id"]) as trace:
+                graph.invoke(turn_state(question), config)
+            traces.append(trace)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(run_session, range(sessions)))
+    return summarize("sync", workers, time.perf_counter() - start, traces)
+
+
+async def run_async(sessions: int, turns: int, concurrency: int) -> Dict[str, Any]:
+    from langgraph.checkpoint.memory import MemorySaver
+    from langgraph_flow.session_server import SessionServer
+
+    server = SessionServer(memory=MemorySaver(), max_concurrent_turns=concurrency)
+    traces: List[Dict[str, Any]] = []
+
+    async def run_session(session: int) -> None:
+        for question in session_turns(session, turns):
+            with tracing.turn(f"async-{session}") as trace:
+                await server.ask(f"async-{session}", question)
+            traces.append(trace)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_session(session) for session in range(sessions)))
+    return summarize("async", concurrency, time.perf_counter() - start, traces)
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any]) -> None:
+    # p50/p95 against the last saved run with the same settings
+    before = {(r["path"], r["concurrency"]): r for r in previous["results"]}
+    for result in current["results"]:
+        old = before.get((result["path"], result["concurrency"]))
+        if old is None:
+            continue
+        rows = [("end to end", old["end_to_end"], result["end_to_end"])]
+        rows += [
+            (node, old["nodes"][node], stats)
+            for node, stats in result["nodes"].items()
+            if node in old["nodes"]
+        ]
+        for name, a, b in rows:
+            deltas = [
+                f"{p} {(b[p] - a[p]) * 1000:+.1f}ms ({b[p] / a[p] - 1:+.0%})"
+                for p in ("p50_s", "p95_s")
+                if a[p] > 0
+            ]
+            print(
+                f"[INFO] vs {previous['revision']} {result['path']} x{result['concurrency']}"
+                f" {name}: {', '.join(deltas)}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixture", default=FIXTURE_PATH)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--path", choices=["sync", "async", "both"], default="both")
+    parser.add_argument(
+        "--metadata-latency", type=float, default=0.4, help="stub seconds per call"
+    )
+    parser.add_argument(
+        "--chat-latency", type=float, default=1.5, help="stub seconds per call"
+    )
+    parser.add_argument(
+        "--out", default="bench_e2e.json", help="results are appended per run"
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+    model_name = os.getenv("EMBEDDING_MODEL")
+    if not model_name:
+        raise EnvironmentError("[ERROR] EMBEDDING_MODEL must be set")
+
+    with tempfile.TemporaryDirectory() as index_path:
+        # graph_nodes only checks its settings at import; clients, models and
+        # indexes are built by shared() on the first turn unless a module
+        # attribute already holds them. So the stubs below replace the live
+        # clients outright, and a bad setting fails here before the fixture
+        # is encoded
+        os.environ["RETRIEVAL_BACKEND"] = "local"
+        os.environ["LOCAL_INDEX_PATH"] = os.path.join(index_path, "local")
+        os.environ["LEXICAL_INDEX_PATH"] = os.path.join(index_path, "lexical")
+        os.environ.setdefault("OPENAI_API_KEY", "offline")
+        from langgraph_flow import graph_nodes
+        from langgraph_flow.metadata_cache import MetadataCache
+
+        graph_nodes.openai_client = SimpleNamespace(
+            responses=StubResponses(args.metadata_latency, args.chat_latency)
+        )
+        graph_nodes.async_openai_client = SimpleNamespace(
+            responses=AsyncStubResponses(args.metadata_latency, args.chat_latency)
+        )
+        # caches off so every turn does the full work
+        graph_nodes.ANSWER_CACHE = False
+        graph_nodes.metadata_cache = MetadataCache(path=None, memory_items=0)
+        graph_nodes.embedding_cache = EmbeddingCache(
+            model_name, path=None, memory_items=0
+        )
+
+        count = build_fixture_indexes(args.fixture, model_name, index_path)
+        print(f"[INFO] Fixture indexes built with {count} chunks")
+
+        # per-node timings come from the tracing wrappers
+        tracing.TRACING = True
+        tracing.TRACE_PATH = f"{os.path.splitext(args.out)[0]}.traces.jsonl"
+
+        results = []
+        for concurrency in args.concurrency:
+            if args.path in ("sync", "both"):
+                results.append(run_sync(args.sessions, args.turns, concurrency))
+            if args.path in ("async", "both"):
+                results.append(
+                    asyncio.run(run_async(args.sessions, args.turns, concurrency))
+                )
+
+    run = {
+        "revision": git_revision(),
+        "at": datetime.now(timezone.utc).isoformat(),
+        "settings": {
+            key: vars(args)[key]
+            for key in ("sessions", "turns", "metadata_latency", "chat_latency")
+        },
+        "results": results,
+    }
+
+    history: List[Dict[str, Any]] = []
+    if os.path.exists(args.out):
+        with open(args.out, "r") as infile:
+            history = json.load(infile)
+    previous = [r for r in history if r["settings"] == run["settings"]]
+    if previous:
+        compare(previous[-1], run)
+
+    with open(args.out, "w") as outfile:
+        json.dump(history + [run], outfile, indent=2)
+    print(f"[INFO] Results appended to {os.path.abspath(args.out)}")
@@ -0,0 +1,130 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+from typing import Any, Dict, List
+from dotenv import load_dotenv
+from langgraph_flow.retrieval import read_chunks
+from preprocessing.projection import fit_projection
+
+# recall of the projected index against the full-dimension one on our own
+# corpus: the top-k of each question over full vectors is the truth, and every
+# reduced dimension is scored on how much of it it finds
+
+DATA_PATH = os.path.join("preprocessing", "trial_data", "trials.jsonl")
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def top_k(queries: np.ndarray, corpus: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-(normalize(queries) @ corpus.T), axis=1)[:, :k]
+
+
+def encode_questions(model_name: str, texts: List[str], limit: int, seed: int):
+    # real question vectors; chunk openings stand in for the long tail
+    from langgraph_flow.bench_e2e import QUESTIONS
+    from langgraph_flow.query_encoder import load_query_encoder
+
+    rng = np.random.default_rng(seed)
+    questions = QUESTIONS + [
+        " ".join(texts[i].split()[:16])
+        for i in rng.choice(len(texts), min(limit, len(texts)), replace=False)
+    ]
+    return load_query_encoder(model_name).encode(questions)
+
+
+def evaluate(
+    matrix: np.ndarray,
+    queries: np.ndarray,
+    dims: List[int],
+    k: int,
+    model_name: str,
+    save_dir: str = "",
+) -> List[Dict[str, Any]]:
+    full = normalize(matrix)
+    truth = top_k(queries, full, k)
+    results = []
+
+    for dim in dims:
+        if dim >= matrix.shape[1]:
+            corpus, projected, explained = full, queries, 1.0
+        else:
+            projection = fit_projection(matrix, dim, model_name)
+            corpus = normalize(projection.apply(matrix))
+            projected = projection.apply(queries)
+            explained = float(projection.explained.sum())
+            if save_dir:
+                projection.save(os.path.join(save_dir, f"projection_{dim}.npz"))
+
+        start = time.perf_counter()
+        found = top_k(projected, corpus, k)
+        scan_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+        results.append(
+            {
+                "dim": min(dim, matrix.shape[1]),
+                "recall": float(recall),
+                "explained_variance": explained,
+                "bytes_per_vector": corpus.shape[1] * 4,
+                "scan_ms_per_query": scan_ms,
+            }
+        )
+        print(
+            f"[INFO] dim={results[-1]['dim']} recall@{k}={recall:.3f}"
+            f" variance={explained:.1%} {scan_ms:.2f}ms/query"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-path", default=DATA_PATH)
+    parser.add_argument("--dims", type=int, nargs="+", default=[1024, 512, 256, 128])
+    parser.add_argument("--k", type=int, default=15)
+    parser.add_argument(
+        "--queries",
+        choices=["questions", "chunks"],
+        default="questions",
+        help="encode questions with the model, or perturb stored chunk vectors",
+    )
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--save-dir", default="", help="also keep the fitted projection artifacts"
+    )
+    parser.add_argument("--out", default="bench_projection.json")
+    args = parser.parse_args()
+
+    load_dotenv()
+    model_name = os.getenv("EMBEDDING_MODEL", "")
+    matrix, records, _ = read_chunks(args.data_path)
+    print(f"[INFO] {len(matrix)} chunks of {matrix.shape[1]} dims")
+
+    if args.queries == "questions":
+        queries = encode_questions(
+            model_name, [r["text"] for r in records], args.limit, args.seed
+        )
+    else:
+        # like bench_retrieval: questions that land near real chunks
+        rng = np.random.default_rng(args.seed)
+        picks = rng.choice(len(matrix), min(args.limit, len(matrix)), replace=False)
+        scale = 0.3 * np.linalg.norm(matrix[picks], axis=1, keepdims=True)
+        noise = normalize(rng.normal(size=(len(picks), matrix.shape[1])))
+        queries = matrix[picks] + scale * noise
+
+    report = {
+        "data_path": args.data_path,
+        "chunks": len(matrix),
+        "queries": args.queries,
+        "k": args.k,
+        "results": evaluate(
+            matrix, queries, args.dims, args.k, model_name, args.save_dir
+        ),
+    }
+    with open(args.out, "w") as outfile:
+        json.dump(report, outfile, indent=2)
+    print(f"[INFO] Results written to {os.path.abspath(args.out)}")
@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+from typing import Any, Dict, List, Tuple
+from dotenv import load_dotenv
+from langgraph_flow.bench_e2e import QUESTIONS
+from langgraph_flow.query_encoder import load_query_encoder
+from langgraph_flow.retrieval import read_chunks
+from preprocessing.chunk_store import embedding_text, from_bson_vector
+
+# the int8 query encoder against the fp32 vectors already in the store:
+# fidelity is cosine agreement with the stored chunk vectors and top-k
+# overlap with fp32 questions searched over them; latency is one question per
+# encode, the way vector_search calls it
+
+DATA_PATH = os.path.join("preprocessing", "trial_data", "trials.jsonl")
+
+
+def sample_collection(limit: int) -> Tuple[np.ndarray, List[str]]:
+    from pymongo import MongoClient
+
+    collection = MongoClient(os.getenv("MONGODB_URI"))[os.getenv("DATABASE_NAME")][
+        os.getenv("COLLECTION_NAME")
+    ]
+    documents = list(
+        collection.aggregate(
+            [
+                {"$sample": {"size": limit}},
+                {"$project": {"_id": 0, "text": 1, "embeddings": 1}},
+            ]
+        )
+    )
+    matrix = np.stack([from_bson_vector(d["embeddings"]) for d in documents])
+    return matrix, [embedding_text(d["text"]) for d in documents]
+
+
+def sample_file(data_path: str, limit: int, seed: int) -> Tuple[np.ndarray, List[str]]:
+    matrix, records, _ = read_chunks(data_path)
+    rows = np.random.default_rng(seed).permutation(len(records))[:limit]
+    return matrix[rows], [embedding_text(records[row]["text"]) for row in rows]
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def top_k(queries: np.ndarray, corpus: np.ndarray, k: int) -> np.ndarray:
+    scores = normalize(queries) @ corpus.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def cosine_agreement(
+    model: Any, corpus: np.ndarray, texts: List[str]
+) -> Dict[str, float]:
+    # re-encoding a stored chunk should land on its stored vector
+    agreement = np.sum(normalize(model.encode(texts)) * corpus, axis=1)
+    return {
+        "mean": float(agreement.mean()),
+        "p5": float(np.percentile(agreement, 5)),
+        "min": float(agreement.min()),
+    }
+
+
+def overlap(found: np.ndarray, truth: np.ndarray) -> float:
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def latency(model: Any, questions: List[str], repeat: int) -> Dict[str, float]:
+    model.encode(questions[:1])
+    timings = []
+    for _ in range(repeat):
+        for question in questions:
+            start = time.perf_counter()
+            model.encode([question])
+            timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--source",
+        choices=["collection", "file"],
+        default="collection",
+        help="stored fp32 vectors from the mongo collection or a trials.jsonl",
+    )
+    parser.add_argument("--data-path", default=DATA_PATH)
+    parser.add_argument("--limit", type=int, default=2000)
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 15])
+    parser.add_argument(
+        "--chunk-questions",
+        type=int,
+        default=100,
+        help="extra questions made from the opening words of sampled chunks",
+    )
+    parser.add_argument("--threads", type=int, nargs="+", default=[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_query_encoder.json")
+    args = parser.parse_args()
+
+    load_dotenv()
+    model_name = os.getenv("EMBEDDING_MODEL")
+    if not model_name:
+        raise EnvironmentError("[ERROR] EMBEDDING_MODEL must be set")
+
+    if args.source == "collection":
+        stored, texts = sample_collection(args.limit)
+    else:
+        stored, texts = sample_file(args.data_path, args.limit, args.seed)
+    rng = np.random.default_rng(args.seed)
+    questions = QUESTIONS + [
+        " ".join(texts[i].split()[:16])
+        for i in rng.choice(len(texts), min(args.chunk_questions, len(texts)), False)
+    ]
+    print(f"[INFO] {len(texts)} stored vectors, {len(questions)} questions")
+
+    report: Dict[str, Any] = {
+        "model": model_name,
+        "source": args.source,
+        "chunks": len(texts),
+        "questions": len(questions),
+        "results": [],
+    }
+    corpus = normalize(stored)
+    truth: Dict[int, np.ndarray] = {}
+
+    for backend in ("fp32", "int8"):
+        for threads in args.threads:
+            # quantization happens in place, so every setting loads a fresh model
+            model = load_query_encoder(model_name, backend, threads)
+            result: Dict[str, Any] = {
+                "backend": backend,
+                "threads": threads,
+                "latency": latency(model, questions, args.repeat),
+            }
+            label = f"{backend} threads={threads or 'default'}"
+            print(
+                f"[INFO] {label}: p50 {result['latency']['p50_ms']:.1f}ms"
+                f" p95 {result['latency']['p95_ms']:.1f}ms"
+            )
+
+            # vectors don't depend on the thread count, so fidelity runs once
+            if threads == args.threads[0]:
+                result["cosine_vs_stored"] = cosine_agreement(model, corpus, texts)
+                encoded = model.encode(questions)
+                for k in args.k:
+                    truth.setdefault(k, top_k(encoded, corpus, k))
+                result["top_k_overlap_vs_fp32"] = {
+                    str(k): overlap(top_k(encoded, corpus, k), truth[k]) for k in args.k
+                }
+                print(
+                    f"[INFO] {label}: cosine vs stored mean"
+                    f" {result['cosine_vs_stored']['mean']:.4f}"
+                    f" min {result['cosine_vs_stored']['min']:.4f},"
+                    f" top-k overlap vs fp32 {result['top_k_overlap_vs_fp32']}"
+                )
+            report["results"].append(result)
+
+    with open(args.out, "w") as outfile:
+        json.dump(report, outfile, indent=2)
+    print(f"[INFO] Results written to {os.path.abspath(args.out)}")
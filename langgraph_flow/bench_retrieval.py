@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from typing import Any, Dict, List, Tuple
+from langgraph_flow.retrieval import (
+    LocalVectorSearch,
+    RetrievalBackend,
+    read_chunks,
+    write_local_index,
+)
+
+STATUSES = ["RECRUITING", "COMPLETED", "TERMINATED", "ACTIVE_NOT_RECRUITING"]
+
+
+def synthetic_corpus(
+    size: int, dim: int, seed: int = 0
+) -> Tuple[np.ndarray, List[Dict[str, str]], Dict[str, List[Any]]]:
+    # clustered vectors so the IVF lists have real structure to find
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(8, size // 500), dim)).astype(np.float32)
+    matrix = centers[rng.integers(len(centers), size=size)]
+    matrix += 0.6 * rng.normal(size=(size, dim)).astype(np.float32)
+
+    records = [
+        {"source_id": f"NCT{i // 7:08d}", "section": str(i % 7), "text": ""}
+        for i in range(size)
+    ]
+    metadata = {
+        "status": [STATUSES[i] for i in rng.integers(len(STATUSES), size=size)],
+        "startDate": [f"{y}-01" for y in rng.integers(2000, 2025, size=size)],
+    }
+    return matrix, records, metadata
+
+
+def run_queries(
+    backend: RetrievalBackend,
+    queries: np.ndarray,
+    filter: Dict[str, Any],
+    k: int,
+) -> Tuple[List[set], np.ndarray]:
+    hits, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results = backend.search(query, filter, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits.append({(r["source_id"], r["section"]) for r in results})
+    return hits, np.array(latencies)
+
+
+def benchmark_corpus(
+    index_path: str,
+    queries: np.ndarray,
+    filters: Dict[str, Dict[str, Any]],
+    k: int,
+    candidate_grid: List[int],
+) -> List[Dict[str, Any]]:
+    exact = LocalVectorSearch(index_path)
+    results = []
+
+    for filter_name, filter in filters.items():
+        truth, exact_ms = run_queries(exact, queries, filter, k)
+        results.append(
+            {
+                "mode": "exact",
+                "filter": filter_name,
+                "recall": 1.0,
+                "p50_ms": float(np.percentile(exact_ms, 50)),
+                "p95_ms": float(np.percentile(exact_ms, 95)),
+            }
+        )
+
+        for num_candidates in candidate_grid:
+            approx = LocalVectorSearch(
+                index_path, exact=False, num_candidates=num_candidates
+            )
+            found, approx_ms = run_queries(approx, queries, filter, k)
+            recall = np.mean(
+                [len(f & t) / len(t) for f, t in zip(found, truth) if t] or [1.0]
+            )
+            results.append(
+                {
+                    "mode": "ivf",
+                    "numCandidates": num_candidates,
+                    "filter": filter_name,
+                    "recall": float(recall),
+                    "p50_ms": float(np.percentile(approx_ms, 50)),
+                    "p95_ms": float(np.percentile(approx_ms, 95)),
+                }
+            )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument(
+        "--data-path", help="benchmark a real trials.jsonl instead of synthetic data"
+    )
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=15)
+    parser.add_argument(
+        "--num-candidates", type=int, nargs="+", default=[50, 150, 500, 1500]
+    )
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--out", default="bench_retrieval.json")
+    args = parser.parse_args()
+
+    if args.data_path:
+        corpora = [read_chunks(args.data_path)]
+    else:
+        corpora = [synthetic_corpus(size, args.dim) for size in args.sizes]
+
+    filters = {
+        "none": {},
+        "status": {"metadata.status": {"$in": ["RECRUITING", "COMPLETED"]}},
+    }
+    rng = np.random.default_rng(1)
+    report = []
+
+    for matrix, records, metadata in corpora:
+        # queries are perturbed corpus vectors, like questions near real chunks
+        picks = rng.choice(len(matrix), min(args.queries, len(matrix)), replace=False)
+        queries = matrix[picks] + 0.3 * rng.normal(size=(len(picks), matrix.shape[1]))
+
+        with tempfile.TemporaryDirectory() as index_path:
+            start = time.perf_counter()
+            write_local_index(
+                index_path,
+                matrix,
+                records,
+                metadata,
+                args.dtype,
+                ivf_lists=int(np.sqrt(len(matrix))),
+            )
+            build_s = time.perf_counter() - start
+
+            for row in benchmark_corpus(
+                index_path, queries, filters, args.k, args.num_candidates
+            ):
+                row.update(size=len(matrix), build_s=build_s)
+                report.append(row)
+                print(
+                    f"[INFO] size={row['size']} mode={row['mode']}"
+                    f" numCandidates={row.get('numCandidates', '-')} filter={row['filter']}"
+                    f" recall@{args.k}={row['recall']:.3f}"
+                    f" p50={row['p50_ms']:.2f}ms p95={row['p95_ms']:.2f}ms"
+                )
+
+    with open(args.out, "w") as outfile:
+        json.dump(report, outfile, indent=2)
+    print(f"[INFO] Results written to {os.path.abspath(args.out)}")
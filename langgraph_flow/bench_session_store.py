@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from typing import Any, Dict
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, StateGraph
+from langgraph_flow.session_store import SessionCheckpointer
+from langgraph_flow.state_schema import State, turn_state
+
+# the checkpointer on its own: a two-node graph with the app's state schema
+# writes what a real turn writes (15 retrieved chunks, a 1024-d question
+# vector, a question and an answer) with no model or database behind it, so
+# heap growth and per-turn overhead come from the checkpointer alone
+
+CHUNK_CHARS = 1200
+ANSWER_CHARS = 800
+
+
+def retrieve(state: State) -> Dict[str, Any]:
+    return {
+        "context": [
+            f"{state['question']} {i} ".ljust(CHUNK_CHARS, "x") for i in range(15)
+        ],
+        "query_embedding": [0.01] * 1024,
+    }
+
+
+def answer(state: State) -> Dict[str, Any]:
+    reply = "".ljust(ANSWER_CHARS, "y")
+    return {
+        "response": reply,
+        "memory": [HumanMessage(content=state["question"]), AIMessage(content=reply)],
+    }
+
+
+def build_graph(memory: BaseCheckpointSaver):
+    builder = StateGraph(state_schema=State)
+    builder.add_node("retrieve", retrieve)
+    builder.add_node("answer", answer)
+    builder.add_edge(START, "retrieve")
+    builder.add_edge("retrieve", "answer")
+    builder.add_edge("answer", END)
+    return builder.compile(checkpointer=memory)
+
+
+def run(
+    label: str, memory: BaseCheckpointSaver, sessions: int, turns: int
+) -> Dict[str, Any]:
+    graph = build_graph(memory)
+    timings = []
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    # sessions take turns round-robin, like users interleaving on one server
+    for turn in range(turns):
+        for session in range(sessions):
+            config = {"configurable": {"thread_id": f"session-{session}"}}
+            start = time.perf_counter()
+            graph.invoke(turn_state(f"question {turn}"), config)
+            timings.append((time.perf_counter() - start) * 1000)
+
+    heap_mb = (tracemalloc.get_traced_memory()[0] - baseline) / 1024**2
+    tracemalloc.stop()
+
+    config = {"configurable": {"thread_id": f"session-{sessions - 1}"}}
+    start = time.perf_counter()
+    for _ in range(100):
+        memory.get_tuple(config)
+    lookup_ms = (time.perf_counter() - start) * 10
+
+    result = {
+        "checkpointer": label,
+        "sessions": sessions,
+        "turns": turns,
+        "heap_mb": heap_mb,
+        "turn_p50_ms": float(np.percentile(timings, 50)),
+        "turn_p95_ms": float(np.percentile(timings, 95)),
+        "lookup_ms": lookup_ms,
+        "stored_messages": len(graph.get_state(config).values["memory"]),
+    }
+    print(
+        f"[INFO] {label}: heap +{heap_mb:.1f} MiB, turn p50 {result['turn_p50_ms']:.2f}ms"
+        f" p95 {result['turn_p95_ms']:.2f}ms, lookup {lookup_ms:.3f}ms,"
+        f" {result['stored_messages']} messages kept"
+    )
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--max-messages", type=int, default=20)
+    parser.add_argument("--out", default="bench_session_store.json")
+    args = parser.parse_args()
+
+    report = []
+    for sessions in args.sessions:
+        report.append(run("memory", MemorySaver(), sessions, args.turns))
+        with tempfile.TemporaryDirectory() as store_dir:
+            path = os.path.join(store_dir, "sessions.sqlite")
+            store = SessionCheckpointer(path, max_messages=args.max_messages)
+            result = run("sqlite", store, sessions, args.turns)
+            result["disk_mb"] = (
+                sum(
+                    os.path.getsize(f"{path}{suffix}")
+                    for suffix in ("", "-wal")
+                    if os.path.exists(f"{path}{suffix}")
+                )
+                / 1024**2
+            )
+            result["store"] = store.stats()
+            report.append(result)
+
+    with open(args.out, "w") as outfile:
+        json.dump(report, outfile, indent=2)
+    print(f"[INFO] Results written to {os.path.abspath(args.out)}")
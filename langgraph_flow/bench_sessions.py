@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph_flow import graph_nodes
+from langgraph_flow.bench_turn_latency import QUESTIONS
+from langgraph_flow.graph_pipeline import assemble_graph
+from langgraph_flow.metadata_cache import MetadataCache
+from langgraph_flow.session_server import SessionServer, turn_state
+from preprocessing.embedding_cache import EmbeddingCache
+
+FOLLOW_UPS = [
+    "Which of those are randomized?",
+    "Tell me more about the first one",
+]
+
+
+def session_turns(session: int, turns: int) -> List[str]:
+    return [QUESTIONS[session % len(QUESTIONS)]] + FOLLOW_UPS[: turns - 1]
+
+
+def summarize(label: str, elapsed: float, turn_latencies: List[float], sessions: int):
+    latencies = np.array(turn_latencies)
+    result = {
+        "path": label,
+        "sessions": sessions,
+        "elapsed_s": elapsed,
+        "sessions_per_s": sessions / elapsed,
+        "turn_p50_s": float(np.percentile(latencies, 50)),
+        "turn_p95_s": float(np.percentile(latencies, 95)),
+    }
+    print(
+        f"[INFO] {label}: {result['sessions_per_s']:.2f} sessions/s"
+        f" turn p50 {result['turn_p50_s']:.3f}s p95 {result['turn_p95_s']:.3f}s"
+    )
+    return result
+
+
+def run_sync(sessions: int, turns: int, workers: int) -> Dict[str, Any]:
+    # the blocking graph can only overlap sessions by giving each its own thread
+    graph = assemble_graph(memory=MemorySaver())
+    latencies: List[float] = []
+
+    def run_session(session: int) -> None:
+        config = {"configurable": {"thread_id": f"sync-{session}"}}
+        for question in session_turns(session, turns):
+            start = time.perf_counter()
+            graph.invoke(turn_state(question), config)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(run_session, range(sessions)))
+    return summarize(
+        f"sync x{workers} threads", time.perf_counter() - start, latencies, sessions
+    )
+
+
+async def run_async(sessions: int, turns: int, concurrency: int) -> Dict[str, Any]:
+    server = SessionServer(memory=MemorySaver(), max_concurrent_turns=concurrency)
+    latencies: List[float] = []
+
+    async def run_session(session: int) -> None:
+        for question in session_turns(session, turns):
+            start = time.perf_counter()
+            await server.ask(f"async-{session}", question)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_session(session) for session in range(sessions)))
+    return summarize(
+        f"async x{concurrency} turns", time.perf_counter() - start, latencies, sessions
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=32)
+    parser.add_argument("--turns", type=int, default=2)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[1, 8],
+        help="thread counts for the sync path",
+    )
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--out", default="bench_sessions.json")
+    args = parser.parse_args()
+
+    # caches off so every session does the same work on both paths
+    graph_nodes.ANSWER_CACHE = False
+    graph_nodes.metadata_cache = MetadataCache(path=None, memory_items=0)
+    graph_nodes.embedding_cache = EmbeddingCache(
+        graph_nodes.EMBEDDING_MODEL, path=None, memory_items=0
+    )
+
+    report = [run_sync(args.sessions, args.turns, w) for w in args.workers]
+    report.append(asyncio.run(run_async(args.sessions, args.turns, args.concurrency)))
+
+    with open(args.out, "w") as outfile:
+        json.dump(report, outfile, indent=2)
+    print(f"[INFO] Results written to {os.path.abspath(args.out)}")
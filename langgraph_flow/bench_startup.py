@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+
+# cold start is measured in fresh interpreters, one per run. "eager" is what
+# the app used to do before its first render (import, then load everything);
+# "lazy" is what it does now (import only, warm-up runs in the background)
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+from langgraph_flow import graph_nodes
+from langgraph_flow.graph_pipeline import assemble_graph
+from langgraph.checkpoint.memory import MemorySaver
+imported = time.perf_counter() - start
+warm = graph_nodes.warm_up()
+assembled = []
+for _ in range({reruns}):
+    start = time.perf_counter()
+    assemble_graph(memory=MemorySaver())
+    assembled.append(time.perf_counter() - start)
+print(json.dumps({{"import_s": imported, "warm_up_s": warm, "assemble_s": assembled}}))
+"""
+
+
+def probe(reruns: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(reruns=reruns)],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--out", default="bench_startup.json")
+    args = parser.parse_args()
+
+    samples = [probe(args.reruns) for _ in range(args.runs)]
+    imported = np.array([s["import_s"] for s in samples])
+    warm = np.array([s["warm_up_s"] for s in samples])
+    assemble = np.array([t for s in samples for t in s["assemble_s"]])
+
+    # a rerun used to rebuild the checkpointer and recompile the graph; now it
+    # is a st.cache_resource lookup
+    report = {
+        "runs": args.runs,
+        "import_s": float(np.median(imported)),
+        "warm_up_s": float(np.median(warm)),
+        "cold_start_eager_s": float(np.median(imported + warm)),
+        "cold_start_lazy_s": float(np.median(imported)),
+        "rerun_recompile_s": float(np.median(assemble)),
+    }
+    print(
+        f"[INFO] import {report['import_s']:.2f}s, warm-up {report['warm_up_s']:.2f}s"
+    )
+    print(
+        f"[INFO] cold start before first render: eager {report['cold_start_eager_s']:.2f}s"
+        f" -> lazy {report['cold_start_lazy_s']:.2f}s"
+    )
+    print(
+        f"[INFO] per-rerun graph build: {report['rerun_recompile_s'] * 1000:.1f}ms"
+        " -> cached"
+    )
+
+    with open(args.out, "w") as outfile:
+        json.dump(report, outfile, indent=2)
+    print(f"[INFO] Results written to {os.path.abspath(args.out)}")
@@ -0,0 +1,70 @@
+import argparse
+import time
+import numpy as np
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph_flow import graph_nodes
+from langgraph_flow.graph_pipeline import assemble_graph
+from langgraph_flow.metadata_cache import MetadataCache
+from preprocessing.embedding_cache import EmbeddingCache
+
+QUESTIONS = [
+    "What trials are recruiting for breast cancer?",
+    "Are there interventional asthma studies for children?",
+    "Show me completed diabetes trials that started after 2018",
+    "Which trials test immunotherapy in older adults with melanoma?",
+    "Find randomized double-blind trials on migraine prevention",
+]
+
+
+def time_turns(parallel: bool, questions, runs: int) -> np.ndarray:
+    graph = assemble_graph(memory=MemorySaver(), parallel=parallel)
+    latencies = []
+    for run in range(runs):
+        for i, question in enumerate(questions):
+            state = {
+                "question": question,
+                "memory": [],
+                "metadata": {},
+                "filter": {},
+                "query_embedding": None,
+                "context": [],
+                "response": "",
+                "error": "",
+                "recent_context": "",
+                "cache_hit": False,
+            }
+            config = {"configurable": {"thread_id": f"bench-{parallel}-{run}-{i}"}}
+            start = time.perf_counter()
+            graph.invoke(state, config)
+            latencies.append(time.perf_counter() - start)
+    return np.array(latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    # no embedding, metadata or answer cache, otherwise the second wiring only
+    # ever sees hits, and no metadata fast path, since the overlap measured is
+    # with the LLM call
+    graph_nodes.METADATA_FAST_PATH = False
+    graph_nodes.ANSWER_CACHE = False
+    graph_nodes.metadata_cache = MetadataCache(path=None, memory_items=0)
+    graph_nodes.embedding_cache = EmbeddingCache(
+        graph_nodes.EMBEDDING_MODEL, path=None, memory_items=0
+    )
+
+    results = {}
+    for parallel in (False, True):
+        latencies = time_turns(parallel, QUESTIONS, args.runs)
+        label = "parallel" if parallel else "sequential"
+        results[label] = latencies
+        print(
+            f"[INFO] {label}: mean {latencies.mean():.3f}s"
+            f" p50 {np.percentile(latencies, 50):.3f}s"
+            f" p95 {np.percentile(latencies, 95):.3f}s"
+        )
+
+    saved = np.median(results["sequential"]) - np.median(results["parallel"])
+    print(f"[INFO] median end-to-end latency saved per turn: {saved * 1000:.0f}ms")
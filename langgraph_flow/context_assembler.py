@@ -0,0 +1,128 @@
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger("applog")
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1000"))
+HISTORY_TURNS = int(os.getenv("HISTORY_TURNS", "3"))
+EARLIER_QUESTIONS = 10
+TIKTOKEN_ENCODING = os.getenv("TIKTOKEN_ENCODING", "o200k_base")
+
+NCT_PATTERN = re.compile(r"NCT\d{8}")
+# "Field: No info available" lines, and the per-chunk link repeated in every section
+EMPTY_LINE = re.compile(
+    r"^[^:]+:\s*(?:No info available|N/A|None)(?:,\s*No info available)*\s*$"
+)
+LINK_LINE = re.compile(r"^Study Link:")
+
+
+class TokenCounter:
+    # tiktoken matches the chat model's own tokenization but isn't a dependency;
+    # without it the embedding model's tokenizer gives a close-enough count
+    def __init__(self, fallback_tokenizer: Optional[Any] = None):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.get_encoding(TIKTOKEN_ENCODING)
+            except Exception as e:
+                logger.debug(f"[CONTEXT ASSEMBLER] tiktoken unavailable: {e}")
+        self.fallback_tokenizer = fallback_tokenizer
+
+    def count(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        if self.fallback_tokenizer is not None:
+            return len(
+                self.fallback_tokenizer.encode(
+                    text, add_special_tokens=False, verbose=False
+                )
+            )
+        return len(text) // 4
+
+
+def clean_chunk(text: str) -> List[str]:
+    return [
+        line
+        for line in text.splitlines()
+        if line.strip() and not LINK_LINE.match(line) and not EMPTY_LINE.match(line)
+    ]
+
+
+def group_by_trial(context: List[str]) -> List[Tuple[str, List[List[str]]]]:
+    # chunks arrive in rank order; a trial keeps the rank of its best chunk and
+    # repeated chunks or lines are only kept once
+    trials: Dict[str, List[List[str]]] = {}
+    seen_lines: Dict[str, set] = {}
+
+    for text in context:
+        match = NCT_PATTERN.search(text)
+        nct_id = match.group(0) if match else "Unknown"
+        seen = seen_lines.setdefault(nct_id, set())
+
+        lines = [line for line in clean_chunk(text) if line not in seen]
+        seen.update(lines)
+        if lines:
+            trials.setdefault(nct_id, []).append(lines)
+
+    return list(trials.items())
+
+
+def pack_context(context: List[str], counter: TokenCounter, budget: int) -> str:
+    blocks, used = [], 0
+
+    for nct_id, sections in group_by_trial(context):
+        header = (
+            f"## Trial {nct_id} (https://clinicaltrials.gov/study/{nct_id})"
+            if nct_id != "Unknown"
+            else "## Other"
+        )
+        block = [header]
+        block_tokens = counter.count(header)
+
+        for lines in sections:
+            section = "\n".join(lines)
+            tokens = counter.count(section)
+            if used + block_tokens + tokens > budget:
+                continue
+            block.append(section)
+            block_tokens += tokens
+
+        if len(block) > 1:
+            blocks.append("\n".join(block))
+            used += block_tokens
+
+    return "\n\n".join(blocks)
+
+
+def window_history(memory: List[Any], counter: TokenCounter, budget: int) -> str:
+    # recent turns verbatim (newest first until the budget runs out); anything
+    # older is reduced to the questions the user asked
+    recent: List[str] = []
+    used = 0
+    cutoff = len(memory)
+
+    for i in range(len(memory) - 1, -1, -1):
+        if len(memory) - i > 2 * HISTORY_TURNS:
+            break
+        line = f"{memory[i].type.upper()}: {memory[i].content}"
+        tokens = counter.count(line)
+        if used + tokens > budget:
+            break
+        recent.insert(0, line)
+        used += tokens
+        cutoff = i
+
+    earlier = [
+        message.content for message in memory[:cutoff] if message.type == "human"
+    ][-EARLIER_QUESTIONS:]
+    if earlier:
+        recent.insert(0, f"EARLIER QUESTIONS: {' | '.join(earlier)}")
+    return "\n".join(recent)
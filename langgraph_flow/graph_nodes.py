@@ -1,21 +1,48 @@
 import os
+import time
 import textwrap
+import threading
 import openai
-import torch
 import logging
 from dotenv import load_dotenv
 from datetime import datetime
 from enum import Enum
-from typing import Any, Dict
-from pymongo import MongoClient
-from pymongo.collection import Collection
-from sentence_transformers import SentenceTransformer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pymongo import AsyncMongoClient, MongoClient
 from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.config import get_stream_writer
+from preprocessing.embedding_cache import EmbeddingCache
+from preprocessing.embedding_service import EmbeddingClient
+from preprocessing.projection import Projection, load_projection
+from langgraph_flow import retrieval, tracing
+from langgraph_flow.metadata_rules import extract_metadata
+from langgraph_flow.query_encoder import (
+    EMBEDDING_BACKENDS,
+    cache_name,
+    load_query_encoder,
+)
+from langgraph_flow.metadata_cache import MetadataCache
+from langgraph_flow.answer_cache import AnswerCache
+from langgraph_flow.context_assembler import (
+    CONTEXT_TOKEN_BUDGET,
+    HISTORY_TOKEN_BUDGET,
+    TokenCounter,
+    pack_context,
+    window_history,
+)
+from langgraph_flow.lexical_index import (
+    LEXICAL_INDEX_PATH,
+    LexicalIndex,
+    is_identifier_query,
+    load_lexical_index,
+    reciprocal_rank_fusion,
+)
 
 load_dotenv()
-torch.classes.__path__ = []
 
-logging.basicConfig(filename="session.log", filemode="w")
+# appended to, so a restart doesn't wipe the previous session's log
+logging.basicConfig(filename="session.log", filemode="a")
 logger = logging.getLogger("applog")
 logger.setLevel(logging.DEBUG)
 
@@ -24,25 +51,138 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 DATABASE_NAME = os.getenv("DATABASE_NAME")
 COLLECTION_NAME = os.getenv("COLLECTION_NAME")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL")
+EMBEDDING_SERVICE = os.getenv("EMBEDDING_SERVICE", "")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "fp32")
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+EMBEDDING_PROJECTION = os.getenv("EMBEDDING_PROJECTION", "")
 VECTOR_SEARCH_INDEX = os.getenv("VECTOR_SEARCH_INDEX")
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "mongo")
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", retrieval.LOCAL_INDEX_PATH)
+VECTOR_SEARCH_EXACT = os.getenv("VECTOR_SEARCH_EXACT", "true").lower() == "true"
+VECTOR_SEARCH_NUM_CANDIDATES = int(os.getenv("VECTOR_SEARCH_NUM_CANDIDATES", "150"))
+VECTOR_SEARCH_LIMIT = int(os.getenv("VECTOR_SEARCH_LIMIT", "15"))
+VECTOR_FORMAT = os.getenv("VECTOR_FORMAT", "float32")
+METADATA_FAST_PATH = os.getenv("METADATA_FAST_PATH", "true").lower() == "true"
+METADATA_MIN_CONFIDENCE = float(os.getenv("METADATA_MIN_CONFIDENCE", "0.8"))
+ANSWER_CACHE = os.getenv("ANSWER_CACHE", "true").lower() == "true"
+LEXICAL_SEARCH = os.getenv("LEXICAL_SEARCH", "true").lower() == "true"
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "chunks")
+TRIAL_CANDIDATES = int(os.getenv("TRIAL_CANDIDATES", "50"))
+TRIAL_LIMIT = int(os.getenv("TRIAL_LIMIT", "5"))
+TRIAL_SECTIONS = os.getenv(
+    "TRIAL_SECTIONS", "overview,design,eligibility,conditions,armsInterventions"
+).split(",")
+
+required = [OPENAI_API_KEY, EMBEDDING_MODEL]
+if RETRIEVAL_BACKEND == "mongo":
+    required += [MONGODB_URI, DATABASE_NAME, COLLECTION_NAME, VECTOR_SEARCH_INDEX]
+if not all(required):
+    raise EnvironmentError("[ERROR] Missing one or more required environment variables")
+
+if RETRIEVAL_BACKEND not in ("local", "mongo"):
+    raise EnvironmentError(f"[ERROR] Unknown RETRIEVAL_BACKEND {RETRIEVAL_BACKEND}")
+
+if EMBEDDING_BACKEND not in EMBEDDING_BACKENDS:
+    raise EnvironmentError(f"[ERROR] Unknown EMBEDDING_BACKEND {EMBEDDING_BACKEND}")
+
+# the service encodes with its own fp32 model, so an in-process backend would
+# only apply on fallback and its vectors would share cache entries with fp32
+if EMBEDDING_SERVICE and EMBEDDING_BACKEND != "fp32":
+    raise EnvironmentError(
+        f"[ERROR] EMBEDDING_BACKEND {EMBEDDING_BACKEND} can't be combined with EMBEDDING_SERVICE"
+    )
+
+
+def load_local_embedding_model():
+    return load_query_encoder(EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_THREADS)
+
+
+def load_embedding_model():
+    # with a shared embedding service the model only loads in this process
+    # if the service cannot be reached
+    if EMBEDDING_SERVICE:
+        return EmbeddingClient(EMBEDDING_SERVICE, fallback=load_local_embedding_model)
+    return load_local_embedding_model()
+
 
-if not all(
-    [
-        MONGODB_URI,
-        OPENAI_API_KEY,
-        DATABASE_NAME,
-        COLLECTION_NAME,
-        EMBEDDING_MODEL,
+def load_retrieval_backend() -> retrieval.RetrievalBackend:
+    if RETRIEVAL_BACKEND == "local":
+        return retrieval.LocalVectorSearch(
+            LOCAL_INDEX_PATH, VECTOR_SEARCH_EXACT, VECTOR_SEARCH_NUM_CANDIDATES
+        )
+
+    mongo_client = MongoClient(MONGODB_URI)
+    # the async graph nodes query through their own driver; it only connects
+    # once the event loop first uses it
+    async_mongo_client = AsyncMongoClient(MONGODB_URI)
+    return retrieval.MongoVectorSearch(
+        mongo_client[DATABASE_NAME][COLLECTION_NAME],
         VECTOR_SEARCH_INDEX,
-    ]
-):
-    raise EnvironmentError("[ERROR] Missing one or more required environment variables")
+        VECTOR_SEARCH_EXACT,
+        VECTOR_SEARCH_NUM_CANDIDATES,
+        VECTOR_FORMAT,
+        async_collection=async_mongo_client[DATABASE_NAME][COLLECTION_NAME],
+    )
+
+
+def load_lexical() -> Optional[LexicalIndex]:
+    # hybrid retrieval only kicks in once the lexical index has been built
+    if not LEXICAL_SEARCH:
+        return None
+    return load_lexical_index(os.getenv("LEXICAL_INDEX_PATH", LEXICAL_INDEX_PATH))
+
+
+# models, clients and indexes are built on first use and then shared by every
+# session in the process, so importing this module is cheap
+LOADERS: Dict[str, Callable[[], Any]] = {
+    "openai_client": openai.OpenAI,
+    "embedding_model": load_embedding_model,
+    "embedding_cache": lambda: EmbeddingCache(
+        cache_name(EMBEDDING_MODEL, EMBEDDING_BACKEND)
+    ),
+    "projection": lambda: load_projection(EMBEDDING_PROJECTION, EMBEDDING_MODEL),
+    "token_counter": lambda: TokenCounter(
+        getattr(shared("embedding_model"), "tokenizer", None)
+    ),
+    "metadata_cache": MetadataCache,
+    "retrieval_backend": load_retrieval_backend,
+    "answer_cache": lambda: AnswerCache(shared("retrieval_backend").ingest_run_id),
+    "lexical_index": load_lexical,
+}
+resource_locks: Dict[str, threading.Lock] = {}
+
+
+def shared(name: str) -> Any:
+    # a resource lives in the module globals once built, so assigning the
+    # module attribute (as the benchmarks do) replaces it; concurrent first
+    # uses wait on one load instead of starting their own
+    if name not in globals():
+        with resource_locks.setdefault(name, threading.Lock()):
+            if name not in globals():
+                globals()[name] = LOADERS[name]()
+    return globals()[name]
+
+
+def __getattr__(name: str) -> Any:
+    if name in LOADERS:
+        return shared(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def warm_up() -> float:
+    # everything a turn touches, plus one encode for first-call allocation
+    # a failure here is only logged; the first turn retries the load
+    start = time.perf_counter()
+    try:
+        for name in LOADERS:
+            shared(name)
+        shared("embedding_model").encode(["warm up"])
+    except Exception as e:
+        logger.debug(f"[STARTUP][ERROR] {e}")
+    elapsed = time.perf_counter() - start
+    logger.info(f"[STARTUP] warmed up in {elapsed:.2f}s")
+    return elapsed
 
-mongo_client = MongoClient(MONGODB_URI)
-mongo_collection = mongo_client[DATABASE_NAME][COLLECTION_NAME]
-openai_client = openai.OpenAI()
-embedding_model = SentenceTransformer(EMBEDDING_MODEL)
-index_name = VECTOR_SEARCH_INDEX
 
 from langgraph_flow.state_schema import (
     PromptMetadata,
@@ -56,10 +196,66 @@ from langgraph_flow.state_schema import (
     State,
 )
 
+metadata_path_stats = {"rules": [0, 0.0], "cache": [0, 0.0], "llm": [0, 0.0]}
+
+
+def record_metadata_path(path: str, elapsed: float) -> None:
+    stats = metadata_path_stats[path]
+    stats[0] += 1
+    stats[1] += elapsed
+    total = sum(count for count, _ in metadata_path_stats.values())
+    logger.info(
+        f"[METADATA NODE] path={path} {elapsed * 1000:.1f}ms | "
+        + " ".join(
+            f"{name}: {count / total:.0%} hits, {(spent / count if count else 0) * 1000:.1f}ms avg"
+            for name, (count, spent) in metadata_path_stats.items()
+        )
+    )
 
-def query_metadata_extraction(state: State) -> Dict[str, Any]:
-    client: openai.OpenAI = openai_client
 
+def format_messages(memory, count: int) -> str:
+    return "\n".join(
+        [
+            f"ROLE: {message.type.upper()} MESSAGE: {message.content}"
+            for message in memory[-count:]
+        ]
+    )
+
+
+def local_metadata(state: State, start: float) -> Optional[Dict[str, Any]]:
+    # plain questions are parsed locally; follow-ups and anything the rules
+    # can't pin down still go to the LLM
+    if METADATA_FAST_PATH:
+        parsed, confidence = extract_metadata(
+            state["question"], has_history=bool(state["memory"])
+        )
+        if confidence >= METADATA_MIN_CONFIDENCE:
+            state_change = {
+                "metadata": parsed.model_dump(),
+                "recent_context": format_messages(state["memory"], 4),
+                "error": None,
+            }
+            record_metadata_path("rules", time.perf_counter() - start)
+            logger.info(f"[METADATA NODE] {state_change}")
+            return state_change
+
+    cache: MetadataCache = shared("metadata_cache")
+    cached = cache.get(state["question"], state["memory"])
+    if cached is not None:
+        state_change = {
+            "metadata": PromptMetadata.model_validate(cached).model_dump(),
+            "recent_context": format_messages(state["memory"], 4),
+            "error": None,
+        }
+        record_metadata_path("cache", time.perf_counter() - start)
+        logger.info(f"[METADATA CACHE] {cache.stats()}")
+        logger.info(f"[METADATA NODE] {state_change}")
+        return state_change
+
+    return None
+
+
+def metadata_request(state: State) -> Dict[str, Any]:
     system_prompt = textwrap.dedent(
         f"""
     You are a metadata extractor for clinical trial queries. Parse the user's question and return a JSON with the following fields. 
@@ -87,40 +283,47 @@ def query_metadata_extraction(state: State) -> Dict[str, Any]:
     """
     )
 
-    recent_context = (
-        "\n".join(
-            [
-                f"ROLE: {message.type.upper()} MESSAGE: {message.content}"
-                for message in state["memory"][-6:]
-            ]
-        ),
-    )
+    recent_context = (format_messages(state["memory"], 6),)
     user_prompt = f"Context: {recent_context}\nUser question: {state['question']}\nReturn only valid JSON."
 
-    try:
-        response = client.responses.parse(
-            model="chatgpt-4o-latest",
-            input=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            text_format=PromptMetadata,
-        )
-        parsed = response.output_parsed
+    return {
+        "model": "chatgpt-4o-latest",
+        "input": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        "text_format": PromptMetadata,
+    }
+
+
+def llm_metadata(state: State, parsed: PromptMetadata, start: float) -> Dict[str, Any]:
+    cache: MetadataCache = shared("metadata_cache")
+    cache.put(state["question"], state["memory"], parsed.model_dump(mode="json"))
+
+    state_change = {
+        "metadata": parsed.model_dump(),
+        "recent_context": format_messages(state["memory"], 4),
+        "error": None,
+    }
+    record_metadata_path("llm", time.perf_counter() - start)
+    logger.info(f"[METADATA CACHE] {cache.stats()}")
+    logger.info(f"[METADATA NODE] {state_change}")
+    return state_change
 
-        state_change = {
-            "metadata": parsed.model_dump(),
-            "recent_context": "\n".join(
-                [
-                    f"ROLE: {message.type.upper()} MESSAGE: {message.content}"
-                    for message in state["memory"][-4:]
-                ]
-            ),
-            "error": None,
-        }
-        logger.info(f"[METADATA NODE] {state_change}")
+
+def query_metadata_extraction(state: State) -> Dict[str, Any]:
+    client: openai.OpenAI = shared("openai_client")
+    start = time.perf_counter()
+
+    state_change = local_metadata(state, start)
+    if state_change is not None:
         return state_change
 
+    try:
+        response = client.responses.parse(**metadata_request(state))
+        tracing.record_usage(response)
+        return llm_metadata(state, response.output_parsed, start)
+
     except Exception as e:
         state_change = {"metadata": {}, "error": "[ERROR] Metadata extraction failed."}
         logger.debug(f"[METADATA NODE][ERROR] {e}")
@@ -155,42 +358,151 @@ def db_filter_assembly(state: State) -> Dict[str, Any]:
     return state_change
 
 
-def vector_search(state: State) -> Dict[str, Any]:
-    model: SentenceTransformer = embedding_model
-    search_index: str = index_name
-    collection: Collection = mongo_collection
+def identifier_lookup(state: State) -> bool:
+    return shared("lexical_index") is not None and is_identifier_query(
+        state["question"]
+    )
 
-    device = "cuda" if torch.cuda.is_available() else "cpu"
 
+def query_embedding(state: State) -> Dict[str, Any]:
+    if identifier_lookup(state):
+        logger.info("[QUERY EMBEDDING NODE] identifier query, skipped")
+        return {"query_embedding": None}
+
+    # runs alongside metadata extraction, so it must not write "error" as well
     try:
-        prompt_embeddings = model.encode([state["question"]], device=device).tolist()[0]
-
-        pipeline = [
-            {
-                "$vectorSearch": {
-                    "index": search_index,
-                    "path": "embeddings",
-                    "queryVector": prompt_embeddings,
-                    "exact": True,
-                    "limit": 15,
-                    "filter": state["filter"],
-                }
-            },
-            {
-                "$project": {
-                    "_id": 0,
-                    "text": 1,
-                    "score": {"$meta": "vectorSearchScore"},
-                }
-            },
-        ]
+        model = shared("embedding_model")
+        cache: EmbeddingCache = shared("embedding_cache")
+        with tracing.timer("embed_s"):
+            vectors = cache.encode([state["question"]], model.encode)
+        projection: Optional[Projection] = shared("projection")
+        if projection is not None:
+            vectors = projection.apply(vectors)
+        prompt_embeddings = vectors[0].tolist()
+        logger.info(f"[EMBEDDING CACHE] {cache.stats()}")
+
+        logger.info(f"[QUERY EMBEDDING NODE] {len(prompt_embeddings)} dims")
+        return {"query_embedding": prompt_embeddings}
 
-        results = collection.aggregate(pipeline)
-        context_docs = [doc["text"] for doc in results if float(doc["score"]) > 0.5]
+    except Exception as e:
+        logger.debug(f"[QUERY EMBEDDING NODE][ERROR] {e}")
+        return {"query_embedding": None}
 
-        state_change = {"context": context_docs, "error": None}
-        logger.info(f"[VECTOR SEARCH NODE] {state_change}")
-        return state_change
+
+def answer_lookup(state: State) -> Dict[str, Any]:
+    cache: AnswerCache = shared("answer_cache")
+
+    # only standalone first questions are answered from the cache; with history
+    # the answer depends on more than the question and its filter
+    if not ANSWER_CACHE or state["memory"] or not state.get("query_embedding"):
+        return {"cache_hit": False}
+
+    try:
+        cached = cache.get(state["query_embedding"], state["filter"])
+        logger.info(f"[ANSWER CACHE] {cache.stats()}")
+    except Exception as e:
+        logger.debug(f"[ANSWER CACHE NODE][ERROR] {e}")
+        cached = None
+
+    if cached is None:
+        return {"cache_hit": False}
+
+    state_change = {
+        "cache_hit": True,
+        "context": cached["context"],
+        "response": cached["response"],
+        "memory": [
+            HumanMessage(content=state["question"]),
+            AIMessage(content=cached["response"]),
+        ],
+        "error": None,
+    }
+    logger.info(
+        f"[ANSWER CACHE NODE] hit on {cached['question']!r} ({cached['similarity']:.3f})"
+    )
+    return state_change
+
+
+def cache_check(state: State) -> bool:
+    return bool(state.get("cache_hit"))
+
+
+def lexical_results(state: State) -> List[Dict[str, Any]]:
+    # identifier questions skip the embedding; the trial's chunks come straight
+    # from the nctId filter, or from BM25 if extraction didn't pick the id up
+    index: LexicalIndex = shared("lexical_index")
+    if state["filter"]:
+        return index.lookup(state["filter"], VECTOR_SEARCH_LIMIT)
+    return index.search(state["question"], {}, VECTOR_SEARCH_LIMIT)
+
+
+def search_limit() -> int:
+    # trial mode over-fetches chunks so that grouping still leaves enough trials
+    return TRIAL_CANDIDATES if RETRIEVAL_MODE == "trials" else VECTOR_SEARCH_LIMIT
+
+
+def fuse_results(state: State, dense: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    dense = [doc for doc in dense if float(doc["score"]) > 0.5]
+    index: Optional[LexicalIndex] = shared("lexical_index")
+    if index is None:
+        return dense
+    lexical = index.search(state["question"], state["filter"], search_limit())
+    return reciprocal_rank_fusion([dense, lexical], search_limit())
+
+
+def trial_request(
+    results: List[Dict[str, Any]],
+) -> Tuple[List[Dict[str, Any]], List[Tuple[str, str]]]:
+    bundles = retrieval.group_trials(results, TRIAL_LIMIT)
+    return bundles, retrieval.missing_sections(bundles, TRIAL_SECTIONS)
+
+
+def trial_state_change(
+    bundles: List[Dict[str, Any]], fetched: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    bundles = retrieval.attach_sections(bundles, fetched, TRIAL_SECTIONS)
+    logger.info(
+        "[VECTOR SEARCH NODE] trials "
+        + ", ".join(
+            f"{b['source_id']} ({b['score']:.3f}, {len(b['chunks'])} sections)"
+            for b in bundles
+        )
+    )
+    # bundles are flattened in rank order; pack_context regroups them by trial
+    return search_state_change([doc for b in bundles for doc in b["chunks"]])
+
+
+def search_state_change(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    context_docs = [doc["text"] for doc in results]
+    tracing.add("results", len(context_docs))
+
+    state_change = {"context": context_docs, "error": None}
+    logger.info(f"[VECTOR SEARCH NODE] {state_change}")
+    return state_change
+
+
+def vector_search(state: State) -> Dict[str, Any]:
+    backend: retrieval.RetrievalBackend = shared("retrieval_backend")
+
+    try:
+        if not state.get("query_embedding") and identifier_lookup(state):
+            return search_state_change(lexical_results(state))
+        if not state.get("query_embedding"):
+            raise ValueError("Question embedding is missing")
+
+        with tracing.timer("db_s"):
+            results = backend.search(
+                state["query_embedding"], state["filter"], search_limit()
+            )
+        results = fuse_results(state, results)
+        if RETRIEVAL_MODE != "trials":
+            return search_state_change(results)
+
+        # every missing sibling section of the top trials in one round trip
+        bundles, keys = trial_request(results)
+        with tracing.timer("db_s"):
+            fetched = backend.fetch_sections(keys) if keys else []
+        return trial_state_change(bundles, fetched)
 
     except Exception as e:
         state_change = {"context": [], "error": "[ERROR] Vector search failed."}
@@ -198,8 +510,7 @@ def vector_search(state: State) -> Dict[str, Any]:
         return state_change
 
 
-def chat_response(state: State) -> Dict[str, Any]:
-    client: openai.OpenAI = openai_client
+def chat_request(state: State) -> Dict[str, Any]:
     prompt = state["question"]
     context = state["context"]
     memory = state["memory"]
@@ -230,28 +541,81 @@ def chat_response(state: State) -> Dict[str, Any]:
     """
     )
 
-    try:
-        response = client.responses.parse(
-            model="chatgpt-4o-latest",
-            input=[
-                {"role": "system", "content": system_prompt},
-                {
-                    "role": "user",
-                    "content": f"MESSAGE HISTORY: {memory}\nCONTEXT: {context}\nUSER PROMPT: {prompt}",
-                },
-            ],
-        )
+    # trials merged and stripped of boilerplate, history windowed, both
+    # within their token budgets
+    token_counter: TokenCounter = shared("token_counter")
+    history = window_history(memory, token_counter, HISTORY_TOKEN_BUDGET)
+    packed = pack_context(context, token_counter, CONTEXT_TOKEN_BUDGET)
+    user_prompt = (
+        f"MESSAGE HISTORY: {history}\nCONTEXT: {packed}\nUSER PROMPT: {prompt}"
+    )
 
-        state_change = {
-            "response": response.output_text,
-            "memory": [
-                HumanMessage(content=prompt),
-                AIMessage(content=response.output_text),
-            ],
-            "error": None,
-        }
-        logger.info(f"[CHAT RESPONSE NODE] {state_change}")
-        return state_change
+    raw_tokens = token_counter.count(
+        f"MESSAGE HISTORY: {memory}\nCONTEXT: {context}\nUSER PROMPT: {prompt}"
+    )
+    logger.info(
+        f"[CHAT RESPONSE NODE] prompt tokens {raw_tokens} -> {token_counter.count(user_prompt)}"
+    )
+
+    return {
+        "model": "chatgpt-4o-latest",
+        "input": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+    }
+
+
+def chat_state_change(state: State, output_text: str) -> Dict[str, Any]:
+    if ANSWER_CACHE and not state["memory"] and state.get("query_embedding"):
+        # a failed put only costs a future hit, never this answer
+        try:
+            shared("answer_cache").put(
+                state["question"],
+                state["query_embedding"],
+                state["filter"],
+                output_text,
+                state["context"],
+            )
+        except Exception as e:
+            logger.debug(f"[ANSWER CACHE NODE][ERROR] {e}")
+
+    state_change = {
+        "response": output_text,
+        "memory": [
+            HumanMessage(content=state["question"]),
+            AIMessage(content=output_text),
+        ],
+        "error": None,
+    }
+    logger.info(f"[CHAT RESPONSE NODE] {state_change}")
+    return state_change
+
+
+def chat_response(state: State, config: RunnableConfig) -> Dict[str, Any]:
+    client: openai.OpenAI = shared("openai_client")
+    request = chat_request(state)
+
+    try:
+        if config.get("configurable", {}).get("stream_tokens"):
+            # tokens go out as custom stream events; the state update below is
+            # built from the final text exactly as in the blocking path
+            writer = get_stream_writer()
+            start, first_token = time.perf_counter(), None
+            with client.responses.stream(**request) as stream:
+                for event in stream:
+                    if event.type == "response.output_text.delta":
+                        if first_token is None:
+                            first_token = time.perf_counter() - start
+                            logger.info(f"[CHAT RESPONSE NODE] TTFT {first_token:.3f}s")
+                        writer({"token": event.delta})
+                response = stream.get_final_response()
+        else:
+            response = client.responses.parse(**request)
+        tracing.record_usage(response)
+        output_text = response.output_text
+
+        return chat_state_change(state, output_text)
 
     except Exception as e:
         state_change = {
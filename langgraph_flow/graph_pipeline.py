@@ -1,11 +1,14 @@
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph_flow.state_schema import State
-from langgraph.checkpoint.memory import MemorySaver
+from langgraph_flow.tracing import trace_node
 
 from langgraph_flow.graph_nodes import (
     query_metadata_extraction,
     db_filter_assembly,
+    query_embedding,
+    answer_lookup,
+    cache_check,
     vector_search,
     chat_response,
     error_response,
@@ -13,14 +16,45 @@ from langgraph_flow.graph_nodes import (
 )
 
 
-def assemble_graph(memory: MemorySaver):
+def assemble_graph(
+    memory: BaseCheckpointSaver, parallel: bool = True, use_async: bool = False
+):
     builder = StateGraph(state_schema=State)
 
-    builder.add_node("metadata extraction", query_metadata_extraction)
-    builder.add_node("filter creation", db_filter_assembly)
-    builder.add_node("vector search", vector_search)
-    builder.add_node("chat response", chat_response)
-    builder.add_node("error response", error_response)
+    # async nodes are for ainvoke/astream callers serving many sessions per process
+    if use_async:
+        # imported here so sync-only callers never build the async clients
+        from langgraph_flow.async_graph_nodes import (
+            aquery_metadata_extraction,
+            adb_filter_assembly,
+            aquery_embedding,
+            aanswer_lookup,
+            avector_search,
+            achat_response,
+            aerror_response,
+        )
+
+        nodes = {
+            "metadata extraction": aquery_metadata_extraction,
+            "filter creation": adb_filter_assembly,
+            "query embedding": aquery_embedding,
+            "answer cache": aanswer_lookup,
+            "vector search": avector_search,
+            "chat response": achat_response,
+            "error response": aerror_response,
+        }
+    else:
+        nodes = {
+            "metadata extraction": query_metadata_extraction,
+            "filter creation": db_filter_assembly,
+            "query embedding": query_embedding,
+            "answer cache": answer_lookup,
+            "vector search": vector_search,
+            "chat response": chat_response,
+            "error response": error_response,
+        }
+    for name, node in nodes.items():
+        builder.add_node(name, trace_node(name, node))
 
     builder.add_edge(START, "metadata extraction")
     builder.add_conditional_edges(
@@ -28,9 +62,21 @@ def assemble_graph(memory: MemorySaver):
         error_check,
         {True: "error response", False: "filter creation"},
     )
+
+    if parallel:
+        # the question embedding doesn't depend on the metadata, so it is
+        # computed while the metadata LLM call is in flight; the answer cache
+        # lookup waits for both branches
+        builder.add_edge(START, "query embedding")
+        builder.add_edge(["filter creation", "query embedding"], "answer cache")
+    else:
+        builder.add_edge("filter creation", "query embedding")
+        builder.add_edge("query embedding", "answer cache")
+
     builder.add_conditional_edges(
-        "filter creation", error_check, {True: "error response", False: "vector search"}
+        "answer cache", cache_check, {True: END, False: "vector search"}
     )
+
     builder.add_conditional_edges(
         "vector search", error_check, {True: "error response", False: "chat response"}
     )
@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import re
+import numpy as np
+from collections import Counter
+from typing import Any, Dict, List, Optional
+from langgraph_flow.retrieval import ColumnStore, read_records, write_store
+
+LEXICAL_INDEX_PATH = os.path.join("preprocessing", "trial_data", "lexical_index")
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+NCT_TOKEN = re.compile(r"nct\d{8}")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the "
+    "this to was were which with".split()
+)
+# words that dress up an identifier without adding anything to search for
+FILLER_WORDS = STOPWORDS | frozenset(
+    "about any can details do does find give i info information me more on please "
+    "show study studies summarize summary tell trial trials what whats".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [
+        token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS
+    ]
+
+
+def is_identifier_query(question: str) -> bool:
+    # "NCT01234567" or "tell me about NCT01234567": the metadata filter already
+    # pins the trial down, so there is nothing for an embedding to add
+    tokens = TOKEN_PATTERN.findall(question.lower())
+    return any(NCT_TOKEN.fullmatch(t) for t in tokens) and all(
+        NCT_TOKEN.fullmatch(t) or t in FILLER_WORDS for t in tokens
+    )
+
+
+class LexicalIndex(ColumnStore):
+    # BM25 over chunk text as CSR postings: per-term offsets into parallel
+    # doc-id (uint32) and term-frequency (uint16) arrays, plus per-doc lengths
+    def __init__(self, path: str = LEXICAL_INDEX_PATH):
+        super().__init__(path)
+
+        with open(os.path.join(path, "terms.json"), "r") as infile:
+            self.terms: Dict[str, int] = {
+                term: i for i, term in enumerate(json.load(infile))
+            }
+        self.offsets = np.load(os.path.join(path, "lex_offsets.npy"))
+        self.docs = np.load(os.path.join(path, "lex_docs.npy"), mmap_mode="r")
+        self.tf = np.load(os.path.join(path, "lex_tf.npy"), mmap_mode="r")
+        self.doc_len = np.load(os.path.join(path, "lex_doc_len.npy")).astype(np.float32)
+        self.avg_len = float(self.doc_len.mean()) if len(self.doc_len) else 1.0
+
+    def scores(self, question: str) -> np.ndarray:
+        scores = np.zeros(len(self), dtype=np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len / self.avg_len)
+
+        for token in set(tokenize(question)):
+            term = self.terms.get(token)
+            if term is None:
+                continue
+            start, end = self.offsets[term], self.offsets[term + 1]
+            docs = self.docs[start:end]
+            tf = self.tf[start:end].astype(np.float32)
+            idf = np.log1p((len(self) - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tf * (BM25_K1 + 1) / (tf + norm[docs])
+
+        return scores
+
+    def search(
+        self, question: str, filter: Dict[str, Any], limit: int
+    ) -> List[Dict[str, Any]]:
+        scores = self.scores(question)
+        mask = self.filter_mask(filter)
+        if mask is not None:
+            scores[~mask] = 0.0
+
+        rows = np.flatnonzero(scores)
+        k = min(limit, len(rows))
+        if k == 0:
+            return []
+        top = rows[np.argpartition(-scores[rows], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [{**self.records[i], "score": float(scores[i])} for i in top]
+
+    def lookup(self, filter: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+        # every chunk the filter matches, in file (section) order
+        mask = self.filter_mask(filter)
+        if mask is None:
+            return []
+        return [{**self.records[i], "score": 1.0} for i in np.flatnonzero(mask)[:limit]]
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List[Dict[str, Any]]], limit: int, k: int = RRF_K
+) -> List[Dict[str, Any]]:
+    # rank-only fusion, so BM25 and cosine scores never need a common scale
+    fused: Dict[tuple, float] = {}
+    docs: Dict[tuple, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = (doc["source_id"], doc["section"])
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank + 1)
+            docs.setdefault(key, doc)
+
+    ranked = sorted(fused, key=fused.get, reverse=True)[:limit]
+    return [{**docs[key], "score": fused[key]} for key in ranked]
+
+
+def write_lexical_index(
+    out_path: str,
+    records: List[Dict[str, str]],
+    metadata: Dict[str, List[Any]],
+) -> int:
+    postings: Dict[str, List[tuple]] = {}
+    doc_len = np.zeros(len(records), dtype=np.uint32)
+
+    for row, record in enumerate(records):
+        counts = Counter(tokenize(record["text"]))
+        doc_len[row] = sum(counts.values())
+        for token, count in counts.items():
+            postings.setdefault(token, []).append((row, min(count, 65535)))
+
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(postings[t]) for t in terms])
+    docs = np.empty(offsets[-1], dtype=np.uint32)
+    tf = np.empty(offsets[-1], dtype=np.uint16)
+    for i, term in enumerate(terms):
+        pairs = np.array(postings[term], dtype=np.int64)
+        docs[offsets[i] : offsets[i + 1]] = pairs[:, 0]
+        tf[offsets[i] : offsets[i + 1]] = pairs[:, 1]
+
+    os.makedirs(out_path, exist_ok=True)
+    with open(os.path.join(out_path, "terms.json"), "w") as outfile:
+        json.dump(terms, outfile)
+    np.save(os.path.join(out_path, "lex_offsets.npy"), offsets)
+    np.save(os.path.join(out_path, "lex_docs.npy"), docs)
+    np.save(os.path.join(out_path, "lex_tf.npy"), tf)
+    np.save(os.path.join(out_path, "lex_doc_len.npy"), doc_len)
+
+    return write_store(out_path, records, metadata, terms=len(terms))
+
+
+def load_lexical_index(path: str = LEXICAL_INDEX_PATH) -> Optional[LexicalIndex]:
+    if not os.path.exists(os.path.join(path, "store.json")):
+        return None
+    return LexicalIndex(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--data-path",
+        default=os.path.join("preprocessing", "trial_data", "trials.jsonl"),
+    )
+    parser.add_argument("--out-path", default=LEXICAL_INDEX_PATH)
+    args = parser.parse_args()
+
+    records, metadata = read_records(args.data_path)
+    count = write_lexical_index(args.out_path, records, metadata)
+    print(f"[INFO] Built lexical index with {count} chunks at {args.out_path}")
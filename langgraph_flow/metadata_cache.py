@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+CACHE_PATH = os.getenv("METADATA_CACHE_PATH", "")
+CACHE_TTL = float(os.getenv("METADATA_CACHE_TTL", "3600"))
+CACHE_MEMORY_ITEMS = int(os.getenv("METADATA_CACHE_MEMORY_ITEMS", "1024"))
+CACHE_DISK_ITEMS = int(os.getenv("METADATA_CACHE_DISK_ITEMS", "100000"))
+# the metadata prompt shows the LLM this many recent messages
+HISTORY_MESSAGES = 6
+
+
+def normalize_question(question: str) -> str:
+    question = unicodedata.normalize("NFC", question).lower()
+    return re.sub(r"\s+", " ", question).strip(" ?!.")
+
+
+def cache_key(question: str, memory: List[Any]) -> bytes:
+    history = hashlib.sha256(
+        "\0".join(
+            f"{message.type}:{message.content}"
+            for message in memory[-HISTORY_MESSAGES:]
+        ).encode("utf-8")
+    ).digest()
+    return hashlib.sha256(
+        normalize_question(question).encode("utf-8") + b"\0" + history
+    ).digest()
+
+
+class MetadataCache:
+    # parsed metadata keyed on the question and the history the LLM would see,
+    # so a follow-up only hits when the conversation leading up to it matches
+    def __init__(
+        self,
+        path: Optional[str] = CACHE_PATH,
+        ttl: float = CACHE_TTL,
+        memory_items: int = CACHE_MEMORY_ITEMS,
+        disk_items: int = CACHE_DISK_ITEMS,
+    ):
+        self.ttl = ttl
+        self.memory_items = memory_items
+        self.disk_items = disk_items
+        self.memory: OrderedDict[bytes, Tuple[float, Dict[str, Any]]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "expired": 0}
+
+        # an empty path keeps the cache purely in-process
+        self.db: Optional[sqlite3.Connection] = None
+        self.disk_count = 0
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.db = sqlite3.connect(
+                path, check_same_thread=False, isolation_level=None
+            )
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS metadata "
+                "(key BLOB PRIMARY KEY, value TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL) WITHOUT ROWID"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS metadata_accessed ON metadata (accessed)"
+            )
+            self.disk_count = self.db.execute(
+                "SELECT COUNT(*) FROM metadata"
+            ).fetchone()[0]
+
+    def remember(self, key: bytes, created: float, value: Dict[str, Any]) -> None:
+        self.memory[key] = (created, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def get(self, question: str, memory: List[Any]) -> Optional[Dict[str, Any]]:
+        key = cache_key(question, memory)
+        now = time.time()
+
+        with self.lock:
+            entry, counter = self.memory.get(key), "memory_hits"
+            if entry is not None:
+                self.memory.move_to_end(key)
+            elif self.db is not None:
+                row = self.db.execute(
+                    "SELECT created, value FROM metadata WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    entry, counter = (row[0], json.loads(row[1])), "disk_hits"
+
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+
+            created, value = entry
+            if now - created > self.ttl:
+                self.memory.pop(key, None)
+                if self.db is not None:
+                    self.db.execute("DELETE FROM metadata WHERE key = ?", (key,))
+                self.counters["expired"] += 1
+                self.counters["misses"] += 1
+                return None
+
+            if counter == "disk_hits":
+                self.remember(key, created, value)
+                self.db.execute(
+                    "UPDATE metadata SET accessed = ? WHERE key = ?", (now, key)
+                )
+            self.counters[counter] += 1
+            return value
+
+    def put(self, question: str, memory: List[Any], value: Dict[str, Any]) -> None:
+        key = cache_key(question, memory)
+        now = time.time()
+
+        with self.lock:
+            self.remember(key, now, value)
+            if self.db is None:
+                return
+            self.db.execute(
+                "INSERT OR REPLACE INTO metadata (key, value, created, accessed) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            # replaced keys are over-counted, which only brings eviction forward
+            self.disk_count += 1
+            if self.disk_count > self.disk_items:
+                self.evict()
+
+    def evict(self) -> None:
+        # expired rows go first, then least recently used ones over the cap
+        self.db.execute(
+            "DELETE FROM metadata WHERE created < ?", (time.time() - self.ttl,)
+        )
+        # trim to 90% of the cap so eviction doesn't run on every insert
+        self.disk_count = self.db.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+        excess = self.disk_count - int(self.disk_items * 0.9)
+        if excess > 0:
+            self.db.execute(
+                "DELETE FROM metadata WHERE key IN "
+                "(SELECT key FROM metadata ORDER BY accessed LIMIT ?)",
+                (excess,),
+            )
+            self.disk_count -= excess
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+            lookups = hits + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_items": len(self.memory),
+            }
@@ -0,0 +1,259 @@
+import re
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+from langgraph_flow.state_schema import (
+    PromptMetadata,
+    Status,
+    StudyType,
+    DesignAllocation,
+    InterventionalAssignment,
+    MaskingType,
+    Sex,
+    StdAges,
+)
+
+NCT_PATTERN = re.compile(r"\bNCT\d{8}\b", re.IGNORECASE)
+
+MONTHS = {
+    name: i + 1
+    for i, names in enumerate(
+        [
+            ("january", "jan"),
+            ("february", "feb"),
+            ("march", "mar"),
+            ("april", "apr"),
+            ("may",),
+            ("june", "jun"),
+            ("july", "jul"),
+            ("august", "aug"),
+            ("september", "sep", "sept"),
+            ("october", "oct"),
+            ("november", "nov"),
+            ("december", "dec"),
+        ]
+    )
+    for name in names
+}
+DATE_VALUE = (
+    r"(?P<date>(?:19|20)\d{2}-\d{2}-\d{2}|(?:19|20)\d{2}-\d{2}|"
+    r"(?:" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")\.?\s+(?:19|20)\d{2}|"
+    r"(?:19|20)\d{2})\b"
+)
+DATE_PATTERN = re.compile(
+    r"(?:\b(?P<subject>start(?:ed|ing|s)?|began|begin(?:ning|s)?|launched|"
+    r"complet(?:ed|ion|ing|es)?|end(?:ed|ing|s)?|finish(?:ed|ing|es)?)\b"
+    r"(?P<gap>[\w\s]{0,12}?))?\b(?P<op>before|after|since|prior to|until|through|by|to|from|in)\s+"
+    + DATE_VALUE,
+    re.IGNORECASE,
+)
+# "to", "from", "by" and "in" in front of a bare number are as often counts
+# ("up to 2000 patients") or names ("2019 novel coronavirus") as dates, so
+# they only read as dates with a date noun or a month attached
+WEAK_OPS = ("by", "to", "from", "in")
+DATE_NOUN_PATTERN = re.compile(r"\b(?:dates?|years?)\s*$", re.IGNORECASE)
+# "completed trials before 2019" uses the subject as the status, not as the
+# verb of the date phrase
+STATUS_SUBJECT_PATTERN = re.compile(r"^\s*(?:trials?|stud(?:y|ies))\b", re.IGNORECASE)
+
+# phrase tables, longest phrases first so "not yet recruiting" wins over "recruiting"
+SYNONYMS: Dict[str, List[Tuple[str, object]]] = {
+    "status": [
+        (r"active,? (?:but )?not recruiting", Status.ACTIVE_NOT_RECRUITING),
+        (r"not yet recruiting", Status.NOT_YET_RECRUITING),
+        (r"enrolling by invitation", Status.ENROLLING_BY_INVITATION),
+        (r"no longer available", Status.NO_LONGER_AVAILABLE),
+        (r"temporarily not available", Status.TEMPORARILY_NOT_AVAILABLE),
+        (r"approved for marketing", Status.APPROVED_FOR_MARKETING),
+        (r"(?:currently )?recruiting|open for enrol?lment", Status.RECRUITING),
+        (r"completed|finished(?= trials| studies)", Status.COMPLETED),
+        (r"terminated|stopped early", Status.TERMINATED),
+        (r"withdrawn", Status.WITHDRAWN),
+        (r"suspended", Status.SUSPENDED),
+        (r"withheld", Status.WITHHELD),
+    ],
+    "studyType": [
+        (r"expanded access", StudyType.EXPANDED_ACCESS),
+        (r"interventional", StudyType.INTERVENTIONAL),
+        (r"observational", StudyType.OBSERVATIONAL),
+    ],
+    "allocation": [
+        (r"non-?randomi[sz]ed", DesignAllocation.NON_RANDOMIZED),
+        (r"randomi[sz]ed", DesignAllocation.RANDOMIZED),
+    ],
+    "interventionModel": [
+        (r"single[- ]group|single[- ]arm", InterventionalAssignment.SINGLE_GROUP),
+        (r"parallel[- ](?:group|arm|assignment)", InterventionalAssignment.PARALLEL),
+        (r"cross-?over", InterventionalAssignment.CROSSOVER),
+        (r"factorial", InterventionalAssignment.FACTORIAL),
+        (r"sequential[- ]assignment", InterventionalAssignment.SEQUENTIAL),
+    ],
+    "maskingType": [
+        (r"open[- ]label|unmasked|unblinded|no masking", MaskingType.NONE),
+        (r"quadruple[- ](?:blind|mask)", MaskingType.QUADRUPLE),
+        (r"triple[- ](?:blind|mask)", MaskingType.TRIPLE),
+        (r"double[- ](?:blind|mask)", MaskingType.DOUBLE),
+        (r"single[- ](?:blind|mask)", MaskingType.SINGLE),
+    ],
+    "healthyVolunteers": [
+        (r"healthy (?:volunteers?|participants?|subjects?)", True),
+    ],
+    # hyphen-joined words ("man-made", "female-led") aren't about participants,
+    # and a capitalised "Man" is more often a name than a person
+    "sex": [
+        (r"(?<!-)(?:wom[ae]n|females?|girls?|pregnan\w*)(?!-)", Sex.FEMALE),
+        (r"(?<!-)(?:men|(?-i:man)|males?|boys?)(?!-)", Sex.MALE),
+    ],
+    "stdAges": [
+        (r"older adults?|elderly|seniors?|geriatric", StdAges.OLDER_ADULT),
+        (
+            r"child(?:ren)?|kids?|paediatric|pediatric|infants?|adolescents?|teen\w*",
+            StdAges.CHILD,
+        ),
+        (r"adults?", StdAges.ADULT),
+    ],
+}
+COMPILED = {
+    field: [(re.compile(rf"\b(?:{p})\b", re.IGNORECASE), v) for p, v in table]
+    for field, table in SYNONYMS.items()
+}
+
+# questions that lean on the conversation or carry constraints the tables can't express
+FOLLOW_UP_PATTERN = re.compile(
+    r"^\s*(?:and|also|what about|how about|same|those|these|that|they|it|its|"
+    r"the (?:first|second|third|last|other|same)|more)\b|\b(?:those|these|them|"
+    r"that one|the above|mentioned|earlier|previous(?:ly)?)\b",
+    re.IGNORECASE,
+)
+AMBIGUITY_PATTERN = re.compile(
+    r"\b(?:not|no|except|excluding|without|other than|neither|nor)\b|"
+    r"\b(?:under|over|older than|younger than|between|aged?)\s+\d+|"
+    r"\byears? old\b|\bphase\b",
+    re.IGNORECASE,
+)
+
+
+def parse_date_value(value: str) -> Tuple[datetime, datetime]:
+    # returns the first and last day the expression covers
+    value = value.strip().lower().replace(".", "")
+    if re.fullmatch(r"\d{4}-\d{2}-\d{2}", value):
+        day = datetime.strptime(value, "%Y-%m-%d")
+        return day, day
+    if re.fullmatch(r"\d{4}-\d{2}", value):
+        year, month = int(value[:4]), int(value[5:])
+    elif re.fullmatch(r"\d{4}", value):
+        return datetime(int(value), 1, 1), datetime(int(value), 12, 31)
+    else:
+        name, year_str = value.split()
+        year, month = int(year_str), MONTHS[name]
+    first = datetime(year, month, 1)
+    last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(
+        days=1
+    )
+    return first, last
+
+
+def extract_dates(
+    question: str,
+) -> Tuple[Dict[str, datetime], List[Tuple[int, int]], bool]:
+    # also returns the spans the dates were read from, so the caller can strip
+    # them before matching the phrase tables
+    dates: Dict[str, datetime] = {}
+    spans: List[Tuple[int, int]] = []
+    ambiguous = False
+
+    for match in DATE_PATTERN.finditer(question):
+        subject = (match.group("subject") or "").lower()
+        op = match.group("op").lower()
+        bare_year = re.fullmatch(r"\d{4}", match.group("date")) is not None
+        dated = subject or DATE_NOUN_PATTERN.search(question[: match.start("op")])
+        if op in WEAK_OPS and bare_year and not dated:
+            # left to the LLM rather than guessed either way
+            ambiguous = True
+            continue
+
+        if subject and STATUS_SUBJECT_PATTERN.match(match.group("gap") or ""):
+            spans.append((match.start("op"), match.end()))
+        else:
+            spans.append(match.span())
+        field = (
+            "completionDate"
+            if subject.startswith(("complet", "end", "finish"))
+            else "startDate"
+        )
+        try:
+            first, last = parse_date_value(match.group("date"))
+        except (ValueError, KeyError):
+            ambiguous = True
+            continue
+
+        if op in ("before", "prior to"):
+            bounds = {f"{field}Before": first}
+        elif op in ("until", "through", "by", "to"):
+            bounds = {f"{field}Before": last + timedelta(days=1)}
+        elif op == "after":
+            bounds = {f"{field}After": last}
+        elif op in ("since", "from"):
+            bounds = {f"{field}After": first - timedelta(days=1)}
+        else:
+            bounds = {
+                f"{field}After": first - timedelta(days=1),
+                f"{field}Before": last + timedelta(days=1),
+            }
+
+        for key, value in bounds.items():
+            if key in dates and dates[key] != value:
+                ambiguous = True
+            dates[key] = value
+
+    return dates, spans, ambiguous
+
+
+def extract_metadata(
+    question: str, has_history: bool = False
+) -> Tuple[PromptMetadata, float]:
+    confidence = 1.0
+    if has_history and FOLLOW_UP_PATTERN.search(question):
+        confidence -= 0.5
+
+    # date phrases are pulled out first so "completed before 2019" is not
+    # also read as the COMPLETED status
+    dates, spans, dates_ambiguous = extract_dates(question)
+    if dates_ambiguous:
+        confidence -= 0.4
+    remaining = question
+    for start, end in reversed(spans):
+        remaining = f"{remaining[:start]} {remaining[end:]}"
+
+    found: Dict[str, list] = {}
+    for field, table in COMPILED.items():
+        values = []
+        for pattern, value in table:
+            if pattern.search(remaining):
+                values.append(value)
+                remaining = pattern.sub(" ", remaining)
+        found[field] = values
+
+    # checked on what the tables didn't consume, so "not yet recruiting" or
+    # "no masking" don't read as negations
+    if AMBIGUITY_PATTERN.search(remaining):
+        confidence -= 0.4
+
+    # "men and women" means no restriction rather than two exclusive filters
+    if len(found["sex"]) > 1:
+        found["sex"] = []
+
+    nct_ids = sorted({m.upper() for m in NCT_PATTERN.findall(question)})
+    # an empty filter at full confidence would skip the LLM for every question
+    # the tables don't cover
+    if not (nct_ids or dates or any(found.values())):
+        confidence -= 0.5
+
+    metadata = PromptMetadata(
+        nctId=nct_ids,
+        startDateBefore=dates.get("startDateBefore"),
+        startDateAfter=dates.get("startDateAfter"),
+        completionDateBefore=dates.get("completionDateBefore"),
+        completionDateAfter=dates.get("completionDateAfter"),
+        **found,
+    )
+    return metadata, max(confidence, 0.0)
@@ -0,0 +1,41 @@
+from typing import Any
+
+# the serving hosts are CPU-only and a question is one short text, so the
+# fp32 forward pass is mostly Linear layers waiting on memory bandwidth.
+# Dynamic int8 quantization stores those weights as int8 and quantizes
+# activations on the fly; the vectors stay in the fp32 index's space closely
+# enough to search it (bench_query_encoder measures how closely)
+
+EMBEDDING_BACKENDS = ("fp32", "int8")
+
+
+def load_query_encoder(model_name: str, backend: str = "fp32", threads: int = 0) -> Any:
+    # torch and sentence-transformers are most of the import time, so they
+    # only come in with the model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.classes.__path__ = []
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend}")
+    # intra-op threads are per process; 0 keeps torch's default (all cores)
+    if threads:
+        torch.set_num_threads(threads)
+
+    if backend == "fp32":
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        return SentenceTransformer(model_name, device=device)
+
+    # quantized kernels only exist for CPU
+    model = SentenceTransformer(model_name, device="cpu")
+    model.eval()
+    torch.ao.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+    )
+    return model
+
+
+def cache_name(model_name: str, backend: str) -> str:
+    # int8 vectors are close to fp32 but not equal, so they get their own
+    # embedding cache entries
+    return model_name if backend == "fp32" else f"{model_name}:{backend}"
@@ -0,0 +1,646 @@
+import argparse
+import asyncio
+import json
+import os
+import numpy as np
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from pymongo.collection import Collection
+from preprocessing.chunk_store import iter_chunks, new_run_id, to_bson_vector
+
+LOCAL_INDEX_PATH = os.path.join("preprocessing", "trial_data", "local_index")
+DATE_FIELDS = {"startDate", "completionDate"}
+MISSING_DATE = np.iinfo(np.int64).min
+BLOCK_ROWS = 65536
+SECTION_ORDER = [
+    "overview",
+    "design",
+    "eligibility",
+    "conditions",
+    "armsInterventions",
+    "primaryOutcomes",
+    "secondaryOutcomes",
+]
+RECORD_FIELDS = {"_id": 0, "source_id": 1, "section": 1, "text": 1}
+
+
+class RetrievalBackend(ABC):
+    @abstractmethod
+    def search(
+        self, query_vector: Sequence[float], filter: Dict[str, Any], limit: int
+    ) -> List[Dict[str, Any]]: ...
+
+    async def asearch(
+        self, query_vector: Sequence[float], filter: Dict[str, Any], limit: int
+    ) -> List[Dict[str, Any]]:
+        # backends without a native async driver run the blocking search in a thread
+        return await asyncio.to_thread(self.search, query_vector, filter, limit)
+
+    @abstractmethod
+    def fetch_sections(self, keys: List[Tuple[str, str]]) -> List[Dict[str, Any]]: ...
+
+    async def afetch_sections(
+        self, keys: List[Tuple[str, str]]
+    ) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.fetch_sections, keys)
+
+    def ingest_run_id(self) -> Optional[str]:
+        return None
+
+
+class MongoVectorSearch(RetrievalBackend):
+    def __init__(
+        self,
+        collection: Collection,
+        index_name: str,
+        exact: bool = True,
+        num_candidates: int = 150,
+        vector_format: str = "float32",
+        async_collection: Optional[Any] = None,
+    ):
+        self.collection = collection
+        self.async_collection = async_collection
+        self.index_name = index_name
+        self.exact = exact
+        self.num_candidates = num_candidates
+        self.vector_format = vector_format
+
+    def pipeline(
+        self, query_vector: Sequence[float], filter: Dict[str, Any], limit: int
+    ) -> List[Dict[str, Any]]:
+        vector_search: Dict[str, Any] = {
+            "index": self.index_name,
+            "path": "embeddings",
+            # int8-quantized collections are queried with an int8 vector too
+            "queryVector": (
+                to_bson_vector(query_vector, "int8")
+                if self.vector_format == "int8"
+                else list(query_vector)
+            ),
+            "exact": self.exact,
+            "limit": limit,
+            "filter": filter,
+        }
+        if not self.exact:
+            vector_search["numCandidates"] = max(self.num_candidates, limit)
+
+        return [
+            {"$vectorSearch": vector_search},
+            {
+                "$project": {
+                    **RECORD_FIELDS,
+                    "score": {"$meta": "vectorSearchScore"},
+                }
+            },
+        ]
+
+    def search(
+        self, query_vector: Sequence[float], filter: Dict[str, Any], limit: int
+    ) -> List[Dict[str, Any]]:
+        return list(
+            self.collection.aggregate(self.pipeline(query_vector, filter, limit))
+        )
+
+    async def asearch(
+        self, query_vector: Sequence[float], filter: Dict[str, Any], limit: int
+    ) -> List[Dict[str, Any]]:
+        if self.async_collection is None:
+            return await super().asearch(query_vector, filter, limit)
+        cursor = await self.async_collection.aggregate(
+            self.pipeline(query_vector, filter, limit)
+        )
+        return await cursor.to_list()
+
+    def sections_query(self, keys: List[Tuple[str, str]]) -> Dict[str, Any]:
+        # one $in per field rides the unique (source_id, section) index; the
+        # cross product can over-match, so callers keep only the pairs they asked for
+        return {
+            "source_id": {"$in": sorted({source_id for source_id, _ in keys})},
+            "section": {"$in": sorted({section for _, section in keys})},
+        }
+
+    def fetch_sections(self, keys: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        return list(self.collection.find(self.sections_query(keys), RECORD_FIELDS))
+
+    async def afetch_sections(
+        self, keys: List[Tuple[str, str]]
+    ) -> List[Dict[str, Any]]:
+        if self.async_collection is None:
+            return await super().afetch_sections(keys)
+        cursor = self.async_collection.find(self.sections_query(keys), RECORD_FIELDS)
+        return await cursor.to_list()
+
+    def ingest_run_id(self) -> Optional[str]:
+        meta = self.collection.database[f"{self.collection.name}_meta"].find_one(
+            {"_id": "ingest"}
+        )
+        return meta.get("run_id") if meta else None
+
+
+def parse_date(date_str: Optional[str]) -> Optional[datetime]:
+    if not date_str:
+        return None
+    if len(date_str) == 7:
+        date_str += "-01"
+    elif len(date_str) == 4:
+        date_str += "-01-01"
+    try:
+        return datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def to_days(value: Optional[datetime]) -> int:
+    if value is None:
+        return MISSING_DATE
+    return int(np.datetime64(value.replace(tzinfo=None), "D").astype(np.int64))
+
+
+class ColumnStore:
+    # chunk records plus metadata as a set of parallel columns: int codes for
+    # single values, bitmasks for lists, day numbers for dates and floats for
+    # counts. Answers the graph's Mongo-style filters as boolean row masks
+    def __init__(self, path: str):
+        with open(os.path.join(path, "store.json"), "r") as infile:
+            self.spec: Dict[str, Any] = json.load(infile)
+
+        self.columns: Dict[str, np.ndarray] = {
+            field: np.load(os.path.join(path, f"col_{field}.npy"), mmap_mode="r")
+            for field in self.spec["fields"]
+        }
+        self.vocab: Dict[str, Dict[Any, int]] = {
+            field: {value: code for code, value in enumerate(values)}
+            for field, values in self.spec["vocab"].items()
+        }
+
+        with open(os.path.join(path, "records.jsonl"), "r") as infile:
+            self.records: List[Dict[str, str]] = [json.loads(line) for line in infile]
+
+        self.masks: Dict[Tuple[str, Any], np.ndarray] = {}
+        for field, kind in self.spec["fields"].items():
+            if kind == "multi" or (
+                kind == "categorical"
+                and len(self.vocab[field]) <= self.spec["mask_max_vocab"]
+            ):
+                for value in self.vocab[field]:
+                    self.masks[(field, value)] = self.value_mask(field, value)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def fetch_sections(self, keys: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        if not hasattr(self, "row_of"):
+            self.row_of = {
+                (record["source_id"], record["section"]): row
+                for row, record in enumerate(self.records)
+            }
+        return [self.records[self.row_of[key]] for key in keys if key in self.row_of]
+
+    def value_mask(self, field: str, value: Any) -> np.ndarray:
+        if (field, value) in self.masks:
+            return self.masks[(field, value)]
+
+        kind = self.spec["fields"][field]
+        column = self.columns[field]
+        code = self.vocab.get(field, {}).get(value)
+
+        if kind == "categorical":
+            if code is None:
+                return np.zeros(len(self), dtype=bool)
+            return column == code
+        if kind == "multi":
+            if code is None:
+                return np.zeros(len(self), dtype=bool)
+            return (column & np.uint64(1 << code)) != 0
+        if kind == "date":
+            return column == to_days(value)
+        return column == value
+
+    def range_mask(self, field: str, op: str, value: Any) -> np.ndarray:
+        kind = self.spec["fields"][field]
+        column = self.columns[field]
+
+        if kind == "date":
+            bound = to_days(value)
+            present = column != MISSING_DATE
+        elif kind == "numeric":
+            bound = value
+            present = ~np.isnan(column)
+        else:
+            raise ValueError(f"Range filter on non-ordered field {field}")
+
+        compare = {
+            "$lt": np.less,
+            "$lte": np.less_equal,
+            "$gt": np.greater,
+            "$gte": np.greater_equal,
+        }[op]
+        return present & compare(column, bound)
+
+    def filter_mask(self, filter: Dict[str, Any]) -> Optional[np.ndarray]:
+        mask: Optional[np.ndarray] = None
+
+        for path, condition in filter.items():
+            field = path.removeprefix("metadata.")
+            if field not in self.spec["fields"]:
+                raise ValueError(f"Unsupported filter field {path}")
+
+            if isinstance(condition, dict):
+                parts = []
+                for op, value in condition.items():
+                    if op == "$in":
+                        parts.append(
+                            np.logical_or.reduce(
+                                [self.value_mask(field, v) for v in value]
+                                or [np.zeros(len(self), dtype=bool)]
+                            )
+                        )
+                    elif op == "$eq":
+                        parts.append(self.value_mask(field, value))
+                    elif op in ("$lt", "$lte", "$gt", "$gte"):
+                        parts.append(self.range_mask(field, op, value))
+                    else:
+                        raise ValueError(f"Unsupported filter operator {op}")
+                field_mask = np.logical_and.reduce(parts)
+            else:
+                field_mask = self.value_mask(field, condition)
+
+            mask = field_mask if mask is None else mask & field_mask
+
+        return mask
+
+
+class LocalVectorSearch(ColumnStore, RetrievalBackend):
+    # embeddings live in one memory-mapped, row-normalised matrix next to the
+    # metadata columns. With exact=False an IVF index (spherical k-means lists)
+    # narrows the scan to the closest lists
+    def __init__(
+        self,
+        path: str = LOCAL_INDEX_PATH,
+        exact: bool = True,
+        num_candidates: int = 150,
+    ):
+        super().__init__(path)
+        self.exact = exact
+        self.num_candidates = num_candidates
+        self.embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+
+        self.ivf: Optional[Dict[str, np.ndarray]] = None
+        if not exact:
+            if not self.spec.get("ivf_lists"):
+                raise ValueError(f"No IVF index in {path}; rebuild with --ivf-lists")
+            self.ivf = {
+                part: np.load(os.path.join(path, f"ivf_{part}.npy"), mmap_mode="r")
+                for part in ("centroids", "offsets", "rows")
+            }
+
+    def ingest_run_id(self) -> Optional[str]:
+        # the index is loaded once, so the run that matters is the one in memory
+        return self.spec.get("run_id")
+
+    def similarities(self, query: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        # blocked so a float16 matrix is upcast a slice at a time, not all at once
+        total = len(self) if rows is None else len(rows)
+        sims = np.empty(total, dtype=np.float32)
+        for start in range(0, total, BLOCK_ROWS):
+            end = min(start + BLOCK_ROWS, total)
+            block = (
+                self.embeddings[start:end]
+                if rows is None
+                else self.embeddings[rows[start:end]]
+            )
+            sims[start:end] = block.astype(np.float32, copy=False) @ query
+        return sims
+
+    def ivf_candidates(
+        self, query: np.ndarray, mask: Optional[np.ndarray], limit: int
+    ) -> np.ndarray:
+        # probe lists nearest-first until enough rows pass the pre-filter; a very
+        # selective filter degrades gracefully into an exact scan of its rows
+        centroids, offsets, rows = (
+            self.ivf["centroids"],
+            self.ivf["offsets"],
+            self.ivf["rows"],
+        )
+        wanted = max(self.num_candidates, limit)
+        picked, count = [], 0
+
+        for lst in np.argsort(-(centroids @ query)):
+            members = rows[offsets[lst] : offsets[lst + 1]]
+            if mask is not None:
+                members = members[mask[members]]
+            picked.append(members)
+            count += len(members)
+            if count >= wanted:
+                break
+
+        if not picked:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(picked))
+
+    def search(
+        self, query_vector: Sequence[float], filter: Dict[str, Any], limit: int
+    ) -> List[Dict[str, Any]]:
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        mask = self.filter_mask(filter)
+        if self.ivf is not None:
+            rows = self.ivf_candidates(query, mask, limit)
+        else:
+            rows = None if mask is None else np.flatnonzero(mask)
+        sims = self.similarities(query, rows)
+
+        k = min(limit, len(sims))
+        if k == 0:
+            return []
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top], kind="stable")]
+        ids = top if rows is None else rows[top]
+
+        # same scale as Atlas' cosine vectorSearchScore
+        return [
+            {**self.records[i], "score": float((1.0 + sims[t]) / 2.0)}
+            for i, t in zip(ids, top)
+        ]
+
+
+def group_trials(
+    results: List[Dict[str, Any]], trial_limit: int, hit_bonus: float = 0.05
+) -> List[Dict[str, Any]]:
+    # a trial scores as its best chunk, raised a little for every other section
+    # that matched so broad matches edge out single lucky hits; relative, since
+    # fused rank scores and cosine scores live on very different scales
+    bundles: Dict[str, Dict[str, Any]] = {}
+    for doc in results:
+        bundle = bundles.setdefault(
+            doc["source_id"], {"source_id": doc["source_id"], "chunks": []}
+        )
+        bundle["chunks"].append(doc)
+
+    for bundle in bundles.values():
+        scores = sorted((float(doc["score"]) for doc in bundle["chunks"]), reverse=True)
+        bundle["score"] = scores[0] * (1 + hit_bonus * (len(scores) - 1))
+
+    ranked = sorted(bundles.values(), key=lambda b: b["score"], reverse=True)
+    return ranked[:trial_limit]
+
+
+def missing_sections(
+    bundles: List[Dict[str, Any]], sections: List[str]
+) -> List[Tuple[str, str]]:
+    return [
+        (bundle["source_id"], section)
+        for bundle in bundles
+        for section in sections
+        if section not in {doc["section"] for doc in bundle["chunks"]}
+    ]
+
+
+def attach_sections(
+    bundles: List[Dict[str, Any]], fetched: List[Dict[str, Any]], sections: List[str]
+) -> List[Dict[str, Any]]:
+    # matched chunks stay first in score order; prefetched siblings follow in
+    # document order, so a tight token budget trims siblings before hits
+    wanted = set(sections)
+    by_trial: Dict[str, List[Dict[str, Any]]] = {}
+    for doc in fetched:
+        if doc["section"] in wanted:
+            by_trial.setdefault(doc["source_id"], []).append(doc)
+
+    for bundle in bundles:
+        have = {doc["section"] for doc in bundle["chunks"]}
+        siblings = [
+            doc
+            for doc in by_trial.get(bundle["source_id"], [])
+            if doc["section"] not in have
+        ]
+        siblings.sort(
+            key=lambda doc: (
+                SECTION_ORDER.index(doc["section"])
+                if doc["section"] in SECTION_ORDER
+                else len(SECTION_ORDER)
+            )
+        )
+        bundle["chunks"] = (
+            sorted(bundle["chunks"], key=lambda doc: float(doc["score"]), reverse=True)
+            + siblings
+        )
+    return bundles
+
+
+def train_ivf(
+    matrix: np.ndarray,
+    n_lists: int,
+    iterations: int = 10,
+    sample_size: int = 50000,
+    seed: int = 0,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    n_lists = max(1, min(n_lists, len(matrix)))
+    sample = matrix[
+        rng.choice(len(matrix), min(sample_size, len(matrix)), replace=False)
+    ].astype(np.float32)
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+
+    def assign(vectors: np.ndarray) -> np.ndarray:
+        labels = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), BLOCK_ROWS):
+            block = vectors[start : start + BLOCK_ROWS].astype(np.float32, copy=False)
+            labels[start : start + BLOCK_ROWS] = np.argmax(block @ centroids.T, axis=1)
+        return labels
+
+    for _ in range(iterations):
+        labels = assign(sample)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=n_lists)
+
+        empty = counts == 0
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.where(norms == 0, 1.0, norms)
+
+    labels = assign(matrix)
+    rows = np.argsort(labels, kind="stable")
+    offsets = np.searchsorted(labels[rows], np.arange(n_lists + 1))
+    return centroids.astype(np.float32), offsets.astype(np.int64), rows.astype(np.int64)
+
+
+def column_kind(field: str, values: List[Any]) -> str:
+    if field in DATE_FIELDS:
+        return "date"
+    present = [v for v in values if v is not None]
+    if any(isinstance(v, list) for v in present):
+        return "multi"
+    if present and all(
+        isinstance(v, (int, float)) and not isinstance(v, bool) for v in present
+    ):
+        return "numeric"
+    return "categorical"
+
+
+def append_record(
+    records: List[Dict[str, str]], metadata: Dict[str, List[Any]], chunk: Dict[str, Any]
+) -> None:
+    records.append(
+        {
+            "source_id": chunk["source_id"],
+            "section": chunk["section"],
+            "text": chunk["text"],
+        }
+    )
+    for field, value in chunk["metadata"].items():
+        metadata.setdefault(field, [None] * (len(records) - 1)).append(value)
+    for column in metadata.values():
+        if len(column) < len(records):
+            column.append(None)
+
+
+def read_chunks(
+    data_path: str,
+) -> Tuple[np.ndarray, List[Dict[str, str]], Dict[str, List[Any]]]:
+    records, vectors = [], []
+    metadata: Dict[str, List[Any]] = {}
+
+    for chunk, vector in iter_chunks(data_path):
+        append_record(records, metadata, chunk)
+        vectors.append(vector)
+
+    return np.asarray(vectors, dtype=np.float32), records, metadata
+
+
+def read_records(data_path: str) -> Tuple[List[Dict[str, str]], Dict[str, List[Any]]]:
+    # like read_chunks, for indexes that never touch the vectors
+    records: List[Dict[str, str]] = []
+    metadata: Dict[str, List[Any]] = {}
+    for chunk, _ in iter_chunks(data_path):
+        append_record(records, metadata, chunk)
+    return records, metadata
+
+
+def write_store(
+    out_path: str,
+    records: List[Dict[str, str]],
+    metadata: Dict[str, List[Any]],
+    mask_max_vocab: int = 64,
+    **spec: Any,
+) -> int:
+    # the ColumnStore half of an index: metadata columns, records and store.json,
+    # with any index-specific settings merged into the spec
+    os.makedirs(out_path, exist_ok=True)
+
+    fields: Dict[str, str] = {}
+    vocab: Dict[str, List[Any]] = {}
+    for field, values in metadata.items():
+        kind = column_kind(field, values)
+        fields[field] = kind
+
+        if kind == "date":
+            column = np.array([to_days(parse_date(v)) for v in values], dtype=np.int64)
+        elif kind == "numeric":
+            column = np.array(
+                [np.nan if v is None else v for v in values], dtype=np.float64
+            )
+        else:
+            flat = [
+                x
+                for v in values
+                if v is not None
+                for x in (v if kind == "multi" else [v])
+            ]
+            vocab[field] = sorted(set(flat), key=str)
+            codes = {value: code for code, value in enumerate(vocab[field])}
+            if kind == "multi":
+                if len(codes) > 64:
+                    raise ValueError(f"Too many distinct values in list field {field}")
+                column = np.array(
+                    [sum(1 << codes[x] for x in set(v or [])) for v in values],
+                    dtype=np.uint64,
+                )
+            else:
+                column = np.array(
+                    [-1 if v is None else codes[v] for v in values], dtype=np.int32
+                )
+
+        np.save(os.path.join(out_path, f"col_{field}.npy"), column)
+
+    with open(os.path.join(out_path, "records.jsonl"), "w") as outfile:
+        for record in records:
+            json.dump(record, outfile)
+            outfile.write("\n")
+
+    with open(os.path.join(out_path, "store.json"), "w") as outfile:
+        json.dump(
+            {
+                "count": len(records),
+                "fields": fields,
+                "vocab": vocab,
+                "mask_max_vocab": mask_max_vocab,
+                "run_id": new_run_id(),
+                **spec,
+            },
+            outfile,
+        )
+
+    return len(records)
+
+
+def write_local_index(
+    out_path: str,
+    matrix: np.ndarray,
+    records: List[Dict[str, str]],
+    metadata: Dict[str, List[Any]],
+    dtype: str = "float32",
+    ivf_lists: int = 0,
+    mask_max_vocab: int = 64,
+) -> int:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms == 0, 1.0, norms)
+
+    os.makedirs(out_path, exist_ok=True)
+    np.save(os.path.join(out_path, "embeddings.npy"), matrix.astype(dtype))
+
+    if ivf_lists:
+        centroids, offsets, rows = train_ivf(matrix, ivf_lists)
+        ivf_lists = len(centroids)
+        np.save(os.path.join(out_path, "ivf_centroids.npy"), centroids)
+        np.save(os.path.join(out_path, "ivf_offsets.npy"), offsets)
+        np.save(os.path.join(out_path, "ivf_rows.npy"), rows)
+
+    return write_store(
+        out_path,
+        records,
+        metadata,
+        mask_max_vocab,
+        dim=int(matrix.shape[1]) if len(records) else 0,
+        dtype=dtype,
+        ivf_lists=ivf_lists,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--data-path",
+        default=os.path.join("preprocessing", "trial_data", "trials.jsonl"),
+    )
+    parser.add_argument("--out-path", default=LOCAL_INDEX_PATH)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument(
+        "--ivf-lists",
+        type=int,
+        default=-1,
+        help="IVF lists for approximate search (-1 = sqrt(chunks), 0 = none)",
+    )
+    args = parser.parse_args()
+
+    matrix, records, metadata = read_chunks(args.data_path)
+    ivf_lists = int(np.sqrt(len(records))) if args.ivf_lists < 0 else args.ivf_lists
+    count = write_local_index(
+        args.out_path, matrix, records, metadata, args.dtype, ivf_lists
+    )
+    print(f"[INFO] Built local index with {count} chunks at {args.out_path}")
@@ -0,0 +1,60 @@
+import asyncio
+import sys
+from typing import Dict, Optional
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph_flow import graph_nodes, tracing
+from langgraph_flow.graph_pipeline import assemble_graph
+from langgraph_flow.session_store import SessionCheckpointer
+from langgraph_flow.state_schema import turn_state
+
+MAX_CONCURRENT_TURNS = 64
+
+
+class SessionServer:
+    # one compiled async graph and checkpointer serve every conversation; each
+    # session is a thread_id, and turns from different sessions interleave on
+    # the event loop while they wait on OpenAI and Mongo
+    def __init__(
+        self,
+        memory: Optional[BaseCheckpointSaver] = None,
+        max_concurrent_turns: int = MAX_CONCURRENT_TURNS,
+    ):
+        self.graph = assemble_graph(
+            memory=memory or SessionCheckpointer(), use_async=True
+        )
+        self.slots = asyncio.Semaphore(max_concurrent_turns)
+        # the first turn would otherwise load the tokenizer inside a node
+        graph_nodes.shared("token_counter")
+
+    async def ask(self, session_id: str, question: str) -> str:
+        config = {"configurable": {"thread_id": session_id}}
+        async with self.slots:
+            with tracing.turn(session_id):
+                state = await self.graph.ainvoke(turn_state(question), config)
+        return state["response"]
+
+
+async def serve_lines(server: SessionServer) -> None:
+    # stdin lines are "<session id>\t<question>"; turns of one session run in
+    # order, different sessions run concurrently
+    sessions: Dict[str, asyncio.Task] = {}
+
+    async def answer(previous: Optional[asyncio.Task], session_id: str, question: str):
+        if previous is not None:
+            await previous
+        response = await server.ask(session_id, question)
+        print(f"{session_id}\t{response!r}", flush=True)
+
+    while line := await asyncio.to_thread(sys.stdin.readline):
+        if not line.strip():
+            continue
+        session_id, _, question = line.rstrip("\n").partition("\t")
+        sessions[session_id] = asyncio.create_task(
+            answer(sessions.get(session_id), session_id, question)
+        )
+
+    await asyncio.gather(*sessions.values())
+
+
+if __name__ == "__main__":
+    asyncio.run(serve_lines(SessionServer()))
@@ -0,0 +1,421 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+
+STORE_PATH = os.getenv("SESSION_STORE_PATH", os.path.join(".cache", "sessions.sqlite"))
+MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "20"))
+IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "3600"))
+MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+EVICT_INTERVAL = 60.0
+# smaller values cost more to compress than they save
+COMPRESS_MIN_BYTES = 512
+
+
+def turn_trims(max_messages: int) -> Dict[str, Callable[[Any], Any]]:
+    # what is stored is what the next turn needs: the recent conversation.
+    # Retrieved context and the question vector are rebuilt every turn, and
+    # turn_state resets them before any node reads them
+    return {
+        "memory": lambda messages: list(messages)[-max_messages:],
+        "context": lambda _: [],
+        "query_embedding": lambda _: None,
+    }
+
+
+class SessionCheckpointer(BaseCheckpointSaver):
+    # a checkpointer that keeps one row per session instead of every step's
+    # history: the latest checkpoint, its channel values (only the changed
+    # ones are rewritten on each put) and its pending writes, all looked up by
+    # primary key. Sessions idle past the TTL, or beyond the session cap, are
+    # dropped, so the store stays bounded however many users come and go
+    def __init__(
+        self,
+        path: Optional[str] = STORE_PATH,
+        max_messages: int = MAX_MESSAGES,
+        idle_seconds: float = IDLE_SECONDS,
+        max_sessions: int = MAX_SESSIONS,
+        trims: Optional[Dict[str, Callable[[Any], Any]]] = None,
+    ):
+        super().__init__()
+        self.idle_seconds = idle_seconds
+        self.max_sessions = max_sessions
+        self.trims = turn_trims(max_messages) if trims is None else trims
+        self.lock = threading.Lock()
+        self.evicted_at = time.time()
+        self.counters = {"gets": 0, "puts": 0, "channel_writes": 0, "evicted": 0}
+
+        # an empty path keeps the store in-process (still bounded)
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(
+            path or ":memory:", check_same_thread=False, isolation_level=None
+        )
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints "
+            "(thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL,"
+            " checkpoint_id TEXT NOT NULL, parent_id TEXT,"
+            " type TEXT NOT NULL, checkpoint BLOB NOT NULL,"
+            " metadata_type TEXT NOT NULL, metadata BLOB NOT NULL,"
+            " updated REAL NOT NULL, PRIMARY KEY (thread_id, checkpoint_ns)) "
+            "WITHOUT ROWID"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS checkpoints_updated ON checkpoints (updated)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS channels "
+            "(thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL,"
+            " channel TEXT NOT NULL, type TEXT NOT NULL, value BLOB NOT NULL,"
+            " PRIMARY KEY (thread_id, checkpoint_ns, channel)) WITHOUT ROWID"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS writes "
+            "(thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL,"
+            " checkpoint_id TEXT NOT NULL, task_id TEXT NOT NULL, idx INTEGER NOT NULL,"
+            " channel TEXT NOT NULL, type TEXT NOT NULL, value BLOB NOT NULL,"
+            " task_path TEXT NOT NULL DEFAULT '',"
+            " PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)) "
+            "WITHOUT ROWID"
+        )
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        self.db.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    def pack(self, value: Any) -> Tuple[str, bytes]:
+        kind, data = self.serde.dumps_typed(value)
+        if len(data) >= COMPRESS_MIN_BYTES:
+            return f"{kind}+zlib", zlib.compress(data, 1)
+        return kind, data
+
+    def unpack(self, kind: str, data: bytes) -> Any:
+        if kind.endswith("+zlib"):
+            kind, data = kind[: -len("+zlib")], zlib.decompress(data)
+        return self.serde.loads_typed((kind, data))
+
+    def load_tuple(self, row: Tuple) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_id = row[:4]
+        checkpoint = self.unpack(row[4], row[5])
+        channels = self.db.execute(
+            "SELECT channel, type, value FROM channels"
+            " WHERE thread_id = ? AND checkpoint_ns = ?",
+            (thread_id, checkpoint_ns),
+        ).fetchall()
+        writes = self.db.execute(
+            "SELECT task_id, channel, type, value FROM writes"
+            " WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?"
+            " ORDER BY task_path, task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+
+        def config(checkpoint_id: str) -> RunnableConfig:
+            return {
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            }
+
+        versions = checkpoint["channel_versions"]
+        return CheckpointTuple(
+            config=config(checkpoint_id),
+            checkpoint={
+                **checkpoint,
+                "channel_values": {
+                    channel: self.unpack(kind, value)
+                    for channel, kind, value in channels
+                    if channel in versions
+                },
+            },
+            metadata=self.unpack(row[6], row[7]),
+            # only the latest checkpoint is kept, so the parent is a marker
+            # for langgraph rather than something get_tuple can return
+            parent_config=config(parent_id) if parent_id else None,
+            pending_writes=[
+                (task_id, channel, self.unpack(kind, value))
+                for task_id, channel, kind, value in writes
+            ],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self.lock:
+            self.counters["gets"] += 1
+            row = self.db.execute(
+                "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, type,"
+                " checkpoint, metadata_type, metadata FROM checkpoints"
+                " WHERE thread_id = ? AND checkpoint_ns = ?",
+                (thread_id, checkpoint_ns),
+            ).fetchone()
+            if row is None:
+                return None
+            checkpoint_id = get_checkpoint_id(config)
+            if checkpoint_id and checkpoint_id != row[2]:
+                return None
+            return self.load_tuple(row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, type,"
+            " checkpoint, metadata_type, metadata FROM checkpoints"
+        )
+        clauses: List[str] = []
+        params: List[Any] = []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if "checkpoint_ns" in config["configurable"]:
+                clauses.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+
+        with self.lock:
+            rows = self.db.execute(
+                query + " ORDER BY checkpoint_id DESC", params
+            ).fetchall()
+            results = []
+            for row in rows:
+                if limit is not None and len(results) >= limit:
+                    break
+                found = self.load_tuple(row)
+                if filter and any(
+                    found.metadata.get(key) != value for key, value in filter.items()
+                ):
+                    continue
+                results.append(found)
+        yield from results
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        stored = {k: v for k, v in checkpoint.items() if k != "channel_values"}
+        values = checkpoint["channel_values"]
+
+        # unchanged channels keep their rows; changed ones are trimmed and
+        # rewritten, and channels that were emptied lose theirs
+        upserts, deletes = [], []
+        for channel in new_versions:
+            if channel in values:
+                value = values[channel]
+                if channel in self.trims:
+                    value = self.trims[channel](value)
+                upserts.append((thread_id, checkpoint_ns, channel, *self.pack(value)))
+            else:
+                deletes.append((thread_id, checkpoint_ns, channel))
+
+        with self.lock:
+            self.counters["puts"] += 1
+            self.counters["channel_writes"] += len(upserts)
+            with self.transaction():
+                self.db.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        thread_id,
+                        checkpoint_ns,
+                        checkpoint["id"],
+                        config["configurable"].get("checkpoint_id"),
+                        *self.pack(stored),
+                        *self.pack(metadata),
+                        time.time(),
+                    ),
+                )
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO channels VALUES (?, ?, ?, ?, ?)", upserts
+                )
+                self.db.executemany(
+                    "DELETE FROM channels"
+                    " WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ?",
+                    deletes,
+                )
+                # writes belong to one checkpoint; the previous one's are done with
+                self.db.execute(
+                    "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ?"
+                    " AND checkpoint_id != ?",
+                    (thread_id, checkpoint_ns, checkpoint["id"]),
+                )
+
+            if time.time() - self.evicted_at >= EVICT_INTERVAL:
+                self.evict()
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = [
+            (
+                thread_id,
+                checkpoint_ns,
+                checkpoint_id,
+                task_id,
+                WRITES_IDX_MAP.get(channel, idx),
+                channel,
+                *self.pack(value),
+                task_path,
+            )
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        # special writes (errors, interrupts) replace earlier ones; regular
+        # writes are kept from the first attempt, as in langgraph's savers
+        verb = (
+            "INSERT OR REPLACE"
+            if all(channel in WRITES_IDX_MAP for channel, _ in writes)
+            else "INSERT OR IGNORE"
+        )
+        with self.lock:
+            self.db.executemany(
+                f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.lock:
+            self.delete_threads([thread_id])
+
+    def delete_threads(self, thread_ids: List[str]) -> None:
+        with self.transaction():
+            for table in ("checkpoints", "channels", "writes"):
+                self.db.executemany(
+                    f"DELETE FROM {table} WHERE thread_id = ?",
+                    [(thread_id,) for thread_id in thread_ids],
+                )
+
+    def evict(self) -> int:
+        # idle sessions first, then the least recently used beyond the cap
+        self.evicted_at = time.time()
+        expired = [
+            thread_id
+            for (thread_id,) in self.db.execute(
+                "SELECT DISTINCT thread_id FROM checkpoints WHERE updated < ?",
+                (self.evicted_at - self.idle_seconds,),
+            )
+        ]
+        active = self.db.execute(
+            "SELECT COUNT(DISTINCT thread_id) FROM checkpoints"
+        ).fetchone()[0] - len(expired)
+        if active > self.max_sessions:
+            expired += [
+                thread_id
+                for (thread_id,) in self.db.execute(
+                    "SELECT thread_id FROM checkpoints WHERE updated >= ?"
+                    " GROUP BY thread_id ORDER BY MAX(updated) LIMIT ?",
+                    (self.evicted_at - self.idle_seconds, active - self.max_sessions),
+                )
+            ]
+        if expired:
+            self.delete_threads(expired)
+            self.counters["evicted"] += len(expired)
+        return len(expired)
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            sessions = self.db.execute(
+                "SELECT COUNT(DISTINCT thread_id) FROM checkpoints"
+            ).fetchone()[0]
+            stored_bytes = self.db.execute(
+                "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM channels"
+            ).fetchone()[0]
+            return {
+                **self.counters,
+                "sessions": sessions,
+                "channel_bytes": stored_bytes,
+            }
+
+    # sqlite calls are short, but they still go to a thread so a busy disk
+    # never stalls the event loop serving other sessions
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ):
+        found = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in found:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(
+            self.put, config, checkpoint, metadata, new_versions
+        )
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
@@ -83,8 +83,27 @@ class State(TypedDict):
     question: str
     metadata: Dict[str, Any]
     filter: Dict[str, Any]
+    query_embedding: Optional[List[float]]
     context: List[str]
     recent_context: str
     memory: Annotated[List, add_messages]
     error: Optional[str]
     response: Optional[str]
+    cache_hit: Optional[bool]
+
+
+def turn_state(question: str) -> Dict[str, Any]:
+    # per-turn fields are reset; "memory" goes through add_messages, so an
+    # empty list leaves the checkpointed history alone
+    return {
+        "question": question,
+        "memory": [],
+        "metadata": {},
+        "filter": {},
+        "query_embedding": None,
+        "context": [],
+        "response": "",
+        "error": "",
+        "recent_context": "",
+        "cache_hit": False,
+    }
@@ -0,0 +1,255 @@
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("applog")
+
+TRACING = os.getenv("TRACING", "false").lower() == "true"
+TRACE_PATH = os.getenv("TRACE_PATH", "traces.jsonl")
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(10 * 1024 * 1024)))
+TRACE_BACKUPS = int(os.getenv("TRACE_BACKUPS", "5"))
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# span fields the nodes fill in through add() and timer()
+TOKEN_FIELDS = ("prompt_tokens", "completion_tokens")
+IO_FIELDS = ("embed_s", "db_s")
+
+# the turn and node span being recorded; LangGraph runs every node in a copy
+# of the caller's context, so both are visible from worker threads and tasks
+current_turn = contextvars.ContextVar("current_turn", default=None)
+current_span = contextvars.ContextVar("current_span", default=None)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Metrics:
+    # just enough of the Prometheus text format for counters and histograms
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, List[Any]]] = {}
+
+    def inc(self, name: str, labels: Labels, value: float = 1.0) -> None:
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0.0) + value
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            # bucket counts are cumulative, as Prometheus expects
+            entry = series.setdefault(labels, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @staticmethod
+    def format_labels(labels: Labels, extra: str = "") -> str:
+        parts = [f'{key}="{value}"' for key, value in labels]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self.lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{self.format_labels(labels)} {value:g}")
+
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for labels, (counts, total, count) in sorted(series.items()):
+                    for bound, bucket in zip(self.buckets, counts):
+                        le = self.format_labels(labels, f'le="{bound:g}"')
+                        lines.append(f"{name}_bucket{le} {bucket}")
+                    inf = self.format_labels(labels, 'le="+Inf"')
+                    lines.append(f"{name}_bucket{inf} {count}")
+                    lines.append(f"{name}_sum{self.format_labels(labels)} {total:.6f}")
+                    lines.append(f"{name}_count{self.format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+trace_logger = logging.getLogger("tracelog")
+trace_logger.propagate = False
+setup_lock = threading.Lock()
+metrics_server: Optional[ThreadingHTTPServer] = None
+
+
+def write_trace(record: Dict[str, Any]) -> None:
+    # the file handler is only opened once something is traced
+    if not trace_logger.handlers:
+        with setup_lock:
+            if not trace_logger.handlers:
+                handler = RotatingFileHandler(
+                    TRACE_PATH, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUPS
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                trace_logger.addHandler(handler)
+                trace_logger.setLevel(logging.INFO)
+    trace_logger.info(json.dumps(record, default=str))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int = METRICS_PORT) -> None:
+    # idempotent, since streamlit reruns rebuild the graph
+    global metrics_server
+    with setup_lock:
+        if metrics_server is not None or not port:
+            return
+        try:
+            metrics_server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+        except OSError as e:
+            logger.debug(f"[TRACING][ERROR] metrics endpoint on :{port}: {e}")
+            return
+    threading.Thread(
+        target=metrics_server.serve_forever, name="metrics", daemon=True
+    ).start()
+    logger.info(f"[TRACING] metrics at http://0.0.0.0:{port}/metrics")
+
+
+def add(field: str, value: float) -> None:
+    span = current_span.get()
+    if span is not None:
+        span[field] = span.get(field, 0) + value
+
+
+@contextmanager
+def timer(field: str) -> Iterator[None]:
+    span = current_span.get()
+    if span is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        span[field] = span.get(field, 0.0) + time.perf_counter() - start
+
+
+def record_usage(response: Any) -> None:
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        add("prompt_tokens", usage.input_tokens)
+        add("completion_tokens", usage.output_tokens)
+
+
+def close_span(span: Dict[str, Any], wall_start: float, cpu_start: float) -> None:
+    # cpu_s is the node thread's CPU time; for async nodes that is the event
+    # loop thread, so it also counts whatever other tasks ran meanwhile
+    span["wall_s"] = time.perf_counter() - wall_start
+    span["cpu_s"] = time.thread_time() - cpu_start
+
+    node = (("node", span["node"]),)
+    metrics.observe("clinrag_node_seconds", node, span["wall_s"])
+    for field in TOKEN_FIELDS:
+        if field in span:
+            kind = field.split("_")[0]
+            metrics.inc(
+                "clinrag_openai_tokens_total", node + (("kind", kind),), span[field]
+            )
+    for field in IO_FIELDS:
+        if field in span:
+            io = (("io", field[:-2]),)
+            metrics.observe("clinrag_io_seconds", node + io, span[field])
+
+    turn = current_turn.get()
+    if turn is not None:
+        turn["nodes"].append(span)
+    else:
+        write_trace({"thread_id": None, "nodes": [span]})
+
+
+def trace_node(name: str, fn: Callable) -> Callable:
+    # tracing off hands the node back untouched, so it costs nothing
+    if not TRACING:
+        return fn
+    start_metrics_server()
+
+    # functools.wraps keeps the signature LangGraph inspects for "config"
+    if inspect.iscoroutinefunction(fn):
+
+        @functools.wraps(fn)
+        async def traced_async(*args, **kwargs):
+            span = {"node": name}
+            token = current_span.set(span)
+            wall_start, cpu_start = time.perf_counter(), time.thread_time()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                current_span.reset(token)
+                close_span(span, wall_start, cpu_start)
+
+        return traced_async
+
+    @functools.wraps(fn)
+    def traced(*args, **kwargs):
+        span = {"node": name}
+        token = current_span.set(span)
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            current_span.reset(token)
+            close_span(span, wall_start, cpu_start)
+
+    return traced
+
+
+@contextmanager
+def turn(thread_id: str) -> Iterator[Optional[Dict[str, Any]]]:
+    # one JSONL record per graph invocation, holding every node span it ran;
+    # inside a turn that is already being recorded, the outer record is kept
+    if not TRACING or current_turn.get() is not None:
+        yield current_turn.get()
+        return
+
+    record: Dict[str, Any] = {
+        "thread_id": thread_id,
+        "started": datetime.now(timezone.utc).isoformat(),
+        "nodes": [],
+    }
+    token = current_turn.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        current_turn.reset(token)
+        record["wall_s"] = time.perf_counter() - start
+        for field in TOKEN_FIELDS + IO_FIELDS + ("results",):
+            values = [span[field] for span in record["nodes"] if field in span]
+            if values:
+                record[field] = sum(values)
+        metrics.observe("clinrag_turn_seconds", (), record["wall_s"])
+        write_trace(record)
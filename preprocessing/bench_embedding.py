@@ -0,0 +1,58 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+from typing import List
+from chunking_utils import DEVICE, model
+
+DATA_PATH = os.path.join("preprocessing", "trial_data", "trials.jsonl")
+
+
+def load_texts(path: str, limit: int) -> List[str]:
+    texts = []
+    with open(path, "r") as trial_data:
+        for line in trial_data:
+            texts.append(json.loads(line)["text"])
+            if len(texts) >= limit:
+                break
+    return texts
+
+
+def time_per_text(texts: List[str]) -> np.ndarray:
+    start = time.perf_counter()
+    embeddings = np.stack([model.encode([text], device=DEVICE)[0] for text in texts])
+    elapsed = time.perf_counter() - start
+    print(f"[INFO] per-text: {len(texts) / elapsed:.1f} texts/sec ({elapsed:.2f}s)")
+    return embeddings
+
+
+def time_batched(texts: List[str], batch_size: int) -> np.ndarray:
+    start = time.perf_counter()
+    embeddings = model.encode(texts, batch_size=batch_size, device=DEVICE)
+    elapsed = time.perf_counter() - start
+    print(
+        f"[INFO] batched (batch_size={batch_size}): {len(texts) / elapsed:.1f} texts/sec ({elapsed:.2f}s)"
+    )
+    return embeddings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-path", default=DATA_PATH)
+    parser.add_argument("--limit", type=int, default=700)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 32, 64])
+    args = parser.parse_args()
+
+    texts = load_texts(args.data_path, args.limit)
+    print(f"[INFO] Benchmarking {len(texts)} chunk texts on {DEVICE}")
+
+    # warm up so model load and first-call allocation do not skew the numbers
+    model.encode(texts[:8], device=DEVICE)
+
+    baseline = time_per_text(texts)
+    for batch_size in args.batch_sizes:
+        batched = time_batched(texts, batch_size)
+        print(
+            f"\tmax abs diff vs per-text: {float(np.abs(batched - baseline).max()):.2e}"
+        )
@@ -0,0 +1,255 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import torch
+from typing import Any, Dict, List
+from chunk_store import ChunkWriter
+from chunking_utils import (
+    DEVICE,
+    EMBED_BATCH_SIZE,
+    build_chunk_texts,
+    model,
+    parse_data,
+)
+from fetch_and_chunk import EMBED_WINDOW, parse_query
+from schemas import Chunk
+from study_fetcher import BASE_URL, StudyFetcher
+
+# the ingest pipeline of fetch_and_chunk.py stage by stage, over raw study JSON
+# on disk instead of the API, so runs compare hardware and settings rather
+# than network conditions. Embeddings bypass the cache: it would hide the model
+
+FIXTURE_DIR = os.path.join("preprocessing", "bench_data", "studies")
+STAGES = ["read", "json", "parse_data", "text", "embed", "write"]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def load_study(path: str) -> Dict[str, Any]:
+    with open(path, "r") as infile:
+        return json.load(infile)
+
+
+def record_fixture(
+    fixture_dir: str, limit: int, query: Dict[str, str]
+) -> Dict[str, Any]:
+    # the one stage that needs the network: pull raw studies once, time the
+    # HTTP side, and keep them as the fixture for later runs
+    os.makedirs(fixture_dir, exist_ok=True)
+    start = time.perf_counter()
+    count = 0
+    with StudyFetcher(base_url=BASE_URL) as fetcher:
+        ids = list(fetcher.iter_nct_ids(query, min(limit, 1000), limit))
+        for nct_id, study in fetcher.fetch_studies(ids):
+            if study is None:
+                continue
+            with open(os.path.join(fixture_dir, f"{nct_id}.json"), "w") as outfile:
+                json.dump(study, outfile)
+            count += 1
+    elapsed = time.perf_counter() - start
+    print(
+        f"[INFO] Recorded {count} studies in {elapsed:.2f}s ({count / elapsed:.1f}/s)"
+    )
+    return {"studies": count, "http_s": elapsed, "trials_per_s": count / elapsed}
+
+
+def run_pipeline(paths: List[str], window_size: int, batch_size: int) -> Dict[str, Any]:
+    stages = dict.fromkeys(STAGES, 0.0)
+    trials = chunks = 0
+
+    def flush(window, writer: ChunkWriter) -> int:
+        start = time.perf_counter()
+        texts = [build_chunk_texts(study) for study, _ in window]
+        stages["text"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        vectors = iter(
+            model.encode(
+                [c.embedding_text for group in texts for c in group],
+                batch_size=batch_size,
+                device=DEVICE,
+            ).tolist()
+        )
+        stages["embed"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        written = 0
+        for group, (_, metadata) in zip(texts, window):
+            for c in group:
+                writer.write_chunk(
+                    Chunk(
+                        source_id=c.source_id,
+                        metadata=metadata,
+                        section=c.section,
+                        text=c.text,
+                        embeddings=next(vectors),
+                    )
+                )
+                written += 1
+        stages["write"] += time.perf_counter() - start
+        return written
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        total_start = time.perf_counter()
+        writer = ChunkWriter(os.path.join(out_dir, "trials.jsonl"))
+        window = []
+        for path in paths:
+            start = time.perf_counter()
+            with open(path, "r") as infile:
+                raw = infile.read()
+            stages["read"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            study = json.loads(raw)
+            stages["json"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            window.append((study, parse_data(study)))
+            stages["parse_data"] += time.perf_counter() - start
+            trials += 1
+
+            if len(window) >= window_size:
+                chunks += flush(window, writer)
+                window = []
+        if window:
+            chunks += flush(window, writer)
+
+        start = time.perf_counter()
+        writer.close()
+        stages["write"] += time.perf_counter() - start
+        total = time.perf_counter() - total_start
+
+    result = {
+        "trials": trials,
+        "chunks": chunks,
+        "total_s": total,
+        "trials_per_s": trials / total,
+        "chunks_per_s": chunks / total,
+        "stages_s": stages,
+        "stages_share": {stage: t / total for stage, t in stages.items()},
+    }
+    print(
+        f"[INFO] {trials} trials, {chunks} chunks in {total:.2f}s:"
+        f" {result['trials_per_s']:.1f} trials/s, {result['chunks_per_s']:.1f} chunks/s"
+    )
+    for stage, t in stages.items():
+        print(f"\t{stage:<10} {t:8.3f}s {t / total:6.1%}")
+    return result
+
+
+def embedding_sweep(
+    texts: List[str], batch_sizes: List[int], threads: List[int]
+) -> List[Dict[str, Any]]:
+    results = []
+    default_threads = torch.get_num_threads()
+    for n_threads in threads:
+        torch.set_num_threads(n_threads)
+        for batch_size in batch_sizes:
+            start = time.perf_counter()
+            model.encode(texts, batch_size=batch_size, device=DEVICE)
+            elapsed = time.perf_counter() - start
+            results.append(
+                {
+                    "threads": n_threads,
+                    "batch_size": batch_size,
+                    "texts_per_s": len(texts) / elapsed,
+                }
+            )
+            print(
+                f"[INFO] threads={n_threads} batch_size={batch_size}:"
+                f" {len(texts) / elapsed:.1f} texts/sec"
+            )
+    torch.set_num_threads(default_threads)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixture-dir", default=FIXTURE_DIR)
+    parser.add_argument(
+        "--record",
+        type=int,
+        default=0,
+        help="first fetch this many live studies into the fixture dir",
+    )
+    parser.add_argument(
+        "--query",
+        nargs="*",
+        default=[],
+        help="API query params for --record, e.g. query.cond=asthma",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="passes over the fixture per run"
+    )
+    parser.add_argument("--window", type=int, default=EMBED_WINDOW)
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--sweep-batch-sizes", type=int, nargs="+", default=[8, 32, 64])
+    parser.add_argument(
+        "--sweep-threads",
+        type=int,
+        nargs="+",
+        default=sorted({1, max(1, (os.cpu_count() or 2) // 2), os.cpu_count() or 1}),
+    )
+    parser.add_argument("--sweep-limit", type=int, default=256)
+    parser.add_argument("--out", default="bench_ingest.json")
+    args = parser.parse_args()
+
+    report: Dict[str, Any] = {
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "device": DEVICE,
+            "torch": torch.__version__,
+            "torch_threads": torch.get_num_threads(),
+            "model": os.getenv("EMBEDDING_MODEL"),
+        },
+        "settings": {
+            "repeat": args.repeat,
+            "window": args.window,
+            "batch_size": args.batch_size,
+        },
+    }
+
+    if args.record:
+        report["record"] = record_fixture(
+            args.fixture_dir, args.record, parse_query(args.query)
+        )
+
+    paths = sorted(glob.glob(os.path.join(args.fixture_dir, "*.json")))
+    if not paths:
+        raise FileNotFoundError(f"[ERROR] No study JSON in {args.fixture_dir}")
+    print(f"[INFO] {len(paths)} fixture studies x{args.repeat} on {DEVICE}")
+
+    # warm up so model load and first-call allocation do not skew the numbers
+    model.encode(["warm up"], device=DEVICE)
+
+    report["pipeline"] = run_pipeline(paths * args.repeat, args.window, args.batch_size)
+    report["pipeline"]["peak_rss_mb"] = peak_rss_mb()
+
+    texts = [
+        c.embedding_text for path in paths for c in build_chunk_texts(load_study(path))
+    ]
+    texts = (texts * (args.sweep_limit // max(len(texts), 1) + 1))[: args.sweep_limit]
+    report["embedding_sweep"] = embedding_sweep(
+        texts, args.sweep_batch_sizes, args.sweep_threads
+    )
+    report["peak_rss_mb"] = peak_rss_mb()
+    print(
+        f"[INFO] peak RSS {report['pipeline']['peak_rss_mb']:.0f} MiB after the"
+        f" pipeline, {report['peak_rss_mb']:.0f} MiB after the sweep"
+    )
+
+    with open(args.out, "w") as outfile:
+        json.dump(report, outfile, indent=2)
+    print(f"[INFO] Results written to {os.path.abspath(args.out)}")
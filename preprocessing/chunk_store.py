@@ -0,0 +1,157 @@
+import json
+import os
+import re
+import uuid
+import numpy as np
+from datetime import datetime, timezone
+from bson.binary import Binary, BinaryVectorDtype, VECTOR_SUBTYPE
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+
+def new_run_id() -> str:
+    # stamped on every load into a serving store so query-side caches can tell
+    # when the data under them was refreshed
+    return f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{uuid.uuid4().hex[:8]}"
+
+
+def embeddings_path(data_path: str) -> str:
+    root, _ = os.path.splitext(data_path)
+    return f"{root}.embeddings.npy"
+
+
+def open_embeddings(data_path: str) -> Optional[np.ndarray]:
+    path = embeddings_path(data_path)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode="r")
+
+
+# outcome chunks are stored with this header but were embedded without it
+OUTCOME_HEADER = re.compile(r"^(?:Primary|Secondary) Outcome Info \(NCT\d{8}\):\n")
+
+
+def embedding_text(text: str) -> str:
+    # the text build_chunk_texts embedded for a stored chunk
+    return OUTCOME_HEADER.sub("", text, count=1)
+
+
+class ChunkWriter:
+    # chunk documents go to JSONL with a "row" pointer; vectors go to a float32
+    # .npy sidecar. Both are written to temp files and swapped in on close
+    def __init__(self, data_path: str):
+        self.data_path = data_path
+        self.rows = 0
+        self.dim: Optional[int] = None
+
+        os.makedirs(os.path.dirname(data_path) or ".", exist_ok=True)
+        self.docs = open(f"{data_path}.tmp", "w")
+        self.raw = open(f"{embeddings_path(data_path)}.raw", "wb")
+
+    def write(self, document: Dict[str, Any], embeddings: Sequence[float]) -> None:
+        vector = np.asarray(embeddings, dtype="<f4")
+        if self.dim is None:
+            self.dim = len(vector)
+        elif len(vector) != self.dim:
+            raise ValueError(f"Embedding has {len(vector)} dims, expected {self.dim}")
+
+        document = {k: v for k, v in document.items() if k != "embeddings"}
+        json.dump({**document, "row": self.rows}, self.docs)
+        self.docs.write("\n")
+        vector.tofile(self.raw)
+        self.rows += 1
+
+    def write_chunk(self, chunk) -> None:
+        self.write(chunk.model_dump(exclude={"embeddings"}), chunk.embeddings)
+
+    def close(self) -> None:
+        self.docs.close()
+        self.raw.close()
+
+        raw_path = f"{embeddings_path(self.data_path)}.raw"
+        npy_tmp = f"{embeddings_path(self.data_path)}.tmp.npy"
+        shape = (self.rows, self.dim or 0)
+        matrix = np.lib.format.open_memmap(npy_tmp, mode="w+", dtype="<f4", shape=shape)
+        if self.rows:
+            matrix[:] = np.memmap(raw_path, dtype="<f4", mode="r", shape=shape)
+        matrix.flush()
+        del matrix
+
+        os.remove(raw_path)
+        os.replace(npy_tmp, embeddings_path(self.data_path))
+        os.replace(f"{self.data_path}.tmp", self.data_path)
+
+    def abort(self) -> None:
+        # drop the partial output and leave the existing files untouched
+        self.docs.close()
+        self.raw.close()
+        for path in (
+            f"{self.data_path}.tmp",
+            f"{embeddings_path(self.data_path)}.raw",
+            f"{embeddings_path(self.data_path)}.tmp.npy",
+        ):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __enter__(self) -> "ChunkWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if exc_info[0] is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+def parse_chunk_line(
+    line: str, embeddings: Optional[np.ndarray]
+) -> Tuple[Dict[str, Any], Sequence[float]]:
+    # files written before the sidecar existed keep vectors inline
+    document = json.loads(line)
+    row = document.pop("row", None)
+    if row is not None and embeddings is not None:
+        return document, embeddings[row]
+    return document, document.pop("embeddings")
+
+
+def iter_chunks(data_path: str) -> Iterator[Tuple[Dict[str, Any], Sequence[float]]]:
+    embeddings = open_embeddings(data_path)
+    with open(data_path, "r") as trial_data:
+        for line in trial_data:
+            yield parse_chunk_line(line, embeddings)
+
+
+def to_bson_vector(embeddings: Sequence[float], vector_format: str) -> Any:
+    # float32/int8 go in as BSON binData vectors (subtype 9): a dtype byte, a
+    # padding byte, then the little-endian payload straight from the array
+    vector = np.asarray(embeddings, dtype="<f4")
+    if vector_format == "array":
+        return vector.tolist()
+    if vector_format == "float32":
+        return Binary(
+            BinaryVectorDtype.FLOAT32.value + b"\x00" + vector.tobytes(), VECTOR_SUBTYPE
+        )
+    if vector_format == "int8":
+        return Binary(
+            BinaryVectorDtype.INT8.value + b"\x00" + quantize_int8(vector).tobytes(),
+            VECTOR_SUBTYPE,
+        )
+    raise ValueError(f"Unknown vector format {vector_format}")
+
+
+def from_bson_vector(value: Any) -> np.ndarray:
+    # the inverse of to_bson_vector; int8 vectors come back unscaled, which
+    # leaves their cosine similarities unchanged
+    if isinstance(value, list):
+        return np.asarray(value, dtype=np.float32)
+    dtype, payload = bytes(value[:1]), bytes(value[2:])
+    if dtype == BinaryVectorDtype.FLOAT32.value:
+        return np.frombuffer(payload, dtype="<f4").astype(np.float32)
+    if dtype == BinaryVectorDtype.INT8.value:
+        return np.frombuffer(payload, dtype=np.int8).astype(np.float32)
+    raise ValueError(f"Unsupported BSON vector dtype {dtype!r}")
+
+
+def quantize_int8(vector: np.ndarray) -> np.ndarray:
+    # per-vector symmetric scaling keeps cosine similarity close to fp32
+    scale = float(np.abs(vector).max()) or 1.0
+    return np.round(vector / scale * 127).astype(np.int8)
@@ -1,20 +1,57 @@
 import os
 import torch
 from dotenv import load_dotenv
-from typing import List
+from typing import List, NamedTuple, Tuple
 from sentence_transformers import SentenceTransformer
+from embedding_cache import EmbeddingCache
+from embedding_service import EmbeddingClient
+from projection import load_projection
 from schemas import Chunk, TrialMetaData, ChunkType
 
 load_dotenv()
-model = SentenceTransformer(os.getenv("EMBEDDING_MODEL"))
+# ingest jobs share the app's embedding service when one is configured and
+# only load their own model if it is down
+if os.getenv("EMBEDDING_SERVICE"):
+    model = EmbeddingClient(
+        os.getenv("EMBEDDING_SERVICE"),
+        fallback=lambda: SentenceTransformer(os.getenv("EMBEDDING_MODEL")),
+    )
+else:
+    model = SentenceTransformer(os.getenv("EMBEDDING_MODEL"))
+embedding_cache = EmbeddingCache(os.getenv("EMBEDDING_MODEL"))
+# the cache keeps full vectors, so refitting the projection needs no re-encode
+projection = load_projection(
+    os.getenv("EMBEDDING_PROJECTION", ""), os.getenv("EMBEDDING_MODEL")
+)
+
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+
+
+class ChunkText(NamedTuple):
+    source_id: str
+    section: ChunkType
+    text: str
+    embedding_text: str
+
+
+def embed_texts(
+    texts: List[str], batch_size: int = EMBED_BATCH_SIZE
+) -> List[List[float]]:
+    if not texts:
+        return []
+    embeddings = embedding_cache.encode(
+        texts,
+        lambda missing: model.encode(missing, batch_size=batch_size, device=DEVICE),
+    )
+    if projection is not None:
+        embeddings = projection.apply(embeddings)
+    return embeddings.tolist()
 
 
 def embed_text(text: str, chunk_type: ChunkType) -> List[float]:
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    print(f"\t[embedding:{chunk_type.value}] using device: {device}")
-    embeddings = model.encode([text], device=device)
-    print(f"\t[embedding:{chunk_type.value}] size: {embeddings.shape}\n")
-    return embeddings[0].tolist()
+    print(f"\t[embedding:{chunk_type.value}] using device: {DEVICE}")
+    return embed_texts([text])[0]
 
 
 def unpack_protocol_sections(study: dict) -> tuple:
@@ -65,7 +102,7 @@ def parse_data(full_study_data: dict) -> TrialMetaData:
     )
 
 
-def create_chunks(full_study_data: dict, study_metadata: TrialMetaData) -> List[Chunk]:
+def build_chunk_texts(full_study_data: dict) -> List[ChunkText]:
     (
         protocol,
         design_module,
@@ -96,13 +133,6 @@ def create_chunks(full_study_data: dict, study_metadata: TrialMetaData) -> List[
             f"Study Link: {url}",
         ]
     )
-    overview_chunk = Chunk(
-        source_id=nct_id,
-        metadata=study_metadata,
-        section=ChunkType.OVERVIEW,
-        text=overview_chunk_text,
-        embeddings=embed_text(overview_chunk_text, ChunkType.OVERVIEW),
-    )
 
     # DESIGN
     phases = design_module.get("phases", ["No info available"])
@@ -118,13 +148,6 @@ def create_chunks(full_study_data: dict, study_metadata: TrialMetaData) -> List[
             f"Study Link: {url}",
         ]
     )
-    design_chunk = Chunk(
-        source_id=nct_id,
-        metadata=study_metadata,
-        section=ChunkType.DESIGN,
-        text=design_chunk_text,
-        embeddings=embed_text(design_chunk_text, ChunkType.DESIGN),
-    )
 
     # ELIGIBILITY
     std_ages = eligibility_module.get("stdAges", ["No info available"])
@@ -139,13 +162,6 @@ def create_chunks(full_study_data: dict, study_metadata: TrialMetaData) -> List[
             f"Study Link: {url}",
         ]
     )
-    eligibility_chunk = Chunk(
-        source_id=nct_id,
-        metadata=study_metadata,
-        section=ChunkType.ELIGIBILITY,
-        text=eligibility_chunk_text,
-        embeddings=embed_text(eligibility_chunk_text, ChunkType.ELIGIBILITY),
-    )
 
     # CONDITIONS
     conditions = conditions_module.get("conditions", ["No info available"])
@@ -158,13 +174,6 @@ def create_chunks(full_study_data: dict, study_metadata: TrialMetaData) -> List[
             f"Study Link: {url}",
         ]
     )
-    conditions_chunk = Chunk(
-        source_id=nct_id,
-        metadata=study_metadata,
-        section=ChunkType.CONDITIONS,
-        text=conditions_chunk_text,
-        embeddings=embed_text(conditions_chunk_text, ChunkType.CONDITIONS),
-    )
 
     # ARMS & INTERVENTIONS
     arms = arms_interventions_module.get("armGroups", [])
@@ -191,15 +200,6 @@ def create_chunks(full_study_data: dict, study_metadata: TrialMetaData) -> List[
             interventions_text or "No intervention info available.",
         ]
     )
-    arms_interventions_chunk = Chunk(
-        source_id=nct_id,
-        metadata=study_metadata,
-        section=ChunkType.ARMS_INTERVENTIONS,
-        text=arms_interventions_chunk_text,
-        embeddings=embed_text(
-            arms_interventions_chunk_text, ChunkType.ARMS_INTERVENTIONS
-        ),
-    )
 
     # OUTCOMES
     def format_outcomes(outcomes: list, label: str) -> str:
@@ -220,46 +220,75 @@ def create_chunks(full_study_data: dict, study_metadata: TrialMetaData) -> List[
             ]
         )
 
-    outcomes_primary = protocol.get("outcomesModule", {}).get("primaryOutcomes", [])
-    outcomes_secondary = protocol.get("outcomesModule", {}).get("secondaryOutcomes", [])
+    outcomes_primary = format_outcomes(
+        protocol.get("outcomesModule", {}).get("primaryOutcomes", []), "Primary"
+    )
+    outcomes_secondary = format_outcomes(
+        protocol.get("outcomesModule", {}).get("secondaryOutcomes", []), "Secondary"
+    )
 
-    primary_chunk = Chunk(
-        source_id=nct_id,
-        metadata=study_metadata,
-        section=ChunkType.OUTCOMES_PRIMARY,
-        text="\n".join(
-            [
-                f"Primary Outcome Info ({nct_id}):",
-                format_outcomes(outcomes_primary, "Primary"),
-            ]
+    # outcome chunks embed only the formatted outcomes, without the header line
+    return [
+        ChunkText(nct_id, ChunkType.OVERVIEW, overview_chunk_text, overview_chunk_text),
+        ChunkText(nct_id, ChunkType.DESIGN, design_chunk_text, design_chunk_text),
+        ChunkText(
+            nct_id,
+            ChunkType.ELIGIBILITY,
+            eligibility_chunk_text,
+            eligibility_chunk_text,
         ),
-        embeddings=embed_text(
-            format_outcomes(outcomes_primary, "Primary"), ChunkType.OUTCOMES_PRIMARY
+        ChunkText(
+            nct_id, ChunkType.CONDITIONS, conditions_chunk_text, conditions_chunk_text
         ),
-    )
-
-    secondary_chunk = Chunk(
-        source_id=nct_id,
-        metadata=study_metadata,
-        section=ChunkType.OUTCOMES_SECONDARY,
-        text="\n".join(
-            [
-                f"Secondary Outcome Info ({nct_id}):",
-                format_outcomes(outcomes_secondary, "Secondary"),
-            ]
+        ChunkText(
+            nct_id,
+            ChunkType.ARMS_INTERVENTIONS,
+            arms_interventions_chunk_text,
+            arms_interventions_chunk_text,
         ),
-        embeddings=embed_text(
-            format_outcomes(outcomes_secondary, "Secondary"),
+        ChunkText(
+            nct_id,
+            ChunkType.OUTCOMES_PRIMARY,
+            "\n".join([f"Primary Outcome Info ({nct_id}):", outcomes_primary]),
+            outcomes_primary,
+        ),
+        ChunkText(
+            nct_id,
             ChunkType.OUTCOMES_SECONDARY,
+            "\n".join([f"Secondary Outcome Info ({nct_id}):", outcomes_secondary]),
+            outcomes_secondary,
         ),
+    ]
+
+
+def create_chunks_batch(
+    studies: List[Tuple[dict, TrialMetaData]], batch_size: int = EMBED_BATCH_SIZE
+) -> List[List[Chunk]]:
+    chunk_texts = [build_chunk_texts(full_study_data) for full_study_data, _ in studies]
+    embeddings = iter(
+        embed_texts(
+            [c.embedding_text for texts in chunk_texts for c in texts], batch_size
+        )
     )
 
     return [
-        overview_chunk,
-        design_chunk,
-        eligibility_chunk,
-        conditions_chunk,
-        arms_interventions_chunk,
-        primary_chunk,
-        secondary_chunk,
+        [
+            Chunk(
+                source_id=c.source_id,
+                metadata=study_metadata,
+                section=c.section,
+                text=c.text,
+                embeddings=next(embeddings),
+            )
+            for c in texts
+        ]
+        for texts, (_, study_metadata) in zip(chunk_texts, studies)
     ]
+
+
+def create_chunks(
+    full_study_data: dict,
+    study_metadata: TrialMetaData,
+    batch_size: int = EMBED_BATCH_SIZE,
+) -> List[Chunk]:
+    return create_chunks_batch([(full_study_data, study_metadata)], batch_size)[0]
@@ -0,0 +1,172 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+import numpy as np
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", os.path.join(".cache", "embeddings.sqlite")
+)
+CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "4096"))
+
+
+def normalize_text(text: str) -> str:
+    return unicodedata.normalize("NFC", text).strip()
+
+
+def cache_key(model_name: str, text: str) -> bytes:
+    return hashlib.sha256(
+        model_name.encode("utf-8") + b"\0" + normalize_text(text).encode("utf-8")
+    ).digest()
+
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        model_name: str,
+        path: Optional[str] = CACHE_PATH,
+        max_bytes: int = CACHE_MAX_BYTES,
+        memory_items: int = CACHE_MEMORY_ITEMS,
+    ):
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self.memory: OrderedDict[bytes, np.ndarray] = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        # an empty path keeps the cache purely in-process
+        self.db: Optional[sqlite3.Connection] = None
+        self.disk_bytes = 0
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.db = sqlite3.connect(
+                path, check_same_thread=False, isolation_level=None
+            )
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key BLOB PRIMARY KEY, value BLOB NOT NULL, accessed REAL NOT NULL) "
+                "WITHOUT ROWID"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed)"
+            )
+            self.disk_bytes = self.db.execute(
+                "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM embeddings"
+            ).fetchone()[0]
+
+    def remember(self, key: bytes, vector: np.ndarray) -> None:
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        keys = [cache_key(self.model_name, text) for text in texts]
+        from_memory: Dict[bytes, np.ndarray] = {}
+        from_disk: Dict[bytes, np.ndarray] = {}
+
+        with self.lock:
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    from_memory[key] = self.memory[key]
+
+            missing = list({key for key in keys if key not in from_memory})
+            if self.db is None:
+                missing = []
+
+            rows = []
+            for start in range(0, len(missing), 500):
+                batch = missing[start : start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows += self.db.execute(
+                    f"SELECT key, value FROM embeddings WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+
+            if rows:
+                for key, value in rows:
+                    from_disk[key] = np.frombuffer(value, dtype="<f4")
+                    self.remember(key, from_disk[key])
+                self.db.executemany(
+                    "UPDATE embeddings SET accessed = ? WHERE key = ?",
+                    [(time.time(), key) for key, _ in rows],
+                )
+
+            for key in keys:
+                if key in from_memory:
+                    self.counters["memory_hits"] += 1
+                elif key in from_disk:
+                    self.counters["disk_hits"] += 1
+                else:
+                    self.counters["misses"] += 1
+
+        return [from_memory.get(key, from_disk.get(key)) for key in keys]
+
+    def put_many(self, texts: List[str], vectors: np.ndarray) -> None:
+        rows = []
+        with self.lock:
+            for text, vector in zip(texts, vectors):
+                key = cache_key(self.model_name, text)
+                vector = np.asarray(vector, dtype="<f4")
+                self.remember(key, vector)
+                rows.append((key, vector.tobytes(), time.time()))
+
+            if self.db is None or not rows:
+                return
+            self.db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, value, accessed) VALUES (?, ?, ?)",
+                rows,
+            )
+            self.disk_bytes += sum(len(value) for _, value, _ in rows)
+            if self.disk_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self) -> None:
+        # drop least recently used rows until the store is back under 90% of the cap
+        target = int(self.max_bytes * 0.9)
+        while self.disk_bytes > target:
+            rows = self.db.execute(
+                "SELECT key, LENGTH(value) FROM embeddings ORDER BY accessed LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self.disk_bytes = 0
+                break
+            self.db.executemany(
+                "DELETE FROM embeddings WHERE key = ?", [(key,) for key, _ in rows]
+            )
+            self.disk_bytes -= sum(size for _, size in rows)
+
+    def encode(
+        self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]
+    ) -> np.ndarray:
+        cached = self.get_many(texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, cached) if v is None))
+
+        if missing:
+            vectors = np.asarray(encode_fn(missing), dtype=np.float32)
+            self.put_many(missing, vectors)
+            computed = dict(zip(missing, vectors))
+            cached = [
+                v if v is not None else computed[t] for t, v in zip(texts, cached)
+            ]
+
+        return np.stack(cached)
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            lookups = sum(self.counters.values())
+            hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+            return {
+                **self.counters,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_items": len(self.memory),
+                "disk_bytes": self.disk_bytes,
+            }
@@ -0,0 +1,274 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import struct
+import threading
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# one process holds the model; app sessions and ingest jobs send it texts over
+# a unix socket (or localhost TCP). Requests that arrive within a few
+# milliseconds of each other are encoded as one batch
+
+SERVICE_ADDRESS = os.getenv("EMBEDDING_SERVICE", "")
+SERVICE_WINDOW_MS = float(os.getenv("EMBEDDING_SERVICE_WINDOW_MS", "5"))
+SERVICE_MAX_BATCH = int(os.getenv("EMBEDDING_SERVICE_MAX_BATCH", "64"))
+SERVICE_TIMEOUT = float(os.getenv("EMBEDDING_SERVICE_TIMEOUT", "60"))
+SERVICE_RETRY_SECONDS = 30.0
+
+# frame: header length, payload length, JSON header, raw little-endian float32
+FRAME = struct.Struct("!II")
+
+
+def parse_address(address: str) -> Tuple[int, Any]:
+    # "unix:/path/to.sock" or "host:port"
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:") :]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def pack_frame(header: Dict[str, Any], payload: bytes = b"") -> bytes:
+    encoded = json.dumps(header).encode("utf-8")
+    return FRAME.pack(len(encoded), len(payload)) + encoded + payload
+
+
+def recv_exact(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("embedding service closed the connection")
+        data.extend(chunk)
+    return bytes(data)
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        window_ms: float = SERVICE_WINDOW_MS,
+        max_batch: int = SERVICE_MAX_BATCH,
+    ):
+        self.encode_fn = encode_fn
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.queue: asyncio.Queue = asyncio.Queue()
+        # the model already uses every core, so batches run one at a time
+        # while the event loop keeps collecting the next one
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="encode")
+        self.counters = {"requests": 0, "texts": 0, "batches": 0}
+
+    async def encode(self, texts: List[str]) -> np.ndarray:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, future))
+        return await future
+
+    async def collect(self) -> List[Tuple[List[str], asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        items = [await self.queue.get()]
+        count = len(items[0][0])
+        deadline = loop.time() + self.window
+
+        while count < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            items.append(item)
+            count += len(item[0])
+        return items
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            items = await self.collect()
+            texts = [text for item_texts, _ in items for text in item_texts]
+
+            try:
+                vectors = await loop.run_in_executor(
+                    self.executor, self.encode_fn, texts
+                )
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.counters["requests"] += len(items)
+            self.counters["texts"] += len(texts)
+            self.counters["batches"] += 1
+
+            offset = 0
+            for item_texts, future in items:
+                if not future.done():
+                    future.set_result(vectors[offset : offset + len(item_texts)])
+                offset += len(item_texts)
+
+    def stats(self) -> Dict[str, float]:
+        batches = self.counters["batches"]
+        return {
+            **self.counters,
+            "texts_per_batch": self.counters["texts"] / batches if batches else 0.0,
+            "pending": self.queue.qsize(),
+        }
+
+
+async def serve(address: str, batcher: MicroBatcher) -> None:
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    sizes = await reader.readexactly(FRAME.size)
+                except asyncio.IncompleteReadError:
+                    break
+                header_size, payload_size = FRAME.unpack(sizes)
+                request = json.loads(await reader.readexactly(header_size))
+                await reader.readexactly(payload_size)
+
+                if request.get("op") == "stats":
+                    writer.write(pack_frame(batcher.stats()))
+                else:
+                    try:
+                        vectors = await batcher.encode(request["texts"])
+                        vectors = np.ascontiguousarray(vectors, dtype="<f4")
+                        writer.write(
+                            pack_frame(
+                                {"shape": list(vectors.shape)}, vectors.tobytes()
+                            )
+                        )
+                    except Exception as e:
+                        writer.write(pack_frame({"error": str(e)}))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    family, location = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(location):
+            os.remove(location)
+        server = await asyncio.start_unix_server(handle, path=location)
+    else:
+        server = await asyncio.start_server(handle, *location)
+
+    batch_task = asyncio.create_task(batcher.run())
+    print(f"[INFO] Embedding service listening on {address}")
+    async with server:
+        await server.serve_forever()
+    batch_task.cancel()
+
+
+class EmbeddingClient:
+    # stands in for a SentenceTransformer wherever only .encode is used; each
+    # thread keeps its own connection. While the service is unreachable,
+    # encode falls back to a model loaded in this process
+    def __init__(
+        self,
+        address: str = SERVICE_ADDRESS,
+        fallback: Optional[Callable[[], Any]] = None,
+        timeout: float = SERVICE_TIMEOUT,
+        retry_seconds: float = SERVICE_RETRY_SECONDS,
+    ):
+        self.address = address
+        self.fallback = fallback
+        self.timeout = timeout
+        self.retry_seconds = retry_seconds
+        self.retry_at = 0.0
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.fallback_model: Optional[Any] = None
+
+    def request(self, header: Dict[str, Any]) -> Tuple[Dict[str, Any], bytes]:
+        sock = getattr(self.local, "sock", None)
+        if sock is None:
+            family, location = parse_address(self.address)
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(location)
+            except OSError:
+                sock.close()
+                raise
+            self.local.sock = sock
+
+        try:
+            sock.sendall(pack_frame(header))
+            header_size, payload_size = FRAME.unpack(recv_exact(sock, FRAME.size))
+            response = json.loads(recv_exact(sock, header_size))
+            return response, recv_exact(sock, payload_size)
+        except OSError:
+            sock.close()
+            self.local.sock = None
+            raise
+
+    def remote_encode(self, texts: List[str]) -> np.ndarray:
+        response, payload = self.request({"texts": texts})
+        if "error" in response:
+            raise RuntimeError(f"embedding service: {response['error']}")
+        return np.frombuffer(payload, dtype="<f4").reshape(response["shape"])
+
+    def stats(self) -> Dict[str, Any]:
+        return self.request({"op": "stats"})[0]
+
+    def local_model(self) -> Any:
+        with self.lock:
+            if self.fallback_model is None:
+                print("[INFO] Loading an in-process embedding model as fallback")
+                self.fallback_model = self.fallback()
+        return self.fallback_model
+
+    def encode(self, sentences, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+
+        if time.monotonic() >= self.retry_at or self.fallback is None:
+            try:
+                vectors = self.remote_encode(texts)
+                return vectors[0] if single else vectors
+            except OSError as e:
+                if self.fallback is None:
+                    raise
+                self.retry_at = time.monotonic() + self.retry_seconds
+                print(f"[ERROR] Embedding service at {self.address} unreachable: {e}")
+
+        return self.local_model().encode(sentences, **kwargs)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from sentence_transformers import SentenceTransformer
+
+    load_dotenv()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--address",
+        default=os.getenv("EMBEDDING_SERVICE") or "unix:/tmp/clinrag-embed.sock",
+    )
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL"))
+    parser.add_argument(
+        "--window-ms",
+        type=float,
+        default=float(os.getenv("EMBEDDING_SERVICE_WINDOW_MS", SERVICE_WINDOW_MS)),
+        help="how long the first request in a batch waits for company",
+    )
+    parser.add_argument(
+        "--max-batch",
+        type=int,
+        default=int(os.getenv("EMBEDDING_SERVICE_MAX_BATCH", SERVICE_MAX_BATCH)),
+    )
+    args = parser.parse_args()
+
+    model = SentenceTransformer(args.model)
+    batcher = MicroBatcher(
+        lambda texts: model.encode(texts, batch_size=args.max_batch),
+        args.window_ms,
+        args.max_batch,
+    )
+    asyncio.run(serve(args.address, batcher))
@@ -1,88 +1,141 @@
-import requests
-import json
+import argparse
 import os
-from chunking_utils import parse_data, create_chunks
-from typing import List
+import subprocess
+import sys
+from chunk_store import ChunkWriter
+from chunking_utils import parse_data, create_chunks_batch, embedding_cache
+from study_fetcher import BASE_URL, StudyFetcher
+from sync_manifest import Manifest, last_update_date
+from typing import Dict, List, Optional, Tuple
 from schemas import TrialMetaData
 
-BASE_URL = "https://clinicaltrials.gov/api/v2/studies"
 DATA_PATH = os.path.join("preprocessing", "trial_data", "trials.jsonl")
+EMBED_WINDOW = int(os.getenv("EMBED_WINDOW", "16"))
 
 
-def get_NCT_ids(page_size=1000) -> List[str]:
-    study_ids = []
-
+def get_NCT_ids(
+    fetcher: StudyFetcher,
+    page_size: int = 1000,
+    query: Optional[Dict[str, str]] = None,
+    limit: Optional[int] = None,
+) -> List[str]:
     print("\n=== Fetching NCT IDs ===")
     print("-------------------------------------------------------\n")
 
-    try:
-        response = requests.get(f"{BASE_URL}?pageSize={page_size}")
-        response.raise_for_status()
-    except requests.RequestException as e:
-        print(f"[ERROR] Failed to fetch NCT IDs: {e}")
-        return []
-
-    print(f"[INFO] Request status: {response.status_code}")
-
-    if response.status_code != 200:
-        print("[WARNING] Non-200 response; possible issue fetching data.")
-        return study_ids
-
-    studies = response.json().get("studies", [])
-    for study in studies:
-        nct_id = (
-            study.get("protocolSection", {})
-            .get("identificationModule", {})
-            .get("nctId")
-        )
-        if nct_id:
-            study_ids.append(nct_id)
+    study_ids = list(fetcher.iter_nct_ids(query, page_size, limit))
 
     print(f"[INFO] Retrieved {len(study_ids)} NCT IDs.")
     return study_ids
 
 
-def get_full_studies(study_ids: List[str]) -> None:
+def write_window(
+    window: List[Tuple[dict, TrialMetaData]], writer: ChunkWriter, manifest: Manifest
+) -> None:
+    for (full_study_data, study_metadata), chunks in zip(
+        window, create_chunks_batch(window)
+    ):
+        manifest.record(
+            study_metadata.nctId,
+            last_update_date(full_study_data),
+            study_metadata,
+            chunks,
+        )
+        for chunk in chunks:
+            writer.write_chunk(chunk)
+
+
+def get_full_studies(
+    fetcher: StudyFetcher, study_ids: List[str], window_size: int = EMBED_WINDOW
+) -> None:
     print("\n=== Fetching Full Study Data ===")
     print("-------------------------------------------------------\n")
 
     counter = 1
+    window: List[Tuple[dict, TrialMetaData]] = []
+    manifest = Manifest()
 
     try:
-        os.makedirs(os.path.dirname(DATA_PATH), exist_ok=True)
-        with open(DATA_PATH, "w+") as outfile:
-            for nct_id in study_ids:
-                response = requests.get(f"{BASE_URL}/{nct_id}")
-                print(
-                    f"[{counter}] Fetching {nct_id}... Status: {response.status_code}"
-                )
-
-                if response.status_code != 200:
-                    print(
-                        f"[ERROR] Skipping {nct_id} due to bad status code: {response.status_code}"
-                    )
+        with ChunkWriter(DATA_PATH) as writer:
+            for nct_id, full_study_data in fetcher.fetch_studies(study_ids):
+                if full_study_data is None:
+                    print(f"[ERROR] Skipping {nct_id}: fetch failed")
                     continue
 
+                print(f"[{counter}] Fetched {nct_id}")
+
                 try:
-                    full_study_data = response.json()
                     study_metadata: TrialMetaData = parse_data(full_study_data)
+                    window.append((full_study_data, study_metadata))
 
-                    for chunk in create_chunks(full_study_data, study_metadata):
-                        json.dump(chunk.model_dump(), outfile)
-                        outfile.write("\n")
+                    if len(window) >= window_size:
+                        write_window(window, writer, manifest)
+                        print(f"[INFO] Embedded window of {len(window)} trials.")
+                        window = []
 
                 except Exception as parse_err:
                     print(f"[ERROR] Failed to process {nct_id}: {parse_err}")
                     break
 
                 counter += 1
-                print("-------------------------------------------------------\n")
+
+            if window:
+                write_window(window, writer, manifest)
+                print(f"[INFO] Embedded window of {len(window)} trials.")
+
+        manifest.save()
+        print(f"[INFO] Embedding cache: {embedding_cache.stats()}")
     except FileNotFoundError:
         print("[ERROR] Output file path not found.")
     except Exception as e:
         print(f"[FATAL] Unexpected error during study fetch: {e}")
 
 
+def parse_query(pairs: List[str]) -> Dict[str, str]:
+    query = {}
+    for pair in pairs:
+        key, _, value = pair.partition("=")
+        query[key] = value
+    return query
+
+
 if __name__ == "__main__":
-    ids = get_NCT_ids()
-    get_full_studies(ids)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument(
+        "--query",
+        nargs="*",
+        default=[],
+        help="API query params, e.g. query.cond=asthma filter.overallStatus=RECRUITING",
+    )
+    parser.add_argument(
+        "--limit", type=int, default=1000, help="max trials to pull (0 = all pages)"
+    )
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rps", type=float, default=10.0)
+    parser.add_argument(
+        "--skip-lexical", action="store_true", help="don't rebuild the BM25 index"
+    )
+    args = parser.parse_args()
+
+    with StudyFetcher(
+        base_url=args.base_url,
+        max_workers=args.workers,
+        requests_per_second=args.rps,
+    ) as fetcher:
+        ids = get_NCT_ids(
+            fetcher, args.page_size, parse_query(args.query), args.limit or None
+        )
+        get_full_studies(fetcher, ids)
+
+    if not args.skip_lexical:
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "langgraph_flow.lexical_index",
+                "--data-path",
+                DATA_PATH,
+            ],
+            check=True,
+        )
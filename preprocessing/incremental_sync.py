@@ -0,0 +1,195 @@
+import argparse
+import os
+import subprocess
+import sys
+from chunk_store import ChunkWriter, iter_chunks, open_embeddings, parse_chunk_line
+from chunking_utils import (
+    ChunkText,
+    build_chunk_texts,
+    embed_texts,
+    embedding_cache,
+    parse_data,
+)
+from fetch_and_chunk import DATA_PATH, parse_query
+from schemas import Chunk, TrialMetaData
+from study_fetcher import BASE_URL, StudyFetcher
+from sync_manifest import (
+    MANIFEST_PATH,
+    Manifest,
+    assemble_delta,
+    diff_trial,
+    last_update_date,
+)
+from typing import Dict, List, Optional, Set, Tuple
+
+DELTA_PATH = os.path.join("preprocessing", "trial_data", "trials.delta.jsonl")
+
+ChunkKey = Tuple[str, str]
+
+
+def find_stale_trials(
+    fetcher: StudyFetcher,
+    manifest: Manifest,
+    query: Optional[Dict[str, str]],
+    page_size: int,
+) -> List[str]:
+    print("\n=== Comparing registry against manifest ===")
+    print("-------------------------------------------------------\n")
+
+    stale, seen = [], 0
+    for studies in fetcher.iter_pages(
+        query, page_size, fields=["NCTId", "LastUpdatePostDate"]
+    ):
+        for study in studies:
+            nct_id = (
+                study.get("protocolSection", {})
+                .get("identificationModule", {})
+                .get("nctId")
+            )
+            if not nct_id:
+                continue
+            seen += 1
+            if manifest.is_stale(nct_id, last_update_date(study)):
+                stale.append(nct_id)
+
+    print(f"[INFO] {len(stale)} of {seen} trials changed since last sync.")
+    return stale
+
+
+def load_embeddings(path: str, keys: Set[ChunkKey]) -> Dict[ChunkKey, List[float]]:
+    embeddings: Dict[ChunkKey, List[float]] = {}
+    if not keys or not os.path.exists(path):
+        return embeddings
+    for document, vector in iter_chunks(path):
+        key = (document["source_id"], document["section"])
+        if key in keys:
+            embeddings[key] = [float(x) for x in vector]
+    return embeddings
+
+
+def merge_into(path: str, delta: List[Chunk]) -> None:
+    replacements = {(c.source_id, c.section.value): c for c in delta}
+    embeddings = open_embeddings(path)
+
+    with ChunkWriter(path) as writer:
+        if os.path.exists(path):
+            with open(path, "r") as trial_data:
+                for line in trial_data:
+                    document, vector = parse_chunk_line(line, embeddings)
+                    key = (document["source_id"], document["section"])
+                    replacement = replacements.pop(key, None)
+                    if replacement is None:
+                        writer.write(document, vector)
+                    else:
+                        writer.write_chunk(replacement)
+        for chunk in replacements.values():
+            writer.write_chunk(chunk)
+
+
+def sync(
+    fetcher: StudyFetcher,
+    manifest: Manifest,
+    query: Optional[Dict[str, str]],
+    page_size: int,
+) -> List[Chunk]:
+    stale_ids = find_stale_trials(fetcher, manifest, query, page_size)
+
+    print("\n=== Re-chunking changed trials ===")
+    print("-------------------------------------------------------\n")
+
+    pending: List[Tuple[Optional[str], TrialMetaData, List[ChunkText]]] = []
+    to_embed: List[ChunkText] = []
+    to_push: List[Tuple[TrialMetaData, ChunkText]] = []
+
+    for nct_id, full_study_data in fetcher.fetch_studies(stale_ids):
+        if full_study_data is None:
+            print(f"[ERROR] Skipping {nct_id}: fetch failed")
+            continue
+        try:
+            study_metadata = parse_data(full_study_data)
+            chunk_texts = build_chunk_texts(full_study_data)
+        except Exception as parse_err:
+            print(f"[ERROR] Failed to process {nct_id}: {parse_err}")
+            continue
+
+        embed, push = diff_trial(manifest, study_metadata, chunk_texts)
+        to_embed.extend(embed)
+        to_push.extend((study_metadata, c) for c in push)
+        pending.append((last_update_date(full_study_data), study_metadata, chunk_texts))
+
+    new_embeddings = dict(
+        zip(
+            [(c.source_id, c.section.value) for c in to_embed],
+            embed_texts([c.embedding_text for c in to_embed]),
+        )
+    )
+    reused = load_embeddings(
+        DATA_PATH,
+        {(c.source_id, c.section.value) for _, c in to_push} - new_embeddings.keys(),
+    )
+    print(
+        f"[INFO] Re-embedded {len(new_embeddings)} sections, reused {len(reused)} embeddings."
+    )
+
+    delta, incomplete = assemble_delta(to_push, {**reused, **new_embeddings})
+    manifest.record_synced(pending, incomplete)
+    return delta
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--query", nargs="*", default=[])
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rps", type=float, default=10.0)
+    parser.add_argument(
+        "--push", action="store_true", help="upsert the delta into MongoDB"
+    )
+    parser.add_argument(
+        "--skip-lexical", action="store_true", help="don't rebuild the BM25 index"
+    )
+    args = parser.parse_args()
+
+    if os.path.exists(MANIFEST_PATH):
+        manifest = Manifest.load()
+    elif os.path.exists(DATA_PATH):
+        print("[INFO] No manifest found; bootstrapping from existing chunks.")
+        manifest = Manifest.from_chunks_file(DATA_PATH)
+    else:
+        manifest = Manifest()
+
+    with StudyFetcher(
+        base_url=args.base_url,
+        max_workers=args.workers,
+        requests_per_second=args.rps,
+    ) as fetcher:
+        delta = sync(fetcher, manifest, parse_query(args.query), args.page_size)
+
+    with ChunkWriter(DELTA_PATH) as writer:
+        for chunk in delta:
+            writer.write_chunk(chunk)
+
+    merge_into(DATA_PATH, delta)
+    manifest.save()
+    print(f"[INFO] {len(delta)} changed chunks written to {DELTA_PATH}")
+    print(f"[INFO] Embedding cache: {embedding_cache.stats()}")
+
+    # BM25 statistics are corpus-wide, so the lexical index is rebuilt from the
+    # merged file rather than patched with the delta
+    if delta and not args.skip_lexical:
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "langgraph_flow.lexical_index",
+                "--data-path",
+                DATA_PATH,
+            ],
+            check=True,
+        )
+
+    if args.push and delta:
+        subprocess.run(
+            [sys.executable, "db_init.py", "--data-path", DELTA_PATH], check=True
+        )
@@ -0,0 +1,190 @@
+import argparse
+import json
+import os
+import numpy as np
+from typing import Dict, Optional
+
+# a PCA fitted on the corpus' own chunk vectors. Projected vectors go into the
+# store and questions are projected the same way before searching, so scan
+# cost, index RAM and storage shrink with the dimension. Set
+# EMBEDDING_PROJECTION to the artifact to turn it on for ingest and querying
+
+PROJECTION_PATH = os.getenv("EMBEDDING_PROJECTION", "")
+INDEX_TEMPLATE = os.path.join("extras", "vector_index.json")
+
+
+class Projection:
+    def __init__(
+        self,
+        mean: np.ndarray,
+        components: np.ndarray,
+        explained: np.ndarray,
+        model_name: str,
+    ):
+        self.mean = mean.astype(np.float32)
+        self.components = components.astype(np.float32)
+        # share of the corpus variance each kept component explains
+        self.explained = explained
+        self.model_name = model_name
+
+    @property
+    def dim(self) -> int:
+        return len(self.components)
+
+    @property
+    def source_dim(self) -> int:
+        return len(self.mean)
+
+    def apply(self, vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape[-1] != self.source_dim:
+            raise ValueError(
+                f"Projection expects {self.source_dim}-d vectors, got {vectors.shape[-1]}"
+            )
+        return (vectors - self.mean) @ self.components.T
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as outfile:
+            np.savez(
+                outfile,
+                mean=self.mean,
+                components=self.components,
+                explained=self.explained,
+                model_name=np.array(self.model_name),
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "Projection":
+        with np.load(path, allow_pickle=False) as artifact:
+            return cls(
+                artifact["mean"],
+                artifact["components"],
+                artifact["explained"],
+                str(artifact["model_name"]),
+            )
+
+
+def fit_projection(
+    matrix: np.ndarray, dim: int, model_name: str, block_rows: int = 8192
+) -> Projection:
+    # the covariance is accumulated block by block so a memory-mapped corpus
+    # never has to be centred in RAM; it is only source_dim x source_dim
+    count, source_dim = matrix.shape
+    if not 0 < dim <= source_dim:
+        raise ValueError(f"dim must be in 1..{source_dim}, got {dim}")
+
+    mean = np.zeros(source_dim, dtype=np.float64)
+    for start in range(0, count, block_rows):
+        mean += np.asarray(matrix[start : start + block_rows], np.float64).sum(axis=0)
+    mean /= count
+
+    covariance = np.zeros((source_dim, source_dim), dtype=np.float64)
+    for start in range(0, count, block_rows):
+        block = np.asarray(matrix[start : start + block_rows], np.float64) - mean
+        covariance += block.T @ block
+    covariance /= max(count - 1, 1)
+
+    # eigh returns ascending eigenvalues; PCA wants the largest first
+    values, vectors = np.linalg.eigh(covariance)
+    order = np.argsort(values)[::-1][:dim]
+    total = values.clip(min=0).sum() or 1.0
+    return Projection(mean, vectors[:, order].T, values[order] / total, model_name)
+
+
+projections: Dict[str, Projection] = {}
+
+
+def load_projection(
+    path: str = PROJECTION_PATH, model_name: str = ""
+) -> Optional[Projection]:
+    # one copy per process; the model check stops a projection fitted on one
+    # model's vectors from being applied to another's
+    if not path:
+        return None
+    if path not in projections:
+        projections[path] = Projection.load(path)
+    projection = projections[path]
+    if model_name and projection.model_name != model_name:
+        raise ValueError(
+            f"Projection {path} was fitted on {projection.model_name}, not {model_name}"
+        )
+    return projection
+
+
+def index_definition(dim: int, template_path: str = INDEX_TEMPLATE) -> Dict:
+    # the atlas index for projected vectors differs from the full one only in
+    # numDimensions
+    with open(template_path, "r") as infile:
+        definition = json.load(infile)
+    for field in definition["fields"]:
+        if field["type"] == "vector":
+            field["numDimensions"] = dim
+    return definition
+
+
+if __name__ == "__main__":
+    # run from the repo root like the other ingest scripts
+    from dotenv import load_dotenv
+    from chunk_store import ChunkWriter, iter_chunks, open_embeddings
+
+    load_dotenv()
+    data_path = os.path.join("preprocessing", "trial_data", "trials.jsonl")
+
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    fit = commands.add_parser("fit", help="fit a projection on ingested chunks")
+    fit.add_argument("--data-path", default=data_path)
+    fit.add_argument("--dim", type=int, default=256)
+    fit.add_argument("--out", default=os.path.join("extras", "projection_256.npz"))
+
+    project = commands.add_parser(
+        "project", help="rewrite an ingest output with projected vectors"
+    )
+    project.add_argument("--data-path", default=data_path)
+    project.add_argument("--projection", default=PROJECTION_PATH)
+    project.add_argument("--out", required=True)
+
+    index = commands.add_parser(
+        "index", help="write the atlas index definition for projected vectors"
+    )
+    index.add_argument("--projection", default=PROJECTION_PATH)
+    index.add_argument("--template", default=INDEX_TEMPLATE)
+    index.add_argument("--out")
+    args = parser.parse_args()
+
+    if args.command == "fit":
+        matrix = open_embeddings(args.data_path)
+        if matrix is None:
+            raise FileNotFoundError(
+                f"[ERROR] No embeddings sidecar for {args.data_path}"
+            )
+        projection = fit_projection(matrix, args.dim, os.getenv("EMBEDDING_MODEL", ""))
+        projection.save(args.out)
+        print(
+            f"[INFO] {projection.source_dim} -> {projection.dim} dims keeps"
+            f" {projection.explained.sum():.1%} of the variance over {len(matrix)} chunks"
+        )
+        print(f"[INFO] Projection written to {os.path.abspath(args.out)}")
+
+    elif args.command == "project":
+        projection = load_projection(args.projection)
+        if projection is None:
+            raise ValueError("[ERROR] --projection or EMBEDDING_PROJECTION must be set")
+        with ChunkWriter(args.out) as writer:
+            for document, vector in iter_chunks(args.data_path):
+                writer.write(document, projection.apply(vector))
+        print(f"[INFO] {writer.rows} chunks projected to {projection.dim} dims")
+
+    elif args.command == "index":
+        projection = load_projection(args.projection)
+        if projection is None:
+            raise ValueError("[ERROR] --projection or EMBEDDING_PROJECTION must be set")
+        root, ext = os.path.splitext(args.template)
+        out = args.out or f"{root}_{projection.dim}{ext}"
+        with open(out, "w") as outfile:
+            json.dump(
+                index_definition(projection.dim, args.template), outfile, indent=4
+            )
+        print(f"[INFO] Index definition written to {os.path.abspath(out)}")
@@ -0,0 +1,180 @@
+import random
+import threading
+import time
+import requests
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+BASE_URL = "https://clinicaltrials.gov/api/v2/studies"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    def __init__(self, requests_per_second: float):
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+    def pause(self, delay: float) -> None:
+        # a 429 means the server wants every worker to back off, not just this one
+        with self.lock:
+            self.next_slot = max(self.next_slot, time.monotonic() + delay)
+
+
+class StudyFetcher:
+    def __init__(
+        self,
+        base_url: str = BASE_URL,
+        max_workers: int = 8,
+        requests_per_second: float = 10.0,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        timeout: float = 30.0,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.rate_limiter = RateLimiter(requests_per_second)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self) -> "StudyFetcher":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def backoff(self, attempt: int, response: Optional[requests.Response]) -> float:
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        delay = min(self.backoff_base * (2**attempt), self.backoff_max)
+        return delay * random.uniform(0.5, 1.0)
+
+    def get_json(
+        self, url: str, params: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.wait()
+            response = None
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except requests.RequestException as e:
+                print(f"[WARN] Request to {url} failed: {e}")
+            else:
+                if response.status_code == 200:
+                    try:
+                        return response.json()
+                    except ValueError as e:
+                        print(f"[ERROR] Malformed JSON from {url}: {e}")
+                        return None
+                if response.status_code not in RETRY_STATUSES:
+                    print(f"[ERROR] {url} returned status {response.status_code}")
+                    return None
+
+            delay = self.backoff(attempt, response)
+            if response is not None and response.status_code == 429:
+                self.rate_limiter.pause(delay)
+            time.sleep(delay)
+
+        print(f"[ERROR] Giving up on {url} after {self.max_retries + 1} attempts")
+        return None
+
+    def iter_pages(
+        self,
+        query: Optional[Dict[str, str]] = None,
+        page_size: int = 1000,
+        fields: Optional[List[str]] = None,
+    ) -> Iterator[List[Dict[str, Any]]]:
+        params: Dict[str, Any] = dict(query or {})
+        params["pageSize"] = page_size
+        if fields:
+            params["fields"] = ",".join(fields)
+
+        while True:
+            page = self.get_json(self.base_url, params)
+            if page is None:
+                return
+            yield page.get("studies", [])
+
+            token = page.get("nextPageToken")
+            if not token:
+                return
+            params["pageToken"] = token
+
+    def iter_nct_ids(
+        self,
+        query: Optional[Dict[str, str]] = None,
+        page_size: int = 1000,
+        limit: Optional[int] = None,
+    ) -> Iterator[str]:
+        count = 0
+        for studies in self.iter_pages(query, page_size, fields=["NCTId"]):
+            for study in studies:
+                nct_id = (
+                    study.get("protocolSection", {})
+                    .get("identificationModule", {})
+                    .get("nctId")
+                )
+                if not nct_id:
+                    continue
+                yield nct_id
+                count += 1
+                if limit and count >= limit:
+                    return
+
+    def fetch_study(self, nct_id: str) -> Optional[Dict[str, Any]]:
+        return self.get_json(f"{self.base_url}/{nct_id}")
+
+    def fetch_studies(
+        self, study_ids: Iterable[str]
+    ) -> Iterator[Tuple[str, Optional[Dict[str, Any]]]]:
+        # keep a bounded number of requests in flight so huge id lists are not
+        # materialised as futures up front; results come back in completion order
+        max_in_flight = self.max_workers * 2
+        ids = iter(study_ids)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            in_flight: Set[Future] = set()
+            futures: Dict[Future, str] = {}
+
+            def submit_next() -> bool:
+                nct_id = next(ids, None)
+                if nct_id is None:
+                    return False
+                future = executor.submit(self.fetch_study, nct_id)
+                futures[future] = nct_id
+                in_flight.add(future)
+                return True
+
+            while len(in_flight) < max_in_flight and submit_next():
+                pass
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight.discard(future)
+                    nct_id = futures.pop(future)
+                    yield nct_id, future.result()
+                    submit_next()
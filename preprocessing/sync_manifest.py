@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from schemas import Chunk, TrialMetaData
+
+MANIFEST_PATH = os.path.join("preprocessing", "trial_data", "manifest.json")
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def metadata_hash(metadata: TrialMetaData) -> str:
+    return content_hash(json.dumps(metadata.model_dump(), sort_keys=True))
+
+
+def last_update_date(study: Dict[str, Any]) -> Optional[str]:
+    return (
+        study.get("protocolSection", {})
+        .get("statusModule", {})
+        .get("lastUpdatePostDateStruct", {})
+        .get("date")
+    )
+
+
+class Manifest:
+    def __init__(self, path: str = MANIFEST_PATH):
+        self.path = path
+        self.trials: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def load(cls, path: str = MANIFEST_PATH) -> "Manifest":
+        manifest = cls(path)
+        if os.path.exists(path):
+            with open(path, "r") as infile:
+                manifest.trials = json.load(infile)
+        return manifest
+
+    @classmethod
+    def from_chunks_file(cls, data_path: str, path: str = MANIFEST_PATH) -> "Manifest":
+        # bootstrap section hashes from an existing trials.jsonl; the missing
+        # update dates force one fetch per trial but nothing gets re-embedded
+        manifest = cls(path)
+        with open(data_path, "r") as trial_data:
+            for line in trial_data:
+                chunk = json.loads(line)
+                entry = manifest.trials.setdefault(
+                    chunk["source_id"],
+                    {
+                        "lastUpdatePostDate": None,
+                        "metadata": metadata_hash(TrialMetaData(**chunk["metadata"])),
+                        "sections": {},
+                    },
+                )
+                entry["sections"][chunk["section"]] = content_hash(chunk["text"])
+        return manifest
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as outfile:
+            json.dump(self.trials, outfile)
+        os.replace(tmp_path, self.path)
+
+    def is_stale(self, nct_id: str, last_update: Optional[str]) -> bool:
+        entry = self.trials.get(nct_id)
+        return (
+            entry is None
+            or last_update is None
+            or entry.get("lastUpdatePostDate") != last_update
+        )
+
+    def section_hash(self, nct_id: str, section: str) -> Optional[str]:
+        return self.trials.get(nct_id, {}).get("sections", {}).get(section)
+
+    def metadata_changed(self, nct_id: str, metadata: TrialMetaData) -> bool:
+        return self.trials.get(nct_id, {}).get("metadata") != metadata_hash(metadata)
+
+    def record(
+        self,
+        nct_id: str,
+        last_update: Optional[str],
+        metadata: TrialMetaData,
+        sections: Iterable,
+    ) -> None:
+        self.trials[nct_id] = {
+            "lastUpdatePostDate": last_update,
+            "metadata": metadata_hash(metadata),
+            "sections": {c.section.value: content_hash(c.text) for c in sections},
+        }
+
+    def record_synced(
+        self,
+        synced: Iterable[Tuple[Optional[str], TrialMetaData, Sequence]],
+        incomplete: Set[str],
+    ) -> None:
+        # a trial with a skipped section keeps its old entry, so the next sync
+        # sees it as changed and retries it
+        for last_update, metadata, sections in synced:
+            if metadata.nctId not in incomplete:
+                self.record(metadata.nctId, last_update, metadata, sections)
+
+
+def diff_trial(
+    manifest: Manifest, study_metadata: TrialMetaData, chunk_texts: Sequence
+) -> Tuple[List, List]:
+    # sections whose text changed need a new embedding; if only the trial
+    # metadata changed the old embedding is reused but the document is re-pushed
+    nct_id = study_metadata.nctId
+    metadata_changed = manifest.metadata_changed(nct_id, study_metadata)
+
+    to_embed, to_push = [], []
+    for c in chunk_texts:
+        text_changed = manifest.section_hash(nct_id, c.section.value) != content_hash(
+            c.text
+        )
+        if text_changed:
+            to_embed.append(c)
+        if text_changed or metadata_changed:
+            to_push.append(c)
+    return to_embed, to_push
+
+
+def assemble_delta(
+    to_push: Iterable[Tuple[TrialMetaData, Any]],
+    embeddings: Dict[Tuple[str, str], List[float]],
+) -> Tuple[List[Chunk], Set[str]]:
+    # also returns the trials with a section that had no embedding to push
+    delta, incomplete = [], set()
+    for study_metadata, c in to_push:
+        key = (c.source_id, c.section.value)
+        vector = embeddings.get(key)
+        if vector is None:
+            print(f"[WARN] No embedding available for {key}; skipping")
+            incomplete.add(c.source_id)
+            continue
+        delta.append(
+            Chunk(
+                source_id=c.source_id,
+                metadata=study_metadata,
+                section=c.section,
+                text=c.text,
+                embeddings=vector,
+            )
+        )
+    return delta, incomplete
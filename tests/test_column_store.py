@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+from datetime import datetime
+from typing import Any, Dict, List
+from langgraph_flow.retrieval import ColumnStore, LocalVectorSearch, write_local_index
+
+# the local backend answers the same Mongo-style filters db_filter_assembly
+# builds for Atlas; a wrong mask silently drops or adds trials, so each
+# operator is checked against the rows it should select
+
+TRIALS: List[Dict[str, Any]] = [
+    {
+        "status": "RECRUITING",
+        "stdAges": ["ADULT", "OLDER_ADULT"],
+        "startDate": "2018-03-01",
+        "enrollmentCount": 120,
+    },
+    {
+        "status": "COMPLETED",
+        "stdAges": ["CHILD"],
+        "startDate": "2020-01",
+        "enrollmentCount": 40,
+    },
+    {
+        "status": "RECRUITING",
+        "stdAges": ["CHILD", "ADULT"],
+        "startDate": "2021",
+        "enrollmentCount": None,
+    },
+    {
+        "status": "TERMINATED",
+        "stdAges": [],
+        "startDate": None,
+        "enrollmentCount": 900,
+    },
+]
+
+
+def build(path: str, mask_max_vocab: int = 64) -> LocalVectorSearch:
+    records = [
+        {"source_id": f"NCT{i:08d}", "section": "overview", "text": f"trial {i}"}
+        for i in range(len(TRIALS))
+    ]
+    metadata = {field: [t[field] for t in TRIALS] for field in TRIALS[0]}
+    write_local_index(
+        path,
+        np.eye(len(TRIALS), dtype=np.float32),
+        records,
+        metadata,
+        mask_max_vocab=mask_max_vocab,
+    )
+    return LocalVectorSearch(path)
+
+
+@pytest.fixture(params=[64, 0], ids=["precomputed", "on-demand"])
+def store(request, tmp_path) -> ColumnStore:
+    # with mask_max_vocab=0 categorical masks are computed per query
+    return build(str(tmp_path), request.param)
+
+
+def rows(store: ColumnStore, filter: Dict[str, Any]) -> List[int]:
+    mask = store.filter_mask(filter)
+    return list(range(len(store))) if mask is None else np.flatnonzero(mask).tolist()
+
+
+def test_empty_filter_selects_everything(store):
+    assert store.filter_mask({}) is None
+
+
+@pytest.mark.parametrize(
+    "filter, expected",
+    [
+        ({"metadata.status": "RECRUITING"}, [0, 2]),
+        ({"metadata.status": {"$eq": "COMPLETED"}}, [1]),
+        ({"metadata.status": {"$in": ["COMPLETED", "TERMINATED"]}}, [1, 3]),
+        ({"metadata.status": {"$in": ["WITHDRAWN"]}}, []),
+        ({"metadata.status": {"$in": []}}, []),
+        ({"metadata.stdAges": {"$in": ["CHILD"]}}, [1, 2]),
+        ({"metadata.stdAges": {"$in": ["CHILD", "OLDER_ADULT"]}}, [0, 1, 2]),
+        ({"metadata.stdAges": "ADULT"}, [0, 2]),
+        (
+            {
+                "metadata.status": {"$in": ["RECRUITING"]},
+                "metadata.stdAges": {"$in": ["CHILD"]},
+            },
+            [2],
+        ),
+    ],
+)
+def test_value_filters(store, filter, expected):
+    assert rows(store, filter) == expected
+
+
+@pytest.mark.parametrize(
+    "filter, expected",
+    [
+        ({"metadata.startDate": {"$lt": datetime(2020, 1, 1)}}, [0]),
+        ({"metadata.startDate": {"$lte": datetime(2020, 1, 1)}}, [0, 1]),
+        ({"metadata.startDate": {"$gt": datetime(2020, 1, 1)}}, [2]),
+        ({"metadata.startDate": {"$gte": datetime(2018, 3, 1)}}, [0, 1, 2]),
+        (
+            {
+                "metadata.startDate": {
+                    "$gt": datetime(2017, 12, 31),
+                    "$lt": datetime(2021, 1, 1),
+                }
+            },
+            [0, 1],
+        ),
+        ({"metadata.enrollmentCount": {"$gte": 100}}, [0, 3]),
+        ({"metadata.enrollmentCount": {"$lt": 100}}, [1]),
+    ],
+)
+def test_range_filters_skip_missing_values(store, filter, expected):
+    assert rows(store, filter) == expected
+
+
+def test_unsupported_filters_raise(store):
+    with pytest.raises(ValueError):
+        store.filter_mask({"metadata.sponsor": "NIH"})
+    with pytest.raises(ValueError):
+        store.filter_mask({"metadata.status": {"$ne": "RECRUITING"}})
+    with pytest.raises(ValueError):
+        store.filter_mask({"metadata.status": {"$lt": "RECRUITING"}})
+
+
+def test_search_only_returns_filtered_rows(store):
+    # the query is closest to trial 0, which the filter excludes
+    results = store.search([1.0, 0.2, 0.1, 0.0], {"metadata.status": "COMPLETED"}, 3)
+    assert [r["source_id"] for r in results] == ["NCT00000001"]
+
+    results = store.search([1.0, 0.2, 0.1, 0.0], {}, 2)
+    assert [r["source_id"] for r in results] == ["NCT00000000", "NCT00000001"]
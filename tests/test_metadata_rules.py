@@ -0,0 +1,126 @@
+import pytest
+from datetime import datetime
+from langgraph_flow.metadata_rules import extract_metadata
+from langgraph_flow.state_schema import Sex, Status
+
+# every value the rules return narrows the Mongo filter without the LLM
+# seeing the question, so a false match silently drops matching trials
+
+# the default in graph_nodes; importing it would need the API keys set
+METADATA_MIN_CONFIDENCE = 0.8
+DATE_FIELDS = (
+    "startDateBefore",
+    "startDateAfter",
+    "completionDateBefore",
+    "completionDateAfter",
+)
+
+
+@pytest.mark.parametrize(
+    "question, sex",
+    [
+        ("recruiting trials for men with asthma", [Sex.MALE]),
+        ("Men with asthma in recruiting trials", [Sex.MALE]),
+        ("recruiting trials for boys", [Sex.MALE]),
+        ("recruiting trials for women", [Sex.FEMALE]),
+        ("recruiting trials for pregnant women", [Sex.FEMALE]),
+        ("recruiting trials for men and women", []),
+        ("recruiting trials for man-made materials", []),
+        ("recruiting trials for women-led clinics", []),
+        ("recruiting trials on the Isle of Man", []),
+        ("recruiting human-machine interface trials", []),
+        ("recruiting trials in Manchester", []),
+    ],
+)
+def test_sex_rules(question, sex):
+    metadata, confidence = extract_metadata(question)
+    assert metadata.sex == sex
+    assert confidence == 1.0
+
+
+@pytest.mark.parametrize(
+    "question, expected",
+    [
+        ("trials started before 2019", {"startDateBefore": datetime(2019, 1, 1)}),
+        ("trials started after 2019", {"startDateAfter": datetime(2019, 12, 31)}),
+        ("trials started since 2015", {"startDateAfter": datetime(2014, 12, 31)}),
+        ("trials started until 2015", {"startDateBefore": datetime(2016, 1, 1)}),
+        (
+            "trials started in 2019",
+            {
+                "startDateAfter": datetime(2018, 12, 31),
+                "startDateBefore": datetime(2020, 1, 1),
+            },
+        ),
+        (
+            "trials with a start date in March 2020",
+            {
+                "startDateAfter": datetime(2020, 2, 29),
+                "startDateBefore": datetime(2020, 4, 1),
+            },
+        ),
+        (
+            "trials completed before 2021-06-15",
+            {"completionDateBefore": datetime(2021, 6, 15)},
+        ),
+        (
+            "trials that ended by 2020-06",
+            {"completionDateBefore": datetime(2020, 7, 1)},
+        ),
+    ],
+)
+def test_date_phrases(question, expected):
+    metadata, confidence = extract_metadata(question)
+    dates = {
+        field: getattr(metadata, field)
+        for field in DATE_FIELDS
+        if getattr(metadata, field) is not None
+    }
+    assert dates == expected
+    assert confidence == 1.0
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "recruiting trials with enrollment up to 2000 patients",
+        "recruiting trials related to 2019 novel coronavirus",
+        "recruiting trials from 2000 participants",
+        "recruiting trials in 2019",
+    ],
+)
+def test_weak_ops_before_a_bare_year_go_to_the_llm(question):
+    metadata, confidence = extract_metadata(question)
+    assert all(getattr(metadata, field) is None for field in DATE_FIELDS)
+    assert metadata.status == [Status.RECRUITING]
+    assert confidence < METADATA_MIN_CONFIDENCE
+
+
+def test_status_word_before_a_date_keeps_the_status():
+    metadata, confidence = extract_metadata("completed trials before 2019")
+    assert metadata.status == [Status.COMPLETED]
+    assert metadata.completionDateBefore == datetime(2019, 1, 1)
+    assert confidence == 1.0
+
+
+def test_date_verb_is_not_read_as_status():
+    metadata, _ = extract_metadata("trials completed before 2019")
+    assert metadata.status == []
+    assert metadata.completionDateBefore == datetime(2019, 1, 1)
+
+
+def test_conflicting_dates_lower_confidence():
+    _, confidence = extract_metadata("trials started before 2019 and before 2018")
+    assert confidence < METADATA_MIN_CONFIDENCE
+
+
+def test_questions_without_filters_go_to_the_llm():
+    metadata, confidence = extract_metadata("what are the side effects of aspirin")
+    assert not any(metadata.model_dump().values())
+    assert confidence < METADATA_MIN_CONFIDENCE
+
+
+def test_follow_ups_go_to_the_llm_only_with_history():
+    question = "what about recruiting ones"
+    assert extract_metadata(question)[1] == 1.0
+    assert extract_metadata(question, has_history=True)[1] < METADATA_MIN_CONFIDENCE
@@ -0,0 +1,179 @@
+import asyncio
+import os
+import time
+import pytest
+from typing import Any, Dict
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import END, START, StateGraph
+from langgraph_flow.session_store import COMPRESS_MIN_BYTES, SessionCheckpointer
+from langgraph_flow.state_schema import State, turn_state
+
+# a two-node graph with the app's state schema stands in for the real one:
+# it writes retrieved context, a question vector and a question/answer pair
+# on every turn, which is everything the store trims
+
+
+def retrieve(state: State) -> Dict[str, Any]:
+    return {"context": [f"chunk for {state['question']}"], "query_embedding": [0.5] * 8}
+
+
+def answer(state: State) -> Dict[str, Any]:
+    reply = f"answer to {state['question']}"
+    return {
+        "response": reply,
+        "memory": [HumanMessage(content=state["question"]), AIMessage(content=reply)],
+    }
+
+
+def build_graph(memory: SessionCheckpointer):
+    builder = StateGraph(state_schema=State)
+    builder.add_node("retrieve", retrieve)
+    builder.add_node("answer", answer)
+    builder.add_edge(START, "retrieve")
+    builder.add_edge("retrieve", "answer")
+    builder.add_edge("answer", END)
+    return builder.compile(checkpointer=memory)
+
+
+def config(session: str) -> Dict[str, Any]:
+    return {"configurable": {"thread_id": session}}
+
+
+def stored(store: SessionCheckpointer, session: str) -> Dict[str, Any]:
+    return store.get_tuple(config(session)).checkpoint["channel_values"]
+
+
+@pytest.fixture
+def path(tmp_path) -> str:
+    return os.path.join(tmp_path, "sessions.sqlite")
+
+
+def test_history_round_trips_across_turns_and_reopens(path):
+    graph = build_graph(SessionCheckpointer(path))
+    for turn in range(2):
+        state = graph.invoke(turn_state(f"question {turn}"), config("a"))
+
+    assert [m.content for m in state["memory"]] == [
+        "question 0",
+        "answer to question 0",
+        "question 1",
+        "answer to question 1",
+    ]
+    assert state["response"] == "answer to question 1"
+
+    # a new process on the same file picks the conversation up
+    reopened = build_graph(SessionCheckpointer(path))
+    state = reopened.invoke(turn_state("question 2"), config("a"))
+    assert len(state["memory"]) == 6
+    assert isinstance(state["memory"][0], HumanMessage)
+    assert isinstance(state["memory"][1], AIMessage)
+
+
+def test_sessions_are_kept_apart(path):
+    graph = build_graph(SessionCheckpointer(path))
+    graph.invoke(turn_state("first"), config("a"))
+    state = graph.invoke(turn_state("second"), config("b"))
+    assert [m.content for m in state["memory"]] == ["second", "answer to second"]
+
+
+def test_stored_state_is_trimmed(path):
+    store = SessionCheckpointer(path, max_messages=4)
+    graph = build_graph(store)
+    for turn in range(5):
+        graph.invoke(turn_state(f"question {turn}"), config("a"))
+
+    values = stored(store, "a")
+    assert [m.content for m in values["memory"]] == [
+        "question 3",
+        "answer to question 3",
+        "question 4",
+        "answer to question 4",
+    ]
+    # rebuilt every turn, so never worth keeping
+    assert values["context"] == []
+    assert values["query_embedding"] is None
+    assert store.stats()["sessions"] == 1
+
+
+def test_only_changed_channels_are_rewritten(path):
+    store = SessionCheckpointer(path)
+    graph = build_graph(store)
+    graph.invoke(turn_state("question"), config("a"))
+    writes = store.stats()["channel_writes"]
+    graph.invoke(turn_state("question"), config("a"))
+    # each turn rewrites the same channels; none accumulate
+    assert store.stats()["channel_writes"] == 2 * writes
+    rows = store.db.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+    assert rows == 1
+
+
+def test_large_values_are_compressed():
+    store = SessionCheckpointer(None)
+    small = "x" * 10
+    large = "y" * (COMPRESS_MIN_BYTES * 4)
+
+    kind, data = store.pack(small)
+    assert not kind.endswith("+zlib")
+    assert store.unpack(kind, data) == small
+
+    kind, data = store.pack(large)
+    assert kind.endswith("+zlib")
+    assert len(data) < len(large)
+    assert store.unpack(kind, data) == large
+
+
+def test_idle_sessions_are_evicted(path):
+    store = SessionCheckpointer(path, idle_seconds=60)
+    graph = build_graph(store)
+    graph.invoke(turn_state("question"), config("old"))
+    graph.invoke(turn_state("question"), config("new"))
+    store.db.execute(
+        "UPDATE checkpoints SET updated = ? WHERE thread_id = 'old'",
+        (time.time() - 120,),
+    )
+
+    assert store.evict() == 1
+    assert store.get_tuple(config("old")) is None
+    assert store.get_tuple(config("new")) is not None
+    assert store.db.execute(
+        "SELECT COUNT(*) FROM channels WHERE thread_id = 'old'"
+    ).fetchone() == (0,)
+
+
+def test_least_recently_used_sessions_go_past_the_cap(path):
+    store = SessionCheckpointer(path, max_sessions=2)
+    graph = build_graph(store)
+    for session in ("a", "b", "c"):
+        graph.invoke(turn_state("question"), config(session))
+        time.sleep(0.01)
+    graph.invoke(turn_state("again"), config("a"))
+
+    assert store.evict() == 1
+    assert store.get_tuple(config("b")) is None
+    assert store.get_tuple(config("a")) is not None
+    assert store.get_tuple(config("c")) is not None
+
+
+def test_delete_thread(path):
+    store = SessionCheckpointer(path)
+    graph = build_graph(store)
+    graph.invoke(turn_state("question"), config("a"))
+    store.delete_thread("a")
+    assert store.get_tuple(config("a")) is None
+    assert list(store.list(config("a"))) == []
+
+
+def test_async_graph_uses_the_same_store(path):
+    store = SessionCheckpointer(path, max_messages=2)
+    graph = build_graph(store)
+
+    async def run():
+        for turn in range(3):
+            await graph.ainvoke(turn_state(f"question {turn}"), config("a"))
+        return await graph.aget_state(config("a"))
+
+    snapshot = asyncio.run(run())
+    assert [m.content for m in snapshot.values["memory"]] == [
+        "question 2",
+        "answer to question 2",
+    ]
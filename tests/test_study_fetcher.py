@@ -0,0 +1,226 @@
+import json
+import threading
+import time
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+from preprocessing.study_fetcher import RateLimiter, StudyFetcher
+
+# a local stand-in for the clinicaltrials.gov v2 API: each test queues the
+# responses the server should give, in order, and reads back every request
+# it received with the time it arrived
+
+
+class StubServer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.responses: List[Tuple[int, Dict[str, str], Any]] = []
+        self.default: Optional[Tuple[int, Dict[str, str], Any]] = None
+        self.requests: List[Dict[str, Any]] = []
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                with stub.lock:
+                    stub.requests.append(
+                        {
+                            "path": url.path,
+                            "params": {k: v[0] for k, v in parse_qs(url.query).items()},
+                            "at": time.monotonic(),
+                        }
+                    )
+                    if stub.responses:
+                        status, headers, body = stub.responses.pop(0)
+                    else:
+                        status, headers, body = stub.default or (404, {}, {})
+
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}/api/v2/studies"
+
+    def queue(
+        self, status: int, body: Any = None, headers: Optional[Dict[str, str]] = None
+    ) -> None:
+        self.responses.append((status, headers or {}, body or {}))
+
+    def gaps(self) -> List[float]:
+        times = sorted(r["at"] for r in self.requests)
+        return [b - a for a, b in zip(times, times[1:])]
+
+
+def study(nct_id: str) -> Dict[str, Any]:
+    return {"protocolSection": {"identificationModule": {"nctId": nct_id}}}
+
+
+@pytest.fixture
+def server() -> Iterator[StubServer]:
+    stub = StubServer()
+    stub.thread.start()
+    yield stub
+    stub.httpd.shutdown()
+    stub.httpd.server_close()
+
+
+def test_pages_follow_next_page_token(server):
+    server.queue(200, {"studies": [study("NCT00000001")], "nextPageToken": "p2"})
+    server.queue(200, {"studies": [study("NCT00000002")], "nextPageToken": "p3"})
+    server.queue(200, {"studies": [study("NCT00000003")]})
+
+    with StudyFetcher(server.url, requests_per_second=0) as fetcher:
+        ids = list(fetcher.iter_nct_ids({"query.cond": "asthma"}, page_size=1))
+
+    assert ids == ["NCT00000001", "NCT00000002", "NCT00000003"]
+    assert len(server.requests) == 3
+    assert [r["params"].get("pageToken") for r in server.requests] == [
+        None,
+        "p2",
+        "p3",
+    ]
+    for request in server.requests:
+        assert request["params"]["query.cond"] == "asthma"
+        assert request["params"]["pageSize"] == "1"
+        assert request["params"]["fields"] == "NCTId"
+
+
+def test_id_limit_stops_paging(server):
+    server.queue(200, {"studies": [study("NCT00000001")], "nextPageToken": "p2"})
+    server.queue(200, {"studies": [study("NCT00000002")], "nextPageToken": "p3"})
+
+    with StudyFetcher(server.url, requests_per_second=0) as fetcher:
+        ids = list(fetcher.iter_nct_ids(page_size=1, limit=1))
+
+    assert ids == ["NCT00000001"]
+    assert len(server.requests) == 1
+
+
+def test_429_waits_for_retry_after(server):
+    server.queue(429, headers={"Retry-After": "1"})
+    server.queue(200, study("NCT00000001"))
+
+    with StudyFetcher(server.url, requests_per_second=0, backoff_base=0.01) as fetcher:
+        result = fetcher.fetch_study("NCT00000001")
+
+    assert result == study("NCT00000001")
+    assert [r["path"] for r in server.requests] == [
+        "/api/v2/studies/NCT00000001",
+        "/api/v2/studies/NCT00000001",
+    ]
+    # Retry-After wins over the much shorter exponential backoff
+    assert server.gaps()[0] >= 0.95
+
+
+def test_429_pauses_every_worker(server):
+    server.queue(429, headers={"Retry-After": "1"})
+    server.default = (200, {}, {"ok": True})
+    ids = [f"NCT{i:08d}" for i in range(4)]
+
+    with StudyFetcher(
+        server.url, max_workers=2, requests_per_second=10, backoff_base=0.01
+    ) as fetcher:
+        results = dict(fetcher.fetch_studies(ids))
+
+    assert sorted(results) == ids
+    assert len(server.requests) == len(ids) + 1
+    # only the two requests already in flight beat the 429; every later one,
+    # from either worker, waits out the Retry-After
+    first = min(r["at"] for r in server.requests)
+    early = [r for r in server.requests if r["at"] - first < 0.5]
+    assert len(early) == 2
+
+
+def test_5xx_retries_with_growing_backoff(server):
+    server.queue(503)
+    server.queue(502)
+    server.queue(500)
+    server.queue(200, study("NCT00000001"))
+
+    with StudyFetcher(server.url, requests_per_second=0, backoff_base=0.1) as fetcher:
+        result = fetcher.fetch_study("NCT00000001")
+
+    assert result == study("NCT00000001")
+    assert len(server.requests) == 4
+    # jittered backoff is base * 2**attempt scaled by [0.5, 1]
+    gaps = server.gaps()
+    for attempt, gap in enumerate(gaps):
+        assert gap >= 0.1 * 2**attempt * 0.5 - 0.01
+    assert gaps[-1] > gaps[0]
+
+
+def test_5xx_gives_up_after_max_retries(server):
+    server.default = (500, {}, {})
+
+    with StudyFetcher(
+        server.url, requests_per_second=0, max_retries=2, backoff_base=0.01
+    ) as fetcher:
+        assert fetcher.fetch_study("NCT00000001") is None
+
+    assert len(server.requests) == 3
+
+
+def test_other_errors_are_not_retried(server):
+    server.queue(404)
+
+    with StudyFetcher(server.url, requests_per_second=0) as fetcher:
+        assert fetcher.fetch_study("NCT00000001") is None
+
+    assert len(server.requests) == 1
+
+
+def test_concurrent_fetches_respect_rate_limit(server):
+    server.default = (200, {}, {"ok": True})
+    ids = [f"NCT{i:08d}" for i in range(10)]
+
+    start = time.monotonic()
+    with StudyFetcher(server.url, max_workers=4, requests_per_second=20) as fetcher:
+        results = dict(fetcher.fetch_studies(ids))
+    elapsed = time.monotonic() - start
+
+    assert sorted(results) == ids
+    assert all(result == {"ok": True} for result in results.values())
+    assert len(server.requests) == len(ids)
+    assert sorted(r["path"].rsplit("/", 1)[-1] for r in server.requests) == ids
+    # four workers, but requests still go out one slot (50ms) apart; the
+    # server sees them no earlier than their slots, however late some arrive
+    assert elapsed >= 9 * 0.05
+    arrivals = sorted(r["at"] for r in server.requests)
+    assert all(t - start >= i * 0.05 for i, t in enumerate(arrivals))
+
+
+def test_rate_limiter_spaces_calls():
+    limiter = RateLimiter(requests_per_second=50)
+    start = time.monotonic()
+    times = []
+    for _ in range(5):
+        limiter.wait()
+        times.append(time.monotonic())
+
+    # slots are fixed from the first call, so a late wake-up shortens the next
+    # gap but no call may come before its slot
+    assert all(t - start >= i * 0.02 for i, t in enumerate(times))
+
+
+def test_rate_limiter_disabled_does_not_wait():
+    limiter = RateLimiter(requests_per_second=0)
+    start = time.monotonic()
+    for _ in range(100):
+        limiter.wait()
+    assert time.monotonic() - start < 0.05
@@ -0,0 +1,140 @@
+import json
+import pytest
+from typing import NamedTuple
+from schemas import ChunkType, TrialMetaData
+from sync_manifest import Manifest, assemble_delta, diff_trial
+
+# the preprocessing scripts import each other by bare name, so these tests
+# import sync_manifest the same way; incremental_sync itself loads the
+# embedding model at import and is left to the end-to-end runs
+
+
+class Section(NamedTuple):
+    # the fields of chunking_utils.ChunkText the sync logic reads
+    source_id: str
+    section: ChunkType
+    text: str
+    embedding_text: str
+
+
+def sections(nct_id: str, **texts: str):
+    return [
+        Section(nct_id, ChunkType(name), text, f"{name}: {text}")
+        for name, text in texts.items()
+    ]
+
+
+def keys(chunks):
+    return [(c.source_id, c.section.value) for c in chunks]
+
+
+@pytest.fixture
+def manifest(tmp_path) -> Manifest:
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    manifest.record(
+        "NCT1",
+        "2024-01-01",
+        TrialMetaData(nctId="NCT1", status="RECRUITING"),
+        sections("NCT1", overview="old overview", design="same design"),
+    )
+    return manifest
+
+
+def test_is_stale(manifest):
+    assert not manifest.is_stale("NCT1", "2024-01-01")
+    assert manifest.is_stale("NCT1", "2024-02-01")
+    # a bootstrapped entry has no update date and is always refetched
+    assert manifest.is_stale("NCT1", None)
+    assert manifest.is_stale("NCT2", "2024-01-01")
+
+
+def test_save_and_load_round_trip(manifest):
+    manifest.save()
+    reloaded = Manifest.load(manifest.path)
+    assert reloaded.trials == manifest.trials
+
+
+def test_from_chunks_file_hashes_sections(tmp_path, manifest):
+    metadata = TrialMetaData(nctId="NCT1", status="RECRUITING")
+    data_path = tmp_path / "trials.jsonl"
+    with open(data_path, "w") as outfile:
+        for c in sections("NCT1", overview="old overview", design="same design"):
+            document = {
+                "source_id": c.source_id,
+                "section": c.section.value,
+                "text": c.text,
+                "metadata": metadata.model_dump(),
+            }
+            outfile.write(json.dumps(document) + "\n")
+
+    bootstrapped = Manifest.from_chunks_file(str(data_path))
+    entry = bootstrapped.trials["NCT1"]
+    assert entry["lastUpdatePostDate"] is None
+    assert entry["sections"] == manifest.trials["NCT1"]["sections"]
+    assert not bootstrapped.metadata_changed("NCT1", metadata)
+
+
+def test_only_changed_sections_are_embedded(manifest):
+    metadata = TrialMetaData(nctId="NCT1", status="RECRUITING")
+    chunk_texts = sections(
+        "NCT1", overview="new overview", design="same design", eligibility="adults"
+    )
+
+    to_embed, to_push = diff_trial(manifest, metadata, chunk_texts)
+    assert keys(to_embed) == [("NCT1", "overview"), ("NCT1", "eligibility")]
+    assert keys(to_push) == keys(to_embed)
+
+
+def test_metadata_change_pushes_without_embedding(manifest):
+    metadata = TrialMetaData(nctId="NCT1", status="COMPLETED")
+    chunk_texts = sections("NCT1", overview="old overview", design="same design")
+
+    to_embed, to_push = diff_trial(manifest, metadata, chunk_texts)
+    assert to_embed == []
+    assert keys(to_push) == [("NCT1", "overview"), ("NCT1", "design")]
+
+
+def test_unchanged_trial_is_not_pushed(manifest):
+    metadata = TrialMetaData(nctId="NCT1", status="RECRUITING")
+    chunk_texts = sections("NCT1", overview="old overview", design="same design")
+    assert diff_trial(manifest, metadata, chunk_texts) == ([], [])
+
+
+def test_new_trial_is_embedded_in_full(manifest):
+    metadata = TrialMetaData(nctId="NCT2")
+    chunk_texts = sections("NCT2", overview="overview", design="design")
+
+    to_embed, to_push = diff_trial(manifest, metadata, chunk_texts)
+    assert keys(to_embed) == keys(chunk_texts)
+    assert keys(to_push) == keys(chunk_texts)
+
+
+def test_missing_embedding_skips_the_section_and_keeps_the_old_entry(manifest):
+    old_entry = manifest.trials["NCT1"]
+    changed = TrialMetaData(nctId="NCT1", status="COMPLETED")
+    changed_texts = sections("NCT1", overview="new overview", design="same design")
+    added = TrialMetaData(nctId="NCT2")
+    added_texts = sections("NCT2", overview="overview")
+
+    to_push = [(changed, c) for c in changed_texts] + [(added, c) for c in added_texts]
+    embeddings = {("NCT1", "overview"): [0.1, 0.2], ("NCT2", "overview"): [0.3, 0.4]}
+    delta, incomplete = assemble_delta(to_push, embeddings)
+
+    assert keys(delta) == [("NCT1", "overview"), ("NCT2", "overview")]
+    assert delta[0].metadata == changed
+    assert delta[0].embeddings == [0.1, 0.2]
+    assert incomplete == {"NCT1"}
+
+    manifest.record_synced(
+        [("2024-02-01", changed, changed_texts), ("2024-02-01", added, added_texts)],
+        incomplete,
+    )
+    # NCT1 still reads as changed, so the next sync retries every section
+    assert manifest.trials["NCT1"] == old_entry
+    assert manifest.is_stale("NCT1", "2024-02-01")
+    to_embed, to_push = diff_trial(manifest, changed, changed_texts)
+    assert keys(to_embed) == [("NCT1", "overview")]
+    assert keys(to_push) == [("NCT1", "overview"), ("NCT1", "design")]
+
+    assert not manifest.is_stale("NCT2", "2024-02-01")
+    assert diff_trial(manifest, added, added_texts) == ([], [])